@@ -2,13 +2,43 @@
 
 import json
 import csv
+import hashlib
 import heapq
 import math
+import os
+import re
+from multiprocessing import Pool
+import unicodedata
 import folium
-import functools
+import numpy as np
+from scipy.spatial import cKDTree
 
 MAX_EDGES = 10 # max number of connected municipalities
 MAX_DISTANCE = 100 # miles (all distances are in miles unless otherwise specified)
+MAX_SUPERCHARGER_DISTANCE = 50 # miles from a supercharger to the centroid of its municipality
+CANDIDATE_RADIUS = MAX_DISTANCE + 1 # miles, no edge is longer than MAX_DISTANCE (plus a mile for rounding)
+TILE_DEGREES = 4 # degrees of latitude and longitude per tile of the parallel edge search
+PARALLEL_MIN_MUNICIPALITIES = 1000 # fewer are searched in this process (starting the pool costs more)
+EARTH_RADIUS = 6371 / 1.609 # miles
+SUPERCHARGER_CANDIDATES = 16 # nearest municipalities considered for each supercharger
+SUPERCHARGER_COUNTRY = 'Mexico'
+
+RAW_MUNICIPALITIES_PATH = 'municipalities.json'
+CLEAN_MUNICIPALITIES_PATH = 'cleanMunicipalities.json'
+SUPERCHARGERS_PATH = 'superchargers.csv'
+SUPERCHARGERS_ENCODING = 'cp1252'
+CLEAN_SUPERCHARGERS_PATH = 'cleanSuperchargers.csv'
+MUNICIPALITIES_WITH_SUPERCHARGERS_PATH = 'cleanMunicipalitiesWithSuperchargers.json'
+GRAPH_PATH = '../graphs/allMunicipalitiesGraph.json'
+MAP_PATH = 'mexicoMap.html'
+
+# Checksums of each stage's inputs and output from the last run, so a rerun can skip stages that have not changed.
+# Bump PIPELINE_VERSION whenever a stage starts producing different output from the same inputs.
+PIPELINE_CACHE_PATH = 'pipelineCache.json'
+PIPELINE_VERSION = 1
+
+# Whitespace and then the comma or bracket that follows an item of a JSON array
+JSON_ARRAY_SEPARATOR = re.compile(r'[ \t\r\n]*[,\]]')
 
 
 class MunicipalityEdge:
@@ -59,7 +89,8 @@ class Municipality:
 
 def municipalityDictSerializer(obj):
 	if isinstance(obj, Municipality):
-		dictionary = obj.__dict__
+		# A copy, so the municipality keeps its neighbors for the stages after this one
+		dictionary = dict(obj.__dict__)
 		del dictionary['_neighbors']
 		return dictionary
 	if isinstance(obj, MunicipalityEdge):
@@ -67,47 +98,168 @@ def municipalityDictSerializer(obj):
 	raise TypeError("Type not serializable")
 
 
-def cleanMunicipalities():
-	print("Opening municipalities.json")
-	municipalities = None
-
-	with open("municipalities.json") as file:
-		# Remove the geo_shape keys
-		municipalities = json.load(file)
-		for municipality in municipalities:
+def iterateJSONArray(path, chunkSize=1 << 20):
+	# Yields the items of a file holding one JSON array, decoding one item at a time from a buffer of the file,
+	# so a file much larger than memory (like the raw municipalities with their polygons) can be read
+	decoder = json.JSONDecoder()
+	with open(path, encoding='utf-8') as file:
+		buffer, position = '', 0
+
+		def nextCharacter():
+			# Skips whitespace (reading more of the file as needed) and returns the next character
+			nonlocal buffer, position
+			while True:
+				while position < len(buffer) and buffer[position] in ' \t\r\n':
+					position += 1
+				if position < len(buffer):
+					return buffer[position]
+				buffer, position = file.read(chunkSize), 0
+				if not buffer:
+					raise ValueError(path + " ended before its JSON array did")
+
+		if nextCharacter() != '[':
+			raise ValueError(path + " does not hold a JSON array")
+		position += 1
+		if nextCharacter() == ']':
+			return
+		while True:
+			nextCharacter()
+			# Decode the next item, reading more of the file while the item is cut off by the end of the buffer
+			# (it is only complete once the separator after it has been read, since a cut off number still decodes)
+			while True:
+				try:
+					item, end = decoder.raw_decode(buffer, position)
+					if JSON_ARRAY_SEPARATOR.match(buffer, end):
+						break
+				except json.JSONDecodeError:
+					pass
+				chunk = file.read(chunkSize)
+				if not chunk:
+					# The whole rest of the file is in the buffer, so this either decodes or is not valid JSON
+					item, end = decoder.raw_decode(buffer, position)
+					break
+				buffer, position = buffer[position:] + chunk, 0
+			position = end
+			yield item
+
+			separator = nextCharacter()
+			position += 1
+			if separator == ']':
+				return
+			if separator != ',':
+				raise ValueError(path + " has " + repr(separator) + " between array items")
+
+
+def streamCleanMunicipalities(rawPath=RAW_MUNICIPALITIES_PATH, cleanPath=CLEAN_MUNICIPALITIES_PATH):
+	# Yields each raw municipality without its geo_shape (the polygons are most of the raw file) while writing them
+	# to cleanPath, so the next stage can use them without the cleaned file being read back in.
+	# The file is only put in place once every municipality has been read.
+	temporaryPath = cleanPath + '.tmp'
+	with open(temporaryPath, 'w') as file:
+		file.write('[')
+		for i, municipality in enumerate(iterateJSONArray(rawPath)):
 			del municipality['geo_shape']
+			# Same layout json.dump gives the whole list
+			file.write((', ' if i else '') + json.dumps(municipality))
+			yield municipality
+		file.write(']')
+	os.replace(temporaryPath, cleanPath)
+	print("Municipalities read in, cleaned, and saved.")
 
-	# Save the municipalities as a json file
-	with open('cleanMunicipalities.json', 'w') as file:
-		json.dump(municipalities, file)
 
-	print("Municipalities read in, cleaned, and saved.")
+def cleanMunicipalities():
+	print("Opening municipalities.json")
+	for _ in streamCleanMunicipalities():
+		pass
 
 
 def loadCleanMunicipalities():
-	with open('cleanMunicipalities.json') as file:
+	with open(CLEAN_MUNICIPALITIES_PATH) as file:
 		return json.load(file)
 
 
+def loadSuperchargers():
+	# Read in the worldwide superchargers, parsing the latitude and longitude out of each GPS column
+	superchargers = []
+	with open(SUPERCHARGERS_PATH, encoding=SUPERCHARGERS_ENCODING, newline='') as file:
+		for row in csv.DictReader(file):
+			try:
+				row['lat'], row['lon'] = (float(value) for value in row['GPS'].split(','))
+			except ValueError:
+				print("Bad supercharger GPS: ", row['Supercharger'], row['GPS'])
+				continue
+			superchargers.append(row)
+	return superchargers
+
+
 def loadCleanSuperchargers():
 	# Read in the CSV so that it is a dictionary
-	with open('cleanSuperchargers.csv') as file:
+	with open(CLEAN_SUPERCHARGERS_PATH) as file:
 		reader = csv.DictReader(file)
 		return [row for row in reader]
 
 
-def saveMunicipalityWithSuperchargers():
-	# For each supercharger, determine if its city is in the municipalities.json file
-	municipalities = loadCleanMunicipalities()
-	superchargers = loadCleanSuperchargers()
-
-	print("Total municipalities:", len(municipalities))
+def foldName(name):
+	# Lowercase and without accents, so "Cuencame" and "Cuencam\u00e9" compare equal
+	return ''.join(c for c in unicodedata.normalize('NFKD', name) if not unicodedata.combining(c)).casefold().strip()
+
+
+def getCheckedMunicipalityNames():
+	# The municipality each supercharger in cleanSuperchargers.csv was checked by hand to be in, by supercharger name
+	checkedNames = {}
+	for supercharger in loadCleanSuperchargers():
+		name = supercharger['Supercharger'].encode('utf-8').decode('unicode-escape')
+		checkedNames[foldName(name)] = supercharger['Municipality'].encode('utf-8').decode('unicode-escape')
+	return checkedNames
+
+
+def matchSuperchargersToMunicipalities(superchargers, municipalities, checkedNames=None):
+	# Matches every supercharger to a municipality at once: a k-d tree over the municipality centroids gives the
+	# SUPERCHARGER_CANDIDATES nearest ones within MAX_SUPERCHARGER_DISTANCE of each supercharger, O(M log N) in all.
+	# A large municipality's centroid can be farther from its towns than a neighbor's, so the nearest candidate named
+	# like the supercharger, its city or its checked municipality is taken before the nearest one.
+	# Returns the municipality (None if there is none close enough) of each supercharger.
+	if not superchargers or not municipalities:
+		return [None] * len(superchargers)
+	checkedNames = checkedNames or {}
+	tree = cKDTree(getUnitSphereCoordinates(
+		np.array([muni.lat for muni in municipalities], dtype=float),
+		np.array([muni.lon for muni in municipalities], dtype=float)))
+	# Chord (straight line) length of MAX_SUPERCHARGER_DISTANCE along the surface of the unit sphere
+	maxChord = 2 * math.sin(MAX_SUPERCHARGER_DISTANCE * 1.609 / 6371 / 2)
+	_, nearest = tree.query(getUnitSphereCoordinates(
+		np.array([supercharger['lat'] for supercharger in superchargers], dtype=float),
+		np.array([supercharger['lon'] for supercharger in superchargers], dtype=float)),
+		k=min(SUPERCHARGER_CANDIDATES, len(municipalities)), distance_upper_bound=maxChord)
+	nearest = nearest.reshape(len(superchargers), -1)
+
+	matches = []
+	for supercharger, candidates in zip(superchargers, nearest):
+		# Missing candidates (fewer than k within the distance) are given the index len(municipalities)
+		candidates = [municipalities[j] for j in candidates if j < len(municipalities)]
+		names = {foldName(supercharger['Supercharger'].rsplit(',', 1)[0]), foldName(supercharger['City'])}
+		if foldName(supercharger['Supercharger']) in checkedNames:
+			names.add(foldName(checkedNames[foldName(supercharger['Supercharger'])]))
+		# Names like "Silao" also match longer municipality names like "Silao de la Victoria"
+		named = [muni for muni in candidates if any(foldName(muni.name) == name or foldName(muni.name).startswith(name + ' ') for name in names)]
+		matches.append(named[0] if named else candidates[0] if candidates else None)
+	return matches
+
+
+def saveMunicipalityWithSuperchargers(municipalities=None):
+	# Mark the municipalities with a supercharger, matching each supercharger in Mexico to one by its GPS coordinates.
+	# The municipalities can be any iterable of cleaned records (the cleaned file is read if none are given).
+	if municipalities is None:
+		municipalities = iterateJSONArray(CLEAN_MUNICIPALITIES_PATH)
 
 	# Create a dictionary of municipality names to Municipality objects
+	# (only used to keep municipalities with the same name next to each other, the order the graph is saved in)
 	nameToMunicipality: dict[str, list[Municipality]] = {}
 
 	# Iterate over the municipalities and add them to the dictionary
+	totalMunicipalities = 0
 	for municipality in municipalities:
+		totalMunicipalities += 1
 		dictLookup = municipality['sta_name'][0]+"_"+municipality['mun_name'][0]
 		if dictLookup in nameToMunicipality:
 			# Append it to the list of municipalities with the same name
@@ -124,25 +276,7 @@ def saveMunicipalityWithSuperchargers():
 			municipality['geo_point_2d']['lat'],
 			municipality['geo_point_2d']['lon'])]
 
-	# Iterate over the superchargers and see how many of their cities are in the municipalities
-	for supercharger in superchargers:
-		escapedMunicipality = supercharger['State']+"_"+supercharger['Municipality']
-		decodedMunicipality = escapedMunicipality.encode('utf-8').decode('unicode-escape')
-		if decodedMunicipality not in nameToMunicipality:
-			print("Bad supercharger location: ", decodedMunicipality)
-			continue
-		muniArr = nameToMunicipality[decodedMunicipality]
-		for municipality in muniArr:
-			municipality.hasSupercharger = True
-
-	totalWithSuperchargers = 0
-	for municipality, objArr in nameToMunicipality.items():
-		for obj in objArr:
-			if obj.hasSupercharger: totalWithSuperchargers += 1
-
-	# Should be 32 total
-	print("Total with superchargers: ", totalWithSuperchargers)
-	
+	print("Total municipalities:", totalMunicipalities)
 	print("Total municipality names (does not include duplicates):", len(nameToMunicipality.items()))
 	codeToMunicipality = {}
 	for muniArr in nameToMunicipality.values():
@@ -150,20 +284,41 @@ def saveMunicipalityWithSuperchargers():
 			codeToMunicipality[municipality.code] = municipality
 	print("Total codes:", len(codeToMunicipality.items()))
 
+	# Match the superchargers to the municipalities by location
+	allSuperchargers = loadSuperchargers()
+	superchargers = [supercharger for supercharger in allSuperchargers if supercharger['Country'] == SUPERCHARGER_COUNTRY]
+	matches = matchSuperchargersToMunicipalities(superchargers, list(codeToMunicipality.values()), getCheckedMunicipalityNames())
+	for supercharger, municipality in zip(superchargers, matches):
+		if municipality is None:
+			print("Bad supercharger location: ", supercharger['Supercharger'], "(" + supercharger['GPS'] + ")")
+			continue
+		municipality.hasSupercharger = True
+	totalMatched = sum(1 for municipality in matches if municipality is not None)
+	print("Superchargers matched: ", totalMatched, "of", len(superchargers), "in", SUPERCHARGER_COUNTRY,
+		"(" + format(totalMatched / max(1, len(superchargers)), '.1%') + "),", len(allSuperchargers) - len(superchargers), "elsewhere skipped")
+
+	totalWithSuperchargers = 0
+	for municipality in codeToMunicipality.values():
+		if municipality.hasSupercharger: totalWithSuperchargers += 1
+
+	# Should be 32 total
+	print("Total with superchargers: ", totalWithSuperchargers)
+
 	# Write the municipalities (with codes) to a JSON file
-	with open('cleanMunicipalitiesWithSuperchargers.json', 'w') as file:
-		json.dump(codeToMunicipality, file, default=municipalityDictSerializer)
+	with open(MUNICIPALITIES_WITH_SUPERCHARGERS_PATH, 'w') as file:
+		file.write(json.dumps(codeToMunicipality, default=municipalityDictSerializer))
+
+	return codeToMunicipality
 
 
 def getMunicipalityCodeToSuperchargerStatus():
 	# Read each code:Municipality object from the JSON file
-	with open('cleanMunicipalitiesWithSuperchargers.json') as file:
+	with open(MUNICIPALITIES_WITH_SUPERCHARGERS_PATH) as file:
 		obj = json.load(file)
 		# Map each value to a Municipality object
 		return {code: Municipality(**value) for code, value in obj.items()}
 
 
-@functools.lru_cache(maxsize=None)
 def getDistanceBetweenMunicipalities(muni1, muni2):
 	# Use the Haversine formula to get the distance between two points
 	lat1, lon1 = muni1.lat, muni1.lon
@@ -183,25 +338,116 @@ def getDistanceBetweenMunicipalities(muni1, muni2):
 	return distance / 1.609
 
 
-def addEdgesToMunicipalities():
-	# Read in the municipalities with the supercharger status
-	codeToMunicipality = getMunicipalityCodeToSuperchargerStatus()
+def getDistancesFromPoint(lat, lon, lats, lons):
+	# Same formula as getDistanceBetweenMunicipalities, from one point to arrays of points at once.
+	# NumPy's sin/cos can differ from the math module's in the last bit, so these are only used to rank.
+	lat1, lon1 = lat, lon
+	lat2, lon2 = lats, lons
+
+	R = 6371 # meters
+	dLat = np.radians(lat2 - lat1)
+	dLon = np.radians(lon2 - lon1)
+	lat1 = np.radians(lat1)
+	lat2 = np.radians(lat2)
+
+	a = np.sin(dLat/2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dLon/2) ** 2
+	c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1-a))
+	distance = R * c
+
+	# Convert to miles
+	return distance / 1.609
+
+
+def getUnitSphereCoordinates(lats, lons):
+	# Straight line (chord) distances between these points are ordered the same as their great circle distances
+	lats, lons = np.radians(lats), np.radians(lons)
+	return np.column_stack((np.cos(lats) * np.cos(lons), np.cos(lats) * np.sin(lons), np.sin(lats)))
+
+
+def getChordLength(miles):
+	# Straight line distance through the unit sphere between two points this far apart along its surface
+	return 2 * math.sin(miles / EARTH_RADIUS / 2)
+
+
+def getTiles(lats, lons, tileDegrees=TILE_DEGREES):
+	# Splits the municipalities into tiles of tileDegrees of latitude and longitude. Each tile also gets a halo of
+	# the municipalities around it that are within CANDIDATE_RADIUS of any point in it, so the candidates of its
+	# municipalities can be found from the tile alone. Returns (sources, members, member lats, member lons) per
+	# tile, where sources and members (which include the sources) are ascending municipality indexes.
+	latMargin = math.degrees(CANDIDATE_RADIUS / EARTH_RADIUS)
+	rows = np.floor(lats / tileDegrees).astype(int)
+	columns = np.floor(lons / tileDegrees).astype(int)
+	tiles = []
+	for row, column in sorted(set(zip(rows.tolist(), columns.tolist()))):
+		south, north = row * tileDegrees - latMargin, (row + 1) * tileDegrees + latMargin
+		# A point within CANDIDATE_RADIUS is at most this many degrees of longitude away, at the tile's highest latitude
+		highestLatitude = min(90, max(abs(south), abs(north)))
+		ratio = math.sin(CANDIDATE_RADIUS / EARTH_RADIUS) / max(math.cos(math.radians(highestLatitude)), 1e-12)
+		lonMargin = math.degrees(math.asin(ratio)) if ratio < 1 else 180
+		west, width = column * tileDegrees - lonMargin, tileDegrees + 2 * lonMargin
+		sources = np.flatnonzero((rows == row) & (columns == column))
+		# Longitudes east of the tile's west edge, wrapping around past 180
+		isInLongitude = np.mod(lons - west, 360) <= width if width < 360 else np.ones(len(lons), dtype=bool)
+		members = np.flatnonzero((lats >= south) & (lats <= north) & isInLongitude)
+		tiles.append((sources, members, lats[members], lons[members]))
+	return tiles
+
+
+def getTileCandidates(tile):
+	# For each source municipality of a tile, the other municipalities within CANDIDATE_RADIUS, nearest first
+	# (ties in index order). Only reads the tile, so the tiles can be searched in separate processes.
+	sources, members, lats, lons = tile
+	coordinates = getUnitSphereCoordinates(lats, lons)
+	tree = cKDTree(coordinates)
+	positions = np.searchsorted(members, sources)
+	nearby = tree.query_ball_point(coordinates[positions], getChordLength(CANDIDATE_RADIUS), return_sorted=True)
+	candidates = []
+	for position, near in zip(positions, nearby):
+		near = np.array(near, dtype=int)
+		near = near[near != position]
+		distances = getDistancesFromPoint(lats[position], lons[position], lats[near], lons[near])
+		candidates.append(members[near[np.argsort(distances, kind="stable")]].tolist())
+	return candidates
+
+
+def addEdgesToMunicipalities(codeToMunicipality=None, workers=None):
+	# Read in the municipalities with the supercharger status (unless the previous stage passed them on)
+	if codeToMunicipality is None:
+		codeToMunicipality = getMunicipalityCodeToSuperchargerStatus()
 	codeToMunicipalityValues : list[Municipality] = list(codeToMunicipality.values())
+	lats = np.array([muni.lat for muni in codeToMunicipalityValues], dtype=float)
+	lons = np.array([muni.lon for muni in codeToMunicipalityValues], dtype=float)
+
+	# Find every municipality's candidates (the ones close enough for an edge) tile by tile, on a pool of worker
+	# processes (workers defaults to the number of cores, workers=1 searches in this process)
+	tiles = getTiles(lats, lons)
+	workers = workers or os.cpu_count() or 1
+	if workers <= 1 or len(tiles) <= 1 or len(codeToMunicipalityValues) < PARALLEL_MIN_MUNICIPALITIES:
+		tileCandidates = list(map(getTileCandidates, tiles))
+	else:
+		with Pool(processes=min(workers, len(tiles))) as pool:
+			tileCandidates = pool.map(getTileCandidates, tiles)
+	candidates = [None] * len(codeToMunicipalityValues)
+	for (sources, _, _, _), sourceCandidates in zip(tiles, tileCandidates):
+		for i, nearest in zip(sources, sourceCandidates):
+			candidates[i] = nearest
+
+	# Then connect them in municipality order, which the edges depend on (each one skips the municipalities
+	# already connected to it by the ones before it)
 	for i in range(len(codeToMunicipalityValues)):
-		closenessHeap = []
 		muni1 = codeToMunicipalityValues[i]
 		# Essentially gather the closest MAX_EDGES edges to each municipality
-		for j in range(len(codeToMunicipalityValues)):
-			if i == j: continue
-			muni2 = codeToMunicipalityValues[j]
-			if muni2.code in muni1._neighbors: continue
-			distance = getDistanceBetweenMunicipalities(muni1, muni2)
-			heapq.heappush(closenessHeap, (distance, muni2))
+		closest = []
+		for j in candidates[i]:
+			if codeToMunicipalityValues[j].code not in muni1._neighbors:
+				closest.append(j)
+				if len(closest) == MAX_EDGES: break
 
 		# Add the closest MAX_EDGES edges to each municipality
-		for j in range(MAX_EDGES):
-			if not closenessHeap: break
-			distance, muni2 = heapq.heappop(closenessHeap)
+		for j in range(len(closest)):
+			muni2 = codeToMunicipalityValues[closest[j]]
+			# Saved edge weights come from the scalar formula, so a rebuilt graph matches the earlier one exactly
+			distance = getDistanceBetweenMunicipalities(muni1, muni2)
 			# Use MAX_DISTANCE / powers of 2 and 3 to limit the number of nodes with a BUNCH of edges.
 			if (j < 3 and distance > (MAX_DISTANCE/(2**j))) or (j >= 3 and distance > (MAX_DISTANCE/(3**j))): break
 			# Construct the edges
@@ -213,20 +459,21 @@ def addEdgesToMunicipalities():
 			muni2.edges.append(edgeToMuni1)
 			muni2._neighbors.add(muni1.code)
 
-	# Save to file allMunicipalitiesGraph.json (one level up and in a folder called graphs)
-	with open('../graphs/allMunicipalitiesGraph.json', 'w') as file:
-		json.dump(codeToMunicipality, file, default=municipalityDictSerializer)
+	# Save to file allMunicipalitiesGraph.json (one level up and in a folder called graphs).
+	# json.dumps encodes with the C encoder, json.dump would go through the much slower Python one.
+	with open(GRAPH_PATH, 'w') as file:
+		file.write(json.dumps(codeToMunicipality, default=municipalityDictSerializer))
 
 	return codeToMunicipality
 
 
 def loadMunicipalitiesWithEdges():
-	with open('../graphs/allMunicipalitiesGraph.json') as file:
+	with open(GRAPH_PATH) as file:
 		obj = json.load(file)
 		return {code: Municipality(**value) for code, value in obj.items()}
 
 
-def testAndSaveToMap(codeToMuni, outputFile="mexicoMap.html"):
+def testAndSaveToMap(codeToMuni, outputFile=MAP_PATH):
 	totalEdges = 0
 	for muni in codeToMuni.values():
 		totalEdges += len(muni.edges)
@@ -254,20 +501,92 @@ def testAndSaveToMap(codeToMuni, outputFile="mexicoMap.html"):
 	print("Saved interactive map")
 
 
-def main():
-	print("Beginning data processing...\n")
+def getFileChecksum(path):
+	digest = hashlib.sha256()
+	with open(path, 'rb') as file:
+		for chunk in iter(lambda: file.read(1 << 20), b''):
+			digest.update(chunk)
+	return digest.hexdigest()
+
+
+def getStageKey(*inputs):
+	# Each stage's key covers the key of the stage before it, so a change to any earlier input reruns every later stage
+	return hashlib.sha256(json.dumps([PIPELINE_VERSION, *inputs]).encode()).hexdigest()
+
+
+def loadPipelineCache():
+	try:
+		with open(PIPELINE_CACHE_PATH) as file:
+			return json.load(file)
+	except (OSError, ValueError):
+		return {}
 
-	# Clean the municipalities data (raw), already performed.
-	cleanMunicipalities()
 
-	# Combine the two datasets to mark which muncipalities have the superchargers in them
-	saveMunicipalityWithSuperchargers()
+def isStageUpToDate(pipelineCache, stage, key, outputPath):
+	# Up to date if it last ran on the same inputs and its output has not been changed or removed since
+	entry = pipelineCache.get(stage)
+	return entry is not None and entry['key'] == key and os.path.exists(outputPath) and entry['output'] == getFileChecksum(outputPath)
+
+
+def recordStage(pipelineCache, stage, key, outputPath):
+	pipelineCache[stage] = {'key': key, 'output': getFileChecksum(outputPath)}
+	with open(PIPELINE_CACHE_PATH + '.tmp', 'w') as file:
+		json.dump(pipelineCache, file, indent=4)
+	os.replace(PIPELINE_CACHE_PATH + '.tmp', PIPELINE_CACHE_PATH)
+
+
+def main():
+	print("Beginning data processing...\n")
+	pipelineCache = loadPipelineCache()
+
+	# Clean the municipalities data (raw). The raw file is not kept in the repository, so without it the saved
+	# cleaned municipalities are where the pipeline starts.
+	hasRawMunicipalities = os.path.exists(RAW_MUNICIPALITIES_PATH)
+	if hasRawMunicipalities:
+		cleanKey = getStageKey('clean', getFileChecksum(RAW_MUNICIPALITIES_PATH))
+		cleanIsUpToDate = isStageUpToDate(pipelineCache, 'clean', cleanKey, CLEAN_MUNICIPALITIES_PATH)
+	else:
+		print(RAW_MUNICIPALITIES_PATH, "not found, starting from", CLEAN_MUNICIPALITIES_PATH)
+		# Keep the key of the raw file the cleaned one came from, so the later stages stay up to date
+		cleanEntry = pipelineCache.get('clean')
+		if cleanEntry is not None and cleanEntry['output'] == getFileChecksum(CLEAN_MUNICIPALITIES_PATH):
+			cleanKey = cleanEntry['key']
+		else:
+			cleanKey = getStageKey('clean', getFileChecksum(CLEAN_MUNICIPALITIES_PATH))
+		cleanIsUpToDate = True
+
+	# Combine the two datasets to mark which muncipalities have the superchargers in them.
+	# The cleaned municipalities stream straight into this stage as they are read from the raw file.
+	codeToMuni = None
+	joinKey = getStageKey('join', cleanKey, getFileChecksum(SUPERCHARGERS_PATH), getFileChecksum(CLEAN_SUPERCHARGERS_PATH),
+		MAX_SUPERCHARGER_DISTANCE, SUPERCHARGER_CANDIDATES, SUPERCHARGER_COUNTRY)
+	if isStageUpToDate(pipelineCache, 'join', joinKey, MUNICIPALITIES_WITH_SUPERCHARGERS_PATH):
+		print("Municipalities with superchargers are up to date.")
+		if not cleanIsUpToDate:
+			cleanMunicipalities()
+	else:
+		codeToMuni = saveMunicipalityWithSuperchargers(
+			iterateJSONArray(CLEAN_MUNICIPALITIES_PATH) if cleanIsUpToDate else streamCleanMunicipalities())
+		recordStage(pipelineCache, 'join', joinKey, MUNICIPALITIES_WITH_SUPERCHARGERS_PATH)
+	if not cleanIsUpToDate:
+		recordStage(pipelineCache, 'clean', cleanKey, CLEAN_MUNICIPALITIES_PATH)
 
 	# Next, add edges between municipalities
-	codeToMuni = addEdgesToMunicipalities()
+	graphKey = getStageKey('graph', joinKey, MAX_EDGES, MAX_DISTANCE)
+	if isStageUpToDate(pipelineCache, 'graph', graphKey, GRAPH_PATH):
+		print("Graph is up to date.")
+		codeToMuni = None
+	else:
+		codeToMuni = addEdgesToMunicipalities(codeToMuni)
+		recordStage(pipelineCache, 'graph', graphKey, GRAPH_PATH)
 
 	# Finally, make and save the map of these municipalities
-	testAndSaveToMap(codeToMuni)
+	mapKey = getStageKey('map', graphKey)
+	if isStageUpToDate(pipelineCache, 'map', mapKey, MAP_PATH):
+		print("Map is up to date.")
+	else:
+		testAndSaveToMap(codeToMuni if codeToMuni is not None else loadMunicipalitiesWithEdges())
+		recordStage(pipelineCache, 'map', mapKey, MAP_PATH)
 	print("Data processing has succeeded.")
 
 if __name__ == '__main__':
@@ -1,25 +1,40 @@
 from definitions import (
     Algorithm,
+    CSRGraph,
     Graph,
-    Municipality,
     Route,
     RouteStop,
     SPAlgorithm,
 )
-from cmath import sqrt
-from math import sqrt, inf
-from typing import Callable, Dict, List, Optional
-from collections import defaultdict
+from math import inf
+from typing import Callable, List, Optional
+from heuristics import Heuristic, ZeroHeuristic, getHeuristic
 import heapq
 import time
 
+# h = 0 (the same pop order as Dijkstra's). The search keeps one max charge per municipality, so which
+# routes it keeps depends on the order municipalities are popped in, and a goal directed estimate
+# (HaversineHeuristic, landmarks, see heuristics.py) can end at a longer route on some pairs.
+# Pass one of those to getShortestPath to opt in to fewer expansions.
+DEFAULT_HEURISTIC: type[Heuristic] = ZeroHeuristic
+
 
 class AStar(Algorithm):
+    # heuristic is either a Heuristic class (built once per graph) or an instance built for the graph
+    def __init__(self, heuristic: type[Heuristic] | Heuristic = DEFAULT_HEURISTIC):
+        self.heuristic = heuristic
+        # Number of municipalities popped off the frontier by the last search
+        self.expanded = 0
+
     @staticmethod
     def getShortestPath(
-        startingCode: str, endingCode: str, carRange: int, graph: Graph
+        startingCode: str,
+        endingCode: str,
+        carRange: int,
+        graph: Graph,
+        heuristic: type[Heuristic] | Heuristic = DEFAULT_HEURISTIC,
     ) -> Optional[Route | float]:
-        return AStar()._getShortestPath(
+        return AStar(heuristic)._getShortestPath(
             startingCode=startingCode,
             endingCode=endingCode,
             carRange=carRange,
@@ -28,25 +43,11 @@ class AStar(Algorithm):
 
     @staticmethod
     def getAllShortestPaths(carRange: int, graph: Graph) -> list[list[float]]:
-        # Iterate over each and every pair of nodes, returning the distances between each of them
+        # One search per source that settles every destination in a single sweep, returning the distances between each pair.
+        # The sweep pops municipalities in the h = 0 order, so each entry is the totalDistance getShortestPath gives
+        # with the default heuristic (not with a goal directed one passed to it).
         startTime: float = time.time_ns()
-        result: list[list[float]] = []
-        for muni in graph.allMunicipalities:
-            muniCode: str = muni.code
-            curMuniResult: list[float] = []
-            for otherMuni in graph.allMunicipalities:
-                otherMuniCode: str = otherMuni.code
-                if muniCode == otherMuniCode:
-                    curMuniResult.append(0.0)
-                else:
-                    route: Route | None = AStar()._getShortestPath(
-                        muniCode, otherMuniCode, carRange, graph
-                    )
-                    if not route:
-                        curMuniResult.append(float("inf"))
-                    else:
-                        curMuniResult.append(route.totalDistance)
-            result.append(curMuniResult)
+        result: list[list[float]] = AStar()._all_shortest_paths(carRange, graph.csr)
         print(
             f"Took {(time.time_ns() - startTime) / 10**9} to find all shortest paths."
         )
@@ -55,39 +56,33 @@ class AStar(Algorithm):
     def _getShortestPath(
         self, startingCode: str, endingCode: str, carRange: int, graph: Graph
     ) -> Optional[Route | float]:
-        goal_municpilaity = graph.getMunicipality(endingCode)
+        csr: CSRGraph = graph.csr
+        goal_id: int = csr.getNodeId(endingCode)
+        # Estimates that overshoot some edge of this graph are not admissible, so plain h = 0 is used instead
+        heuristic: Heuristic = (
+            self.heuristic
+            if isinstance(self.heuristic, Heuristic)
+            else getHeuristic(csr, self.heuristic)
+        )
+        if heuristic.csr is not csr:
+            raise ValueError("The heuristic was built for a different graph")
+        if not heuristic.isConsistent:
+            heuristic = getHeuristic(csr, ZeroHeuristic)
         return self._A_Star(
-            start=graph.getMunicipality(startingCode),
-            end=goal_municpilaity,
+            start=csr.getNodeId(startingCode),
+            end=goal_id,
             carRange=carRange,
-            graph=graph,
-            h=self._get_heuristic(goal_municpilaity),
-        )
-
-    def _inf_dict(self, negative=False):
-        return defaultdict(lambda: inf if not negative else -inf)
-
-    def _euc_dist(self, point1: Municipality, point2: Municipality):
-        return float(
-            sqrt(abs((point2.lat - point1.lat) ** 2 + (point2.lon - point1.lon) ** 2))
-        )
-
-    def _d(
-        self,
-        from_point: Municipality,
-        to_point: Municipality,
-        through_point: Municipality,
-    ):
-        return self._euc_dist(from_point, through_point) + self._euc_dist(
-            through_point, to_point
+            csr=csr,
+            h=heuristic.forGoal(goal_id),
         )
 
     def _reconstruct_path(
         self,
-        g_scores: Dict[Municipality, Municipality],
-        came_from: Dict[Municipality, Municipality],
-        start: Municipality,
-        end: Municipality,
+        g_scores: List[float],
+        came_from: List[int],
+        start: int,
+        end: int,
+        csr: CSRGraph,
     ) -> Route:
         shortest_route: Route = Route(stops=[], algorithm=SPAlgorithm.A_STAR)
         cur_muni = end
@@ -97,65 +92,159 @@ class AStar(Algorithm):
             prev_g_score = g_scores[next_muni]
             shortest_route.addStop(
                 RouteStop(
-                    muniCode=cur_muni.code,
-                    charged=cur_muni.hasSupercharger,
+                    muniCode=csr.getCode(cur_muni),
+                    charged=bool(csr.hasSupercharger[cur_muni]),
                     distance=g_scores[cur_muni] - prev_g_score,
                 )
             )
             cur_muni = next_muni
-        shortest_route.addStop(RouteStop(muniCode=start.code, distance=0))
+        shortest_route.addStop(RouteStop(muniCode=csr.getCode(start), distance=0))
         shortest_route.reverse()
 
         return shortest_route
 
-    def _get_heuristic(
-        self, goal_state: Municipality
-    ) -> Callable[[Municipality], float]:
-        return lambda x: self._euc_dist(x, goal_state)
+    def _all_shortest_paths(self, carRange: int, csr: CSRGraph) -> list[list[float]]:
+        # The per-node arrays are allocated once and reset (not reallocated) for every source
+        num_munis = len(csr)
+        came_from: List[int] = [-1] * num_munis
+        max_charge: List[float] = [-inf] * num_munis
+        g_score: List[float] = [inf] * num_munis
+        settled_by: List[int] = [-1] * num_munis
+        no_charge: List[float] = [-inf] * num_munis
+        no_g_score: List[float] = [inf] * num_munis
+
+        # Rows are in node id (municipality index) order, like graph.allMunicipalities
+        result: list[list[float]] = []
+        for start in range(num_munis):
+            max_charge[:] = no_charge
+            g_score[:] = no_g_score
+            result.append(
+                self._A_Star_sweep(
+                    start, carRange, csr, came_from, max_charge, g_score, settled_by
+                )
+            )
+        return result
+
+    def _A_Star_sweep(
+        self,
+        start: int,
+        carRange: int,
+        csr: CSRGraph,
+        came_from: List[int],
+        max_charge: List[float],
+        g_score: List[float],
+        settled_by: List[int],
+    ) -> list[float]:
+        # _A_Star with h = 0 that keeps going after a goal is popped: the first time each municipality
+        # is popped, its distance is recorded exactly as _reconstruct_path would total it then
+        offsets, targets, weights = csr.offsets, csr.targets, csr.weights
+        hasSupercharger = csr.hasSupercharger
+        num_munis = len(csr)
+        distances: list[float] = [inf] * num_munis
+        unsettled = num_munis
+
+        # Frontier has format: (f_score, chargeRemaining, g_score, municipality id)
+        frontier: list[tuple[float, float, float, int]] = [(0, -carRange, 0, start)]
+        max_charge[start] = carRange
+        g_score[start] = 0
+
+        while frontier:
+            cur_f_score, neg_rem_charge, cur_g_score, cur_muni = heapq.heappop(frontier)
+            rem_charge = carRange if hasSupercharger[cur_muni] else -neg_rem_charge
+
+            if settled_by[cur_muni] != start:
+                settled_by[cur_muni] = start
+                # Sum the per-stop distances along the current path (start stop first, like Route.totalDistance)
+                stops: list[float] = []
+                muni = cur_muni
+                while muni != start:
+                    stops.append(g_score[muni] - g_score[came_from[muni]])
+                    muni = came_from[muni]
+                stops.append(0)
+                stops.reverse()
+                distances[cur_muni] = 0.0 if cur_muni == start else sum(stops)
+                unsettled -= 1
+                if not unsettled:
+                    break
+
+            for e in range(offsets[cur_muni], offsets[cur_muni + 1]):
+                neighbor, distance = targets[e], weights[e]
+
+                tentative_g_score = cur_g_score + distance
+                tentative_rem_charge = rem_charge - distance
+
+                if (
+                    tentative_g_score < g_score[neighbor]
+                    or tentative_rem_charge > max_charge[neighbor]
+                ) and tentative_rem_charge >= 0:
+                    if tentative_g_score < g_score[neighbor]:
+                        came_from[neighbor] = cur_muni
+                        g_score[neighbor] = tentative_g_score
+                    if tentative_rem_charge > max_charge[neighbor]:
+                        max_charge[neighbor] = tentative_rem_charge
+                    heapq.heappush(
+                        frontier,
+                        (
+                            g_score[neighbor],
+                            -tentative_rem_charge,
+                            tentative_g_score,
+                            neighbor,
+                        ),
+                    )
+
+        return distances
 
     def _A_Star(
         self,
-        start: Municipality,
-        end: Municipality,
+        start: int,
+        end: int,
         carRange: int,
-        graph: Graph,
-        h: Callable[[Municipality], float],
+        csr: CSRGraph,
+        h: Callable[[int], float],
     ):
         start_time = time.time()
+        offsets, targets, weights = csr.offsets, csr.targets, csr.weights
+        num_munis = len(csr)
 
-        # Frontier has format: (f_score, chargeRemaining, g_score, municipality)
-        frontier: list[tuple[float, float, float, Municipality]] = [
+        # Frontier has format: (f_score, chargeRemaining, g_score, municipality id)
+        frontier: list[tuple[float, float, float, int]] = [
             (h(start), -carRange, 0, start)
         ]
 
-        came_from: Dict[Municipality, Municipality] = {}
-        max_charge: Dict[Municipality, float] = self._inf_dict(negative=True)
-        g_score: defaultdict[Municipality, float] = self._inf_dict()
-        f_score: defaultdict[Municipality, float] = self._inf_dict()
+        came_from: List[int] = [-1] * num_munis
+        max_charge: List[float] = [-inf] * num_munis
+        g_score: List[float] = [inf] * num_munis
+        f_score: List[float] = [inf] * num_munis
 
         max_charge[start] = carRange
         g_score[start] = 0
         f_score[start] = h(start)
 
+        self.expanded = 0
+        # An infinite estimate means the goal cannot be reached at all (e.g. landmarks in another component)
+        if f_score[start] == inf:
+            return None
+
         # Iterate through frontier
         while frontier:
             # Get the current municipality (rem_charge is negative to make it a max heap)
             cur_f_score, neg_rem_charge, cur_g_score, cur_muni = heapq.heappop(frontier)
             rem_charge = -neg_rem_charge
+            self.expanded += 1
 
-            if cur_muni.hasSupercharger:
+            if csr.hasSupercharger[cur_muni]:
                 rem_charge = carRange
 
             if cur_muni == end:
                 # print("Max charge at destination: ", max(rem_charge, max_charge[end]))
                 # print("Total algorithm time: ", time.time() - start_time)
-                return self._reconstruct_path(g_score, came_from, start, end)
+                return self._reconstruct_path(g_score, came_from, start, end, csr)
 
-            for edge in cur_muni.edges:
-                neighbor = graph.getMunicipality(edge.toMuniCode)
+            for e in range(offsets[cur_muni], offsets[cur_muni + 1]):
+                neighbor, distance = targets[e], weights[e]
 
-                tentative_g_score = cur_g_score + edge.distance
-                tentative_rem_charge = rem_charge - edge.distance
+                tentative_g_score = cur_g_score + distance
+                tentative_rem_charge = rem_charge - distance
 
                 if (
                     tentative_g_score < g_score[neighbor]
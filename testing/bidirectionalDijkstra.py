@@ -0,0 +1,375 @@
+# Bidirectional charge-aware Dijkstra's
+# Purpose: Point-to-point shortest routes under the car range, searching from both ends at once.
+# Dijkstra's keeps one distance and one max charge per municipality, so it can throw away a path that is
+# longer but has more charge left and is needed later. Here every municipality keeps Pareto labels
+# instead: (distance, charge left) going forward from the start and (distance, charge needed) going
+# backward from the end, so the route found is the shortest one that never runs out of charge.
+# How to Run: Add SPAlgorithm.BIDIRECTIONAL_DIJKSTRA to ALGORITHMS_TO_TEST in testSuite.py
+
+import heapq
+import time
+from dataclasses import dataclass
+from math import inf
+from typing import Optional
+from definitions import Algorithm, CSRGraph, Graph, Route, RouteStop, SPAlgorithm
+from heuristics import Heuristic, HaversineHeuristic, ZeroHeuristic, getHeuristic
+
+
+# How much of the graph a search looked at
+@dataclass
+class SearchStats:
+    touched: int = 0
+    settledLabels: int = 0
+    seconds: float = 0
+
+
+# Labels of one search direction, stored as parallel lists indexed by label id
+class _Labels:
+    def __init__(self, numMuni: int):
+        self.node: list[int] = []
+        self.distance: list[float] = []
+        # Forward: charge left on arriving (after charging). Backward: charge needed on leaving.
+        self.charge: list[float] = []
+        self.parent: list[int] = []
+        # Label ids settled at each municipality, in the order they were settled
+        self.settled: list[list[int]] = [[] for _ in range(numMuni)]
+        self.heap: list[tuple[float, float, int]] = []
+
+    def add(self, node: int, distance: float, charge: float, parent: int) -> int:
+        self.node.append(node)
+        self.distance.append(distance)
+        self.charge.append(charge)
+        self.parent.append(parent)
+        return len(self.node) - 1
+
+    @property
+    def top(self) -> float:
+        return self.heap[0][0] if self.heap else inf
+
+
+class BidirectionalDijkstra(Algorithm):
+    @staticmethod
+    def getShortestPath(
+        startingCode: str,
+        endingCode: str,
+        carRange: int,
+        graph: Graph,
+        bidirectional: bool = True,
+    ) -> Optional[Route | float]:
+        csr: CSRGraph = graph.csr
+        stats = SearchStats()
+        route: Optional[Route] = BidirectionalDijkstra._search(
+            csr,
+            csr.getNodeId(startingCode),
+            csr.getNodeId(endingCode),
+            carRange,
+            bidirectional,
+            stats,
+        )
+        if route is None:
+            print(
+                "No route between ",
+                startingCode,
+                " and ",
+                endingCode,
+                " exists with charge constraints.",
+            )
+        print(
+            f"Touched {stats.touched} of {len(csr)} municipalities ({stats.settledLabels} labels settled)"
+        )
+        print("Total algorithm time: ", stats.seconds)
+        return route
+
+    @staticmethod
+    def getAllShortestPaths(carRange: int, graph: Graph) -> list[list[float]]:
+        # One forward label search per source (without an end it settles every municipality)
+        startTime: float = time.time_ns()
+        csr: CSRGraph = graph.csr
+        numMuni = len(csr)
+        result: list[list[float]] = []
+        for start in range(numMuni):
+            forward = _Labels(numMuni)
+            BidirectionalDijkstra._forwardSearch(csr, forward, start, -1, carRange)
+            result.append(
+                [
+                    forward.distance[labels[0]] if labels else inf
+                    for labels in forward.settled
+                ]
+            )
+        print(
+            f"Took {(time.time_ns()- startTime) / 10**9} seconds to find all shortest paths."
+        )
+        return result
+
+    @staticmethod
+    def _search(
+        csr: CSRGraph,
+        startingId: int,
+        endingId: int,
+        carRange: int,
+        bidirectional: bool = True,
+        stats: Optional[SearchStats] = None,
+    ) -> Optional[Route]:
+        startTime = time.time()
+        stats = stats if stats is not None else SearchStats()
+        numMuni = len(csr)
+        forward = _Labels(numMuni)
+        backward = _Labels(numMuni)
+
+        if bidirectional:
+            meeting = BidirectionalDijkstra._meet(
+                csr, forward, backward, startingId, endingId, carRange
+            )
+        else:
+            label = BidirectionalDijkstra._forwardSearch(
+                csr, forward, startingId, endingId, carRange
+            )
+            meeting = (label, -1) if label >= 0 else None
+
+        touched = set(forward.node)
+        touched.update(backward.node)
+        stats.touched = len(touched)
+        stats.settledLabels = sum(map(len, forward.settled)) + sum(
+            map(len, backward.settled)
+        )
+        stats.seconds = time.time() - startTime
+        if meeting is None:
+            return None
+        return BidirectionalDijkstra._buildRoute(csr, forward, backward, *meeting)
+
+    @staticmethod
+    def _forwardSearch(
+        csr: CSRGraph, forward: _Labels, startingId: int, endingId: int, carRange: int
+    ) -> int:
+        # Early exit forward search: returns the first label settled at endingId (-1 if unreachable)
+        offsets, targets, weights = csr.offsets, csr.targets, csr.weights
+        hasSupercharger = csr.hasSupercharger
+        settled = forward.settled
+        heap = forward.heap
+        heapq.heappush(heap, (0, -carRange, forward.add(startingId, 0, carRange, -1)))
+
+        while heap:
+            distance, negCharge, label = heapq.heappop(heap)
+            node, charge = forward.node[label], -negCharge
+            # Settled labels at a node come in increasing distance, so only more charge is worth keeping
+            if settled[node] and forward.charge[settled[node][-1]] >= charge:
+                continue
+            settled[node].append(label)
+            if node == endingId:
+                return label
+
+            for e in range(offsets[node], offsets[node + 1]):
+                neighbor, weight = targets[e], weights[e]
+                newCharge = charge - weight
+                if newCharge < 0:
+                    continue
+                if hasSupercharger[neighbor]:
+                    newCharge = carRange
+                if (
+                    settled[neighbor]
+                    and forward.charge[settled[neighbor][-1]] >= newCharge
+                ):
+                    continue
+                heapq.heappush(
+                    heap,
+                    (
+                        distance + weight,
+                        -newCharge,
+                        forward.add(neighbor, distance + weight, newCharge, label),
+                    ),
+                )
+        return -1
+
+    @staticmethod
+    def _meet(
+        csr: CSRGraph,
+        forward: _Labels,
+        backward: _Labels,
+        startingId: int,
+        endingId: int,
+        carRange: int,
+    ) -> Optional[tuple[int, int]]:
+        # Grow both searches (always the one with the closer frontier) until no unsettled label can lead
+        # to a route shorter than the best one found. Every new label is checked against the labels
+        # already settled by the other search at the same municipality; a forward label with charge
+        # left c joins a backward label needing q if c >= q.
+        # Both searches are steered toward each other with the average of the straight line (haversine)
+        # distances to the end and from the start as a potential: forward keys are distance + potential and
+        # backward keys distance - potential, which keeps the order of labels at each municipality and the
+        # stopping rule exact.
+        # Returns (forward label id, backward label id) of the shortest route, or None.
+        offsets, targets, weights = csr.offsets, csr.targets, csr.weights
+        reverseCsr: CSRGraph = csr.reverse()
+        reverseOffsets, reverseTargets, reverseWeights = (
+            reverseCsr.offsets,
+            reverseCsr.targets,
+            reverseCsr.weights,
+        )
+        hasSupercharger = csr.hasSupercharger
+        bestDistance = inf
+        best: Optional[tuple[int, int]] = None
+
+        bound: Heuristic = getHeuristic(csr, HaversineHeuristic)
+        if not bound.isConsistent:
+            bound = getHeuristic(csr, ZeroHeuristic)
+        toEnd: list[float] = bound.toGoal(endingId)
+        fromStart: list[float] = bound.toGoal(startingId)
+        # Forward key of a label at v: distance + potential[v]; backward key: distance - potential[v].
+        # The keys of a forward and a backward label at the same municipality add up to exactly their
+        # route distance, so no route is shorter than the two smallest keys added together.
+        potential: list[float] = [
+            (toEnd[v] - fromStart[v]) / 2 for v in range(len(csr))
+        ]
+
+        startLabel = forward.add(startingId, 0, carRange, -1)
+        endLabel = backward.add(endingId, 0, 0, -1)
+        if startingId == endingId:
+            return startLabel, endLabel
+        heapq.heappush(forward.heap, (potential[startingId], -carRange, startLabel))
+        heapq.heappush(backward.heap, (-potential[endingId], 0, endLabel))
+
+        while forward.heap and backward.heap:
+            if forward.top + backward.top >= bestDistance:
+                break
+
+            if forward.top <= backward.top:
+                _, negCharge, label = heapq.heappop(forward.heap)
+                node, distance, charge = (
+                    forward.node[label],
+                    forward.distance[label],
+                    -negCharge,
+                )
+                settled = forward.settled[node]
+                if settled and forward.charge[settled[-1]] >= charge:
+                    continue
+                if distance + toEnd[node] >= bestDistance:
+                    continue
+                settled.append(label)
+
+                for e in range(offsets[node], offsets[node + 1]):
+                    neighbor, weight = targets[e], weights[e]
+                    newCharge = charge - weight
+                    if newCharge < 0:
+                        continue
+                    if hasSupercharger[neighbor]:
+                        newCharge = carRange
+                    newDistance = distance + weight
+
+                    # Shortest settled backward label at the neighbor that this charge covers
+                    # (settled backward labels need less and less charge as their distance grows)
+                    for other in backward.settled[neighbor]:
+                        if backward.charge[other] <= newCharge:
+                            if newDistance + backward.distance[other] < bestDistance:
+                                bestDistance = newDistance + backward.distance[other]
+                                best = (
+                                    forward.add(
+                                        neighbor, newDistance, newCharge, label
+                                    ),
+                                    other,
+                                )
+                            break
+
+                    neighborSettled = forward.settled[neighbor]
+                    if (
+                        neighborSettled
+                        and forward.charge[neighborSettled[-1]] >= newCharge
+                    ) or newDistance + toEnd[neighbor] >= bestDistance:
+                        continue
+                    heapq.heappush(
+                        forward.heap,
+                        (
+                            newDistance + potential[neighbor],
+                            -newCharge,
+                            forward.add(neighbor, newDistance, newCharge, label),
+                        ),
+                    )
+            else:
+                _, needed, label = heapq.heappop(backward.heap)
+                node, distance = backward.node[label], backward.distance[label]
+                settled = backward.settled[node]
+                if settled and backward.charge[settled[-1]] <= needed:
+                    continue
+                if distance + fromStart[node] >= bestDistance:
+                    continue
+                settled.append(label)
+
+                # Arriving at a supercharger refills the car, so nothing more is needed before it
+                neededAfterArrival = 0 if hasSupercharger[node] else needed
+                for e in range(reverseOffsets[node], reverseOffsets[node + 1]):
+                    neighbor, weight = reverseTargets[e], reverseWeights[e]
+                    newNeeded = weight + neededAfterArrival
+                    if newNeeded > carRange:
+                        continue
+                    newDistance = distance + weight
+
+                    # Shortest settled forward label at the neighbor with enough charge
+                    # (settled forward labels have more and more charge as their distance grows)
+                    for other in forward.settled[neighbor]:
+                        if forward.charge[other] >= newNeeded:
+                            if newDistance + forward.distance[other] < bestDistance:
+                                bestDistance = newDistance + forward.distance[other]
+                                best = (
+                                    other,
+                                    backward.add(
+                                        neighbor, newDistance, newNeeded, label
+                                    ),
+                                )
+                            break
+
+                    neighborSettled = backward.settled[neighbor]
+                    if (
+                        neighborSettled
+                        and backward.charge[neighborSettled[-1]] <= newNeeded
+                    ) or newDistance + fromStart[neighbor] >= bestDistance:
+                        continue
+                    heapq.heappush(
+                        backward.heap,
+                        (
+                            newDistance - potential[neighbor],
+                            newNeeded,
+                            backward.add(neighbor, newDistance, newNeeded, label),
+                        ),
+                    )
+
+        return best
+
+    @staticmethod
+    def _buildRoute(
+        csr: CSRGraph,
+        forward: _Labels,
+        backward: _Labels,
+        forwardLabel: int,
+        backwardLabel: int,
+    ) -> Route:
+        # Forward labels point back toward the start, backward labels point on toward the end
+        nodes: list[int] = []
+        distances: list[float] = []
+        label = forwardLabel
+        while label >= 0:
+            nodes.append(forward.node[label])
+            distances.append(forward.distance[label])
+            label = forward.parent[label]
+        nodes.reverse()
+        distances.reverse()
+
+        # The backward label sits on the same municipality as the forward one
+        label = backwardLabel
+        total = distances[-1] + (backward.distance[label] if label >= 0 else 0)
+        label = backward.parent[label] if label >= 0 else -1
+        while label >= 0:
+            nodes.append(backward.node[label])
+            distances.append(total - backward.distance[label])
+            label = backward.parent[label]
+
+        # Per-edge distances, like Dijkstra's routes
+        route: Route = Route(stops=[], algorithm=SPAlgorithm.BIDIRECTIONAL_DIJKSTRA)
+        route.addStop(RouteStop(csr.getCode(nodes[0]), 0))
+        for i in range(1, len(nodes)):
+            route.addStop(
+                RouteStop(
+                    csr.getCode(nodes[i]),
+                    distances[i] - distances[i - 1],
+                    bool(csr.hasSupercharger[nodes[i]]),
+                )
+            )
+        return route
@@ -0,0 +1,105 @@
+# Charge state Dijkstra's benchmark
+# Purpose: For each TeslaModelRange, route random municipality pairs (and the TEST_CASES pairs) with
+# Dijkstra's, A* and the charge state Dijkstra's at several bucket sizes. Reports the time taken, the routes
+# found and how many miles longer each route is on average than the exact (bucketSize None) one.
+# How to Run: python chargeStateBenchmark.py [--graph ALL_NODES] [--pairs 200] [--buckets 1 5 10 25]
+
+import argparse
+import contextlib
+import io
+import random
+import time
+from typing import Callable, Optional
+from definitions import CSRGraph, Graph, GraphType, Route, TeslaModelRange
+from aStar import AStar
+from chargeStateDijkstra import _ChargeStateSearch
+from dijkstra import Dijkstra
+from testCases import TEST_CASES
+from testSuite import getGraph
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare the charge state Dijkstra's with Dijkstra's and A*"
+    )
+    parser.add_argument(
+        "--graph",
+        choices=[graphType.name for graphType in GraphType],
+        default=GraphType.ALL_NODES.name,
+    )
+    parser.add_argument("--pairs", type=int, default=200, help="Random pairs per range")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--buckets",
+        type=float,
+        nargs="+",
+        default=[1, 5, 10, 25],
+        help="Bucket sizes in miles (the exact search always runs)",
+    )
+    args = parser.parse_args()
+
+    graphType: GraphType = GraphType[args.graph]
+    graph: Graph = getGraph(graphType)
+    csr: CSRGraph = graph.csr
+    random.seed(args.seed)
+    pairs: list[tuple[str, str]] = [
+        (testCase.startingMunicipalityCode, testCase.endingMunicipalityCode)
+        for testCase in TEST_CASES
+        if testCase.graphType == graphType
+        and testCase.startingMunicipalityCode
+        and testCase.endingMunicipalityCode
+    ] + [
+        (random.choice(csr.codes), random.choice(csr.codes)) for _ in range(args.pairs)
+    ]
+
+    def chargeState(bucketSize: Optional[float]) -> Callable:
+        def solve(startingCode: str, endingCode: str, carRange: int):
+            search = _ChargeStateSearch(csr, carRange, bucketSize)
+            label = search.run(csr.getNodeId(startingCode), csr.getNodeId(endingCode))
+            return search.buildRoute(label) if label >= 0 else None
+
+        return solve
+
+    solvers: dict[str, Callable] = {
+        "exact": chargeState(None),
+        **{
+            f"bucket {bucketSize:g}": chargeState(bucketSize)
+            for bucketSize in args.buckets
+        },
+        "dijkstra": lambda s, e, r: Dijkstra.getShortestPath(s, e, r, graph),
+        "a*": lambda s, e, r: AStar.getShortestPath(s, e, r, graph),
+    }
+
+    print(f"{graphType.name}: {len(csr)} municipalities, {len(pairs)} pairs per range")
+    for carRange in TeslaModelRange:
+        print(f"\n{carRange.name} ({carRange.value} miles)")
+        print(f"{'':>12} {'seconds':>9} {'found':>6} {'longer':>7} {'mean excess':>12}")
+        exact: list[Optional[float]] = []
+        for name, solve in solvers.items():
+            found = longer = 0
+            excess = 0.0
+            startTime = time.time()
+            for i, (startingCode, endingCode) in enumerate(pairs):
+                # The algorithms print their own timings; keep the table readable
+                with contextlib.redirect_stdout(io.StringIO()):
+                    route: Optional[Route] = solve(
+                        startingCode, endingCode, carRange.value
+                    )
+                distance = route.totalDistance if route else None
+                if name == "exact":
+                    exact.append(distance)
+                if distance is None:
+                    continue
+                found += 1
+                if exact[i] is not None and distance > exact[i] + 1e-6:
+                    longer += 1
+                    excess += distance - exact[i]
+            print(
+                f"{name:>12} {time.time() - startTime:>9.3f} {found:>6} {longer:>7} "
+                f"{excess / max(1, found):>12.3f}"
+            )
+
+
+# Driver function
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+# Charge state Dijkstra's
+# Purpose: Route over (municipality, remaining range bucket) states instead of one distance and one max
+# charge per municipality. A state is only kept if no state already settled at the municipality has
+# at least as much charge (Pareto dominance), so a shorter path with less charge left is never lost.
+# bucketSize sets the resolution: with None every distinct charge is its own state (exact); with e.g.
+# 10 charges within the same 10 mile bucket count as equal, which settles fewer states but may give
+# slightly longer routes. Routes always carry the true charge, so they never run out of range.
+# How to Run: python chargeStateBenchmark.py (compares bucket sizes with Dijkstra's and A*)
+
+import heapq
+import time
+from math import inf
+from typing import Optional
+from definitions import Algorithm, CSRGraph, Graph, Route, RouteStop, SPAlgorithm
+
+# Default resolution in miles of range (None = exact)
+DEFAULT_BUCKET_SIZE: Optional[float] = None
+
+
+class ChargeStateDijkstra(Algorithm):
+    @staticmethod
+    def getShortestPath(
+        startingCode: str,
+        endingCode: str,
+        carRange: int,
+        graph: Graph,
+        bucketSize: Optional[float] = DEFAULT_BUCKET_SIZE,
+    ) -> Optional[Route | float]:
+        startTime = time.time()
+        csr: CSRGraph = graph.csr
+        search = _ChargeStateSearch(csr, carRange, bucketSize)
+        label = search.run(csr.getNodeId(startingCode), csr.getNodeId(endingCode))
+        if label < 0:
+            print(
+                "No route between ",
+                startingCode,
+                " and ",
+                endingCode,
+                " exists with charge constraints.",
+            )
+            return None
+        print("Charge at destination: ", search.charge[label])
+        print(f"States settled: {search.settledStates}")
+        print("Total algorithm time: ", time.time() - startTime)
+        return search.buildRoute(label)
+
+    @staticmethod
+    def getAllShortestPaths(
+        carRange: int,
+        graph: Graph,
+        bucketSize: Optional[float] = DEFAULT_BUCKET_SIZE,
+    ) -> list[list[float]]:
+        # One search per source (without an end it settles every reachable municipality)
+        startTime: float = time.time_ns()
+        csr: CSRGraph = graph.csr
+        result: list[list[float]] = []
+        for start in range(len(csr)):
+            search = _ChargeStateSearch(csr, carRange, bucketSize)
+            search.run(start)
+            result.append(search.distances)
+        print(
+            f"Took {(time.time_ns()- startTime) / 10**9} seconds to find all shortest paths."
+        )
+        return result
+
+
+# One search from a start municipality. Labels (one per pushed state) are parallel lists indexed by label id.
+class _ChargeStateSearch:
+    def __init__(self, csr: CSRGraph, carRange: int, bucketSize: Optional[float]):
+        if bucketSize is not None and bucketSize <= 0:
+            raise ValueError("bucketSize must be positive (or None for exact charges)")
+        self.csr = csr
+        self.carRange = carRange
+        self.bucketSize = bucketSize
+        numMuni = len(csr)
+        self.node: list[int] = []
+        self.distance: list[float] = []
+        self.charge: list[float] = []
+        self.parent: list[int] = []
+        # Shortest distance to each municipality (distance of its first settled state)
+        self.distances: list[float] = [inf] * numMuni
+        self.settledStates = 0
+
+    def run(self, startingId: int, endingId: int = -1) -> int:
+        # Returns the label of the first state settled at endingId (-1 if there is none)
+        csr, carRange, bucketSize = self.csr, self.carRange, self.bucketSize
+        offsets, targets, weights = csr.offsets, csr.targets, csr.weights
+        hasSupercharger = csr.hasSupercharger
+        node, distances, charges = self.node, self.distance, self.charge
+        # Highest charge bucket settled so far at each municipality (-1 = none). States are settled in
+        # increasing distance, so a later state is only worth keeping in a higher bucket.
+        settledBucket: list[float] = [-1] * len(csr)
+
+        self.node.append(startingId)
+        self.distance.append(0)
+        self.charge.append(carRange)
+        self.parent.append(-1)
+        heap: list[tuple[float, float, int]] = [(0, -carRange, 0)]
+
+        while heap:
+            distance, negCharge, label = heapq.heappop(heap)
+            current, charge = node[label], -negCharge
+            bucket = charge if bucketSize is None else charge // bucketSize
+            if bucket <= settledBucket[current]:
+                continue
+            if settledBucket[current] < 0:
+                self.distances[current] = distance
+            settledBucket[current] = bucket
+            self.settledStates += 1
+            if current == endingId:
+                return label
+
+            for e in range(offsets[current], offsets[current + 1]):
+                neighbor, weight = targets[e], weights[e]
+                newCharge = charge - weight
+                if newCharge < 0:
+                    continue
+                if hasSupercharger[neighbor]:
+                    newCharge = carRange
+                if (
+                    newCharge if bucketSize is None else newCharge // bucketSize
+                ) <= settledBucket[neighbor]:
+                    continue
+                node.append(neighbor)
+                distances.append(distance + weight)
+                charges.append(newCharge)
+                self.parent.append(label)
+                heapq.heappush(heap, (distance + weight, -newCharge, len(node) - 1))
+
+        return -1
+
+    def buildRoute(self, label: int) -> Route:
+        labels: list[int] = []
+        while label >= 0:
+            labels.append(label)
+            label = self.parent[label]
+        labels.reverse()
+
+        # Per-edge distances, like Dijkstra's routes
+        route: Route = Route(stops=[], algorithm=SPAlgorithm.CHARGE_STATE_DIJKSTRA)
+        route.addStop(RouteStop(self.csr.getCode(self.node[labels[0]]), 0))
+        for previous, label in zip(labels, labels[1:]):
+            route.addStop(
+                RouteStop(
+                    self.csr.getCode(self.node[label]),
+                    self.distance[label] - self.distance[previous],
+                    bool(self.csr.hasSupercharger[self.node[label]]),
+                )
+            )
+        return route
@@ -0,0 +1,309 @@
+# Precompiled binary graphs
+# Purpose: Turn a graphs/*.json file into a versioned binary file that can be memory mapped,
+# so loading a graph no longer has to json.load the whole file and build every Municipality.
+# How to Run: python compiledGraph.py compile-graph [graph.json ...] (defaults to every graph in graphs/)
+#
+# File layout (little endian, every section starts on an 8 byte boundary):
+#   header          magic, version, node/edge counts, string table size, source size + SHA-256
+#   node table      lats (float64 x N), lons (float64 x N), hasSupercharger (uint8 x N)
+#   CSR edges       offsets (int32 x N+1), targets (int32 x M), weights (float64 x M)
+#   string table    offsets (uint32 x 3N+1) into a UTF-8 blob holding code, name, state per node
+
+import argparse
+import glob
+import hashlib
+import json
+import mmap
+import struct
+import sys
+import time
+from array import array
+from os import path
+from typing import Optional
+from definitions import CSRGraph, Graph, Municipality, PROJECT_ROOT
+
+COMPILED_GRAPH_MAGIC = b"MXEVGRPH"
+COMPILED_GRAPH_VERSION = 1
+COMPILED_GRAPH_EXTENSION = ".bin"
+
+# magic, version, flags, numNodes, numEdges, stringTableSize, sourceSize, sourceDigest
+HEADER = struct.Struct("<8sHHIIIQ32s")
+HEADER_SIZE = 64
+
+
+class StaleGraphError(ValueError):
+    pass
+
+
+def _align(offset: int) -> int:
+    return (offset + 7) & ~7
+
+
+def _sectionOffsets(numNodes: int, numEdges: int, stringTableSize: int) -> dict:
+    # Byte offset of every section, computed from the counts in the header
+    offsets = {}
+    cursor = HEADER_SIZE
+    for name, size in (
+        ("lats", 8 * numNodes),
+        ("lons", 8 * numNodes),
+        ("hasSupercharger", numNodes),
+        ("offsets", 4 * (numNodes + 1)),
+        ("targets", 4 * numEdges),
+        ("weights", 8 * numEdges),
+        ("stringOffsets", 4 * (3 * numNodes + 1)),
+        ("strings", stringTableSize),
+    ):
+        cursor = _align(cursor)
+        offsets[name] = (cursor, cursor + size)
+        cursor += size
+    offsets["end"] = cursor
+    return offsets
+
+
+def getCompiledPath(sourcePath: str) -> str:
+    return path.splitext(sourcePath)[0] + COMPILED_GRAPH_EXTENSION
+
+
+def hashSourceFile(sourcePath: str) -> tuple[int, bytes]:
+    with open(sourcePath, "rb") as file:
+        data = file.read()
+    return len(data), hashlib.sha256(data).digest()
+
+
+def loadJSONGraph(sourcePath: str) -> Graph:
+    with open(sourcePath) as file:
+        obj: dict[str, dict] = json.load(file)
+    graph = Graph(
+        {
+            code: Municipality(index, **value)
+            for index, (code, value) in enumerate(obj.items())
+        }
+    )
+    graph.sourcePath = sourcePath
+    return graph
+
+
+def compileGraph(sourcePath: str, compiledPath: Optional[str] = None) -> str:
+    compiledPath = compiledPath or getCompiledPath(sourcePath)
+    return writeCompiledGraph(
+        loadJSONGraph(sourcePath).csr, compiledPath, hashSourceFile(sourcePath)
+    )
+
+
+def writeCompiledGraph(
+    csr: CSRGraph,
+    compiledPath: str,
+    source: tuple[int, bytes] = (0, bytes(32)),
+) -> str:
+    # Writes a CSR graph as a compiled graph, stamped with the size and SHA-256 of the JSON graph it
+    # holds (see hashSourceFile; left zeroed when there is no JSON graph, so it never matches one)
+    sourceSize, sourceDigest = source
+
+    # String table: code, name and state of each node, in node id order
+    blob = bytearray()
+    stringOffsets = array("I", [0])
+    for i in range(len(csr)):
+        for value in (csr.codes[i], csr.names[i], csr.states[i]):
+            blob += value.encode("utf-8")
+            stringOffsets.append(len(blob))
+
+    sections = {
+        "lats": array("d", csr.lats).tobytes(),
+        "lons": array("d", csr.lons).tobytes(),
+        "hasSupercharger": bytes(csr.hasSupercharger),
+        "offsets": array("i", csr.offsets).tobytes(),
+        "targets": array("i", csr.targets).tobytes(),
+        "weights": array("d", csr.weights).tobytes(),
+        "stringOffsets": stringOffsets.tobytes(),
+        "strings": bytes(blob),
+    }
+    layout = _sectionOffsets(len(csr), csr.numEdges, len(blob))
+
+    output = bytearray(layout["end"])
+    output[: HEADER.size] = HEADER.pack(
+        COMPILED_GRAPH_MAGIC,
+        COMPILED_GRAPH_VERSION,
+        0,
+        len(csr),
+        csr.numEdges,
+        len(blob),
+        sourceSize,
+        sourceDigest,
+    )
+    for name, data in sections.items():
+        start, end = layout[name]
+        output[start:end] = data
+
+    with open(compiledPath, "wb") as file:
+        file.write(output)
+    return compiledPath
+
+
+def readHeader(buffer) -> dict:
+    if sys.byteorder != "little":
+        raise ValueError(
+            "Compiled graphs can only be memory mapped on little endian machines"
+        )
+    (
+        magic,
+        version,
+        flags,
+        numNodes,
+        numEdges,
+        stringTableSize,
+        sourceSize,
+        sourceDigest,
+    ) = HEADER.unpack_from(buffer, 0)
+    if magic != COMPILED_GRAPH_MAGIC:
+        raise ValueError("Not a compiled graph file")
+    if version != COMPILED_GRAPH_VERSION:
+        raise ValueError(
+            f"Compiled graph version {version} is not supported (expected {COMPILED_GRAPH_VERSION}), recompile it"
+        )
+    return {
+        "numNodes": numNodes,
+        "numEdges": numEdges,
+        "stringTableSize": stringTableSize,
+        "sourceSize": sourceSize,
+        "sourceDigest": sourceDigest,
+    }
+
+
+def isStale(compiledPath: str, sourcePath: str) -> bool:
+    with open(compiledPath, "rb") as file:
+        header = readHeader(file.read(HEADER.size))
+    return (header["sourceSize"], header["sourceDigest"]) != hashSourceFile(sourcePath)
+
+
+def loadCompiledGraph(compiledPath: str, sourcePath: Optional[str] = None) -> Graph:
+    # Memory map the file; the CSR arrays are zero-copy views into the mapping.
+    # If sourcePath is given, the compiled file must have been built from its current contents.
+    with open(compiledPath, "rb") as file:
+        buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    view = memoryview(buffer)
+    header = readHeader(view)
+
+    if sourcePath is not None and (
+        header["sourceSize"],
+        header["sourceDigest"],
+    ) != hashSourceFile(sourcePath):
+        raise StaleGraphError(
+            f"{compiledPath} is stale, recompile it from {sourcePath} (compiledGraph.py compile-graph)"
+        )
+
+    numNodes = header["numNodes"]
+    layout = _sectionOffsets(numNodes, header["numEdges"], header["stringTableSize"])
+    if len(view) < layout["end"]:
+        raise ValueError(f"{compiledPath} is truncated")
+
+    def section(name: str, fmt: str):
+        start, end = layout[name]
+        return view[start:end].cast(fmt)
+
+    # Decode the string table (code, name, state per node)
+    stringOffsets = section("stringOffsets", "I")
+    blob = bytes(view[layout["strings"][0] : layout["strings"][1]])
+    strings = [
+        blob[stringOffsets[i] : stringOffsets[i + 1]].decode("utf-8")
+        for i in range(3 * numNodes)
+    ]
+
+    graph = Graph(
+        csr=CSRGraph(
+            strings[0::3],
+            section("offsets", "i"),
+            section("targets", "i"),
+            section("weights", "d"),
+            section("hasSupercharger", "B"),
+            section("lats", "d"),
+            section("lons", "d"),
+            strings[1::3],
+            strings[2::3],
+        )
+    )
+    graph.sourcePath = sourcePath
+    return graph
+
+
+def patchSuperchargers(
+    compiledPath: str,
+    hasSupercharger: bytes,
+    previousSource: tuple[int, bytes],
+    sourcePath: str,
+) -> bool:
+    # Rewrites the supercharger bitmap of a compiled graph in place (nothing else in the file depends
+    # on it) and marks it as compiled from the current contents of sourcePath. Only done if the file
+    # was compiled from previousSource, the source before the change; returns whether it was patched.
+    with open(compiledPath, "r+b") as file:
+        rawHeader = file.read(HEADER.size)
+        header = readHeader(rawHeader)
+        if (header["sourceSize"], header["sourceDigest"]) != previousSource or header[
+            "numNodes"
+        ] != len(hasSupercharger):
+            return False
+        layout = _sectionOffsets(
+            header["numNodes"], header["numEdges"], header["stringTableSize"]
+        )
+        file.seek(layout["hasSupercharger"][0])
+        file.write(bytes(hasSupercharger))
+        file.seek(0)
+        file.write(
+            HEADER.pack(*HEADER.unpack(rawHeader)[:-2], *hashSourceFile(sourcePath))
+        )
+    return True
+
+
+def verifyCompiledGraph(compiledPath: str, sourcePath: str) -> bool:
+    # Full check: the compiled arrays must match a graph freshly built from the JSON source
+    compiled: CSRGraph = loadCompiledGraph(compiledPath).csr
+    expected: CSRGraph = loadJSONGraph(sourcePath).csr
+    return (
+        compiled.codes == expected.codes
+        and compiled.names == expected.names
+        and compiled.states == expected.states
+        and list(compiled.offsets) == list(expected.offsets)
+        and list(compiled.targets) == list(expected.targets)
+        and list(compiled.weights) == list(expected.weights)
+        and bytes(compiled.hasSupercharger) == bytes(expected.hasSupercharger)
+        and list(compiled.lats) == list(expected.lats)
+        and list(compiled.lons) == list(expected.lons)
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compile graphs/*.json into binary graphs"
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    for command in ("compile-graph", "verify-graph"):
+        subparser = subparsers.add_parser(command)
+        subparser.add_argument(
+            "graphs",
+            nargs="*",
+            help="JSON graph files (defaults to every graph in graphs/)",
+        )
+    args = parser.parse_args()
+
+    sourcePaths: list[str] = args.graphs or sorted(
+        glob.glob(path.join(PROJECT_ROOT, "graphs", "*.json"))
+    )
+    for sourcePath in sourcePaths:
+        compiledPath = getCompiledPath(sourcePath)
+        if args.command == "compile-graph":
+            startTime = time.time()
+            compileGraph(sourcePath, compiledPath)
+            print(
+                f"Compiled {sourcePath} -> {compiledPath} in {time.time() - startTime:.3f}s"
+            )
+        else:
+            status = (
+                "missing"
+                if not path.exists(compiledPath)
+                else "ok" if verifyCompiledGraph(compiledPath, sourcePath) else "stale"
+            )
+            print(f"{compiledPath}: {status}")
+
+
+# Driver function
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,492 @@
+# Contraction hierarchy
+# Purpose: Preprocess a graph once so that repeated queries only search a few hundred edges. Municipalities
+# without a supercharger are contracted one at a time (least important first): each contracted municipality
+# is replaced by shortcut edges between its neighbors, unless a witness path that is at least as short
+# already exists. Supercharger municipalities are never contracted and form the core of the hierarchy.
+# A shortcut never passes a supercharger, so its charge use is just its length, and a witness through a
+# supercharger only leaves more charge. The distances ignore the car range, so one hierarchy serves every
+# TeslaModelRange; the range is only applied when querying:
+#   1. Upward searches from the origin and (backwards) from the destination, on a single charge
+#   2. A route that never recharges meets at the highest municipality both searches reached
+#   3. Otherwise Dijkstra's over the core: every core municipality recharges the car, so a core edge is
+#      usable whenever its length is within range
+# Hierarchies are saved next to the graph file (graphs/*.ch.npz) and reused while the graph is unchanged.
+# How to Run: python contractionHierarchy.py [graph.json ...]
+
+import argparse
+import glob
+import heapq
+import time
+from math import inf
+from os import path
+from typing import Optional
+from weakref import WeakKeyDictionary
+import numpy as np
+from compiledGraph import hashSourceFile, loadJSONGraph
+from definitions import (
+    PROJECT_ROOT,
+    Algorithm,
+    CSRGraph,
+    Graph,
+    Route,
+    RouteStop,
+    SPAlgorithm,
+)
+
+CONTRACTION_HIERARCHY_VERSION = 1
+
+# Witness searches give up after settling this many municipalities (and keep the shortcut)
+WITNESS_SETTLE_LIMIT = 500
+
+# Hierarchies already loaded for a graph
+_hierarchies: WeakKeyDictionary = WeakKeyDictionary()
+
+
+class ContractionHierarchy:
+    def __init__(
+        self,
+        csr: CSRGraph,
+        rank: np.ndarray,
+        sources: np.ndarray,
+        targets: np.ndarray,
+        weights: np.ndarray,
+        middles: np.ndarray,
+    ):
+        # rank[v] = contraction order (core municipalities come last). The edges are the original edges
+        # plus the shortcuts, one per (source, target) pair; middles[e] is the municipality a shortcut
+        # skips (-1 for original edges).
+        self.csr = csr
+        self.rank = rank
+        self.sources, self.targets, self.weights, self.middles = (
+            sources,
+            targets,
+            weights,
+            middles,
+        )
+        numMuni = len(csr)
+        self.isCore: list[bool] = [bool(c) for c in csr.hasSupercharger]
+        self.core: list[int] = [v for v in range(numMuni) if self.isCore[v]]
+        self.middle: dict[tuple[int, int], int] = {}
+        # up[u]: edges u -> w to higher ranked municipalities, down[w]: edges u -> w from higher ranked
+        # municipalities (stored as (u, weight)), core[u]: edges between two core municipalities
+        self.up: list[list[tuple[int, float]]] = [[] for _ in range(numMuni)]
+        self.down: list[list[tuple[int, float]]] = [[] for _ in range(numMuni)]
+        self.coreEdges: list[list[tuple[int, float]]] = [[] for _ in range(numMuni)]
+        rankList = rank.tolist()
+        for u, w, weight, middle in zip(
+            sources.tolist(), targets.tolist(), weights.tolist(), middles.tolist()
+        ):
+            if middle >= 0:
+                self.middle[u, w] = middle
+            if self.isCore[u] and self.isCore[w]:
+                self.coreEdges[u].append((w, weight))
+            elif rankList[u] < rankList[w]:
+                self.up[u].append((w, weight))
+            else:
+                self.down[w].append((u, weight))
+        # Non core municipalities from the highest rank down (the order of a downward sweep)
+        self.sweepOrder: list[int] = sorted(
+            (v for v in range(numMuni) if not self.isCore[v]),
+            key=lambda v: -rankList[v],
+        )
+        self.buildSeconds = 0.0
+
+    @property
+    def numShortcuts(self) -> int:
+        return int(np.count_nonzero(self.middles >= 0))
+
+    def _upwardSearch(
+        self, startingId: int, carRange: float, edges: list[list[tuple[int, float]]]
+    ) -> tuple[dict[int, float], dict[int, int]]:
+        # Dijkstra's over upward edges on one charge. Core municipalities are reached but not expanded
+        # (the car recharges there, which the core search handles).
+        distances: dict[int, float] = {startingId: 0}
+        previous: dict[int, int] = {}
+        heap: list[tuple[float, int]] = [(0, startingId)]
+        while heap:
+            distance, current = heapq.heappop(heap)
+            if distance > distances[current] or self.isCore[current]:
+                continue
+            for neighbor, weight in edges[current]:
+                newDistance = distance + weight
+                if newDistance <= carRange and newDistance < distances.get(
+                    neighbor, inf
+                ):
+                    distances[neighbor] = newDistance
+                    previous[neighbor] = current
+                    heapq.heappush(heap, (newDistance, neighbor))
+        return distances, previous
+
+    def query(
+        self, startingId: int, endingId: int, carRange: float
+    ) -> Optional[tuple[float, list[int]]]:
+        # Returns the route length and its municipality ids, or None if there is no route
+        forward, forwardPrevious = self._upwardSearch(startingId, carRange, self.up)
+        backward, backwardPrevious = self._upwardSearch(endingId, carRange, self.down)
+
+        # Routes on a single charge meet at the top of their up-down path
+        bestDistance, meeting = inf, -1
+        for muniId, distance in forward.items():
+            total = distance + backward.get(muniId, inf)
+            if total <= carRange and total < bestDistance:
+                bestDistance, meeting = total, muniId
+
+        # Routes through the core, entered with the forward distances and left with the backward ones
+        coreDistances: dict[int, float] = {}
+        corePrevious: dict[int, int] = {}
+        heap = [(forward[c], c) for c in self.core if c in forward]
+        for distance, c in heap:
+            coreDistances[c] = distance
+        heapq.heapify(heap)
+        lastCore = -1
+        while heap:
+            distance, current = heapq.heappop(heap)
+            if distance >= bestDistance:
+                break
+            if distance > coreDistances[current]:
+                continue
+            if distance + backward.get(current, inf) < bestDistance:
+                bestDistance, lastCore = distance + backward[current], current
+            for neighbor, weight in self.coreEdges[current]:
+                newDistance = distance + weight
+                if weight <= carRange and newDistance < coreDistances.get(
+                    neighbor, inf
+                ):
+                    coreDistances[neighbor] = newDistance
+                    corePrevious[neighbor] = current
+                    heapq.heappush(heap, (newDistance, neighbor))
+
+        if bestDistance == inf:
+            return None
+        # Hierarchy path: origin up to the meeting point (through the core), then down to the destination
+        path: list[int] = [meeting if lastCore < 0 else lastCore]
+        while lastCore >= 0 and path[-1] in corePrevious:
+            path.append(corePrevious[path[-1]])
+        while path[-1] != startingId:
+            path.append(forwardPrevious[path[-1]])
+        path.reverse()
+        while path[-1] != endingId:
+            path.append(backwardPrevious[path[-1]])
+        return bestDistance, self.unpack(path)
+
+    def unpack(self, path: list[int]) -> list[int]:
+        # Replace every shortcut with the municipalities it skips
+        unpacked: list[int] = [path[0]]
+        stack: list[int] = path[:0:-1]
+        while stack:
+            nextId = stack.pop()
+            middle = self.middle.get((unpacked[-1], nextId), -1)
+            if middle < 0:
+                unpacked.append(nextId)
+            else:
+                stack.append(nextId)
+                stack.append(middle)
+        return unpacked
+
+    def downwardSweep(self, distances: np.ndarray) -> np.ndarray:
+        # Extends distances down the hierarchy: every non core municipality (highest rank first) takes the
+        # best distance over its edges from higher ranked municipalities. Returns a new array.
+        distances = distances.copy()
+        for v in self.sweepOrder:
+            best = distances[v]
+            for u, weight in self.down[v]:
+                if distances[u] + weight < best:
+                    best = distances[u] + weight
+            distances[v] = best
+        return distances
+
+
+def contractGraph(csr: CSRGraph) -> ContractionHierarchy:
+    startTime = time.time()
+    numMuni = len(csr)
+    # Remaining (not yet contracted) graph, one weight per (source, target) pair
+    outEdges: list[dict[int, float]] = [{} for _ in range(numMuni)]
+    inEdges: list[dict[int, float]] = [{} for _ in range(numMuni)]
+    # Every edge of the hierarchy: (source, target) -> (weight, middle)
+    hierarchyEdges: dict[tuple[int, int], tuple[float, int]] = {}
+    for u in range(numMuni):
+        for w, weight in csr.getEdges(u):
+            if u != w and weight < outEdges[u].get(w, inf):
+                outEdges[u][w] = weight
+                inEdges[w][u] = weight
+                hierarchyEdges[u, w] = (weight, -1)
+
+    contracted = [False] * numMuni
+
+    def witnessDistances(source: int, skipped: int, limit: float) -> dict[int, float]:
+        # Dijkstra's from source in the remaining graph without the municipality being contracted
+        distances: dict[int, float] = {source: 0}
+        heap: list[tuple[float, int]] = [(0, source)]
+        settled = 0
+        while heap and settled < WITNESS_SETTLE_LIMIT:
+            distance, current = heapq.heappop(heap)
+            if distance > distances[current]:
+                continue
+            if distance > limit:
+                break
+            settled += 1
+            for neighbor, weight in outEdges[current].items():
+                newDistance = distance + weight
+                if neighbor != skipped and newDistance < distances.get(neighbor, inf):
+                    distances[neighbor] = newDistance
+                    heapq.heappush(heap, (newDistance, neighbor))
+        return distances
+
+    def shortcutsFor(v: int) -> list[tuple[int, int, float]]:
+        shortcuts: list[tuple[int, int, float]] = []
+        if not outEdges[v]:
+            return shortcuts
+        maxOut = max(outEdges[v].values())
+        for u, inWeight in inEdges[v].items():
+            witness = witnessDistances(u, v, inWeight + maxOut)
+            for w, outWeight in outEdges[v].items():
+                if w != u and witness.get(w, inf) > inWeight + outWeight:
+                    shortcuts.append((u, w, inWeight + outWeight))
+        return shortcuts
+
+    contractedNeighbors = [0] * numMuni
+
+    def priority(v: int) -> int:
+        # Edge difference (shortcuts added minus edges removed) plus contracted neighbors, so the
+        # contraction spreads evenly over the graph
+        return (
+            len(shortcutsFor(v))
+            - len(inEdges[v])
+            - len(outEdges[v])
+            + contractedNeighbors[v]
+        )
+
+    rank = np.zeros(numMuni, dtype=np.int32)
+    heap: list[tuple[int, int]] = [
+        (priority(v), v) for v in range(numMuni) if not csr.hasSupercharger[v]
+    ]
+    heapq.heapify(heap)
+    order = 0
+    while heap:
+        _, v = heapq.heappop(heap)
+        # Lazy update: contract v only if it is still the least important
+        current = priority(v)
+        if heap and current > heap[0][0]:
+            heapq.heappush(heap, (current, v))
+            continue
+
+        for u, w, weight in shortcutsFor(v):
+            if weight < outEdges[u].get(w, inf):
+                outEdges[u][w] = weight
+                inEdges[w][u] = weight
+                hierarchyEdges[u, w] = (weight, v)
+        for u in inEdges[v]:
+            del outEdges[u][v]
+            contractedNeighbors[u] += 1
+        for w in outEdges[v]:
+            del inEdges[w][v]
+            contractedNeighbors[w] += 1
+        contracted[v] = True
+        rank[v] = order
+        order += 1
+
+    # The core keeps the highest ranks
+    for v in range(numMuni):
+        if not contracted[v]:
+            rank[v] = order
+            order += 1
+
+    keys = list(hierarchyEdges.keys())
+    values = list(hierarchyEdges.values())
+    hierarchy = ContractionHierarchy(
+        csr,
+        rank,
+        np.array([u for u, _ in keys], dtype=np.int32),
+        np.array([w for _, w in keys], dtype=np.int32),
+        np.array([weight for weight, _ in values], dtype=np.float64),
+        np.array([middle for _, middle in values], dtype=np.int32),
+    )
+    hierarchy.buildSeconds = time.time() - startTime
+    return hierarchy
+
+
+def getHierarchyPath(sourcePath: str) -> str:
+    return f"{path.splitext(sourcePath)[0]}.ch.npz"
+
+
+def saveHierarchy(hierarchyPath: str, sourcePath: str, hierarchy: ContractionHierarchy):
+    sourceSize, sourceDigest = hashSourceFile(sourcePath)
+    np.savez(
+        hierarchyPath,
+        version=CONTRACTION_HIERARCHY_VERSION,
+        sourceSize=sourceSize,
+        sourceDigest=np.frombuffer(sourceDigest, dtype=np.uint8),
+        rank=hierarchy.rank,
+        sources=hierarchy.sources,
+        targets=hierarchy.targets,
+        weights=hierarchy.weights,
+        middles=hierarchy.middles,
+    )
+
+
+def loadHierarchy(
+    hierarchyPath: str, sourcePath: str, csr: CSRGraph
+) -> Optional[ContractionHierarchy]:
+    # Returns None if the file is missing, from another version or built from a different graph file
+    if not path.exists(hierarchyPath):
+        return None
+    sourceSize, sourceDigest = hashSourceFile(sourcePath)
+    with np.load(hierarchyPath) as data:
+        if (
+            int(data["version"]) != CONTRACTION_HIERARCHY_VERSION
+            or int(data["sourceSize"]) != sourceSize
+            or data["sourceDigest"].tobytes() != sourceDigest
+            or len(data["rank"]) != len(csr)
+        ):
+            return None
+        return ContractionHierarchy(
+            csr,
+            data["rank"],
+            data["sources"],
+            data["targets"],
+            data["weights"],
+            data["middles"],
+        )
+
+
+def getContractionHierarchy(graph: Graph) -> ContractionHierarchy:
+    # Built once per graph; read from (or written to) disk when the graph has a source file
+    csr: CSRGraph = graph.csr
+    if csr in _hierarchies:
+        return _hierarchies[csr]
+    hierarchy: Optional[ContractionHierarchy] = None
+    if graph.sourcePath is not None:
+        hierarchyPath = getHierarchyPath(graph.sourcePath)
+        hierarchy = loadHierarchy(hierarchyPath, graph.sourcePath, csr)
+        if hierarchy is None:
+            hierarchy = contractGraph(csr)
+            saveHierarchy(hierarchyPath, graph.sourcePath, hierarchy)
+    if hierarchy is None:
+        hierarchy = contractGraph(csr)
+    _hierarchies[csr] = hierarchy
+    return hierarchy
+
+
+def dropContractionHierarchy(csr: CSRGraph):
+    # The core of a hierarchy is the set of superchargers, so one cannot be patched when they change.
+    # The saved file is tied to the graph file's contents and is rebuilt on the next query.
+    _hierarchies.pop(csr, None)
+
+
+class ContractionHierarchyRouting(Algorithm):
+    @staticmethod
+    def getShortestPath(
+        startingCode: str, endingCode: str, carRange: int, graph: Graph
+    ) -> Optional[Route | float]:
+        hierarchy: ContractionHierarchy = getContractionHierarchy(graph)
+        startTime = time.time()
+        csr: CSRGraph = graph.csr
+        result = hierarchy.query(
+            csr.getNodeId(startingCode), csr.getNodeId(endingCode), carRange
+        )
+        if result is None:
+            print(
+                "No route between ",
+                startingCode,
+                " and ",
+                endingCode,
+                " exists with charge constraints.",
+            )
+            return None
+
+        _, muniIds = result
+        route: Route = Route(stops=[], algorithm=SPAlgorithm.CONTRACTION_HIERARCHY)
+        route.addStop(RouteStop(startingCode, 0))
+        for previous, muniId in zip(muniIds, muniIds[1:]):
+            route.addStop(
+                RouteStop(
+                    csr.getCode(muniId),
+                    min(w for t, w in csr.getEdges(previous) if t == muniId),
+                    bool(csr.hasSupercharger[muniId]),
+                )
+            )
+        print("Total algorithm time: ", time.time() - startTime)
+        return route
+
+    @staticmethod
+    def getAllShortestPaths(carRange: int, graph: Graph) -> list[list[float]]:
+        # Per source: a downward sweep from its upward search gives the single charge distances, and the
+        # core distances plus each core municipality's own single charge distances give the rest
+        hierarchy: ContractionHierarchy = getContractionHierarchy(graph)
+        startTime: float = time.time_ns()
+        numMuni = len(graph.csr)
+        core = hierarchy.core
+
+        def singleCharge(upward: dict[int, float]) -> np.ndarray:
+            distances = np.full(numMuni, inf)
+            for muniId, distance in upward.items():
+                distances[muniId] = distance
+            distances = hierarchy.downwardSweep(distances)
+            distances[distances > carRange] = inf
+            return distances
+
+        # fromCore[c][v] = distance from core municipality c to v on one charge
+        fromCore = np.array(
+            [
+                singleCharge(hierarchy._upwardSearch(c, carRange, hierarchy.up)[0])
+                for c in core
+            ]
+        ).reshape(len(core), numMuni)
+
+        result: list[list[float]] = []
+        for start in range(numMuni):
+            forward, _ = hierarchy._upwardSearch(start, carRange, hierarchy.up)
+            distances = singleCharge(forward)
+            if core:
+                # Dijkstra's over the core from the core municipalities the start reaches on one charge
+                coreDistances = {c: forward[c] for c in core if c in forward}
+                heap = [(distance, c) for c, distance in coreDistances.items()]
+                heapq.heapify(heap)
+                while heap:
+                    distance, current = heapq.heappop(heap)
+                    if distance > coreDistances[current]:
+                        continue
+                    for neighbor, weight in hierarchy.coreEdges[current]:
+                        if (
+                            weight <= carRange
+                            and distance + weight < coreDistances.get(neighbor, inf)
+                        ):
+                            coreDistances[neighbor] = distance + weight
+                            heapq.heappush(heap, (distance + weight, neighbor))
+                entry = np.array([coreDistances.get(c, inf) for c in core])
+                distances = np.minimum(
+                    distances, (entry[:, None] + fromCore).min(axis=0)
+                )
+            result.append(distances.tolist())
+        print(
+            f"Took {(time.time_ns()- startTime) / 10**9} seconds to find all shortest paths."
+        )
+        return result
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Precompute contraction hierarchies for the graphs"
+    )
+    parser.add_argument(
+        "graphs",
+        nargs="*",
+        help="JSON graph files (defaults to every graph in graphs/)",
+    )
+    args = parser.parse_args()
+
+    for sourcePath in args.graphs or sorted(
+        glob.glob(path.join(PROJECT_ROOT, "graphs", "*.json"))
+    ):
+        graph: Graph = loadJSONGraph(sourcePath)
+        hierarchy = contractGraph(graph.csr)
+        saveHierarchy(getHierarchyPath(sourcePath), sourcePath, hierarchy)
+        print(
+            f"{getHierarchyPath(sourcePath)}: {len(hierarchy.core)} core municipalities, "
+            f"{hierarchy.numShortcuts} shortcuts, built in {hierarchy.buildSeconds:.2f}s"
+        )
+
+
+# Driver function
+if __name__ == "__main__":
+    main()
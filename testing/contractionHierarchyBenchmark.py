@@ -0,0 +1,105 @@
+# Contraction hierarchy benchmark
+# Purpose: Report what the contraction hierarchy costs to build, save and load for a graph, then time
+# queries on random municipality pairs against Dijkstra.getShortestPath for each TeslaModelRange.
+# How to Run: python contractionHierarchyBenchmark.py [--graph ALL_NODES] [--pairs 500]
+
+import argparse
+import contextlib
+import io
+import os
+import random
+import tempfile
+import time
+from typing import Optional
+from definitions import CSRGraph, Graph, GraphType, Route, TeslaModelRange
+from contractionHierarchy import (
+    ContractionHierarchy,
+    contractGraph,
+    loadHierarchy,
+    saveHierarchy,
+)
+from dijkstra import Dijkstra
+from testSuite import getGraph
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare contraction hierarchy queries with Dijkstra's"
+    )
+    parser.add_argument(
+        "--graph",
+        choices=[graphType.name for graphType in GraphType],
+        default=GraphType.ALL_NODES.name,
+    )
+    parser.add_argument("--pairs", type=int, default=500, help="Random pairs per range")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    graphType: GraphType = GraphType[args.graph]
+    graph: Graph = getGraph(graphType)
+    csr: CSRGraph = graph.csr
+
+    # Preprocessing: contract, save and load back (in a temporary file, the saved hierarchy is kept as is)
+    hierarchy: ContractionHierarchy = contractGraph(csr)
+    print(
+        f"{graphType.name}: {len(csr)} municipalities, {csr.numEdges} edges, "
+        f"{len(hierarchy.core)} core municipalities"
+    )
+    print(
+        f"Preprocessing: {hierarchy.buildSeconds:.2f}s, {hierarchy.numShortcuts} shortcuts"
+    )
+    with tempfile.TemporaryDirectory() as directory:
+        hierarchyPath = os.path.join(directory, "graph.ch.npz")
+        startTime = time.time()
+        saveHierarchy(hierarchyPath, graph.sourcePath, hierarchy)
+        saveSeconds = time.time() - startTime
+        startTime = time.time()
+        loadHierarchy(hierarchyPath, graph.sourcePath, csr)
+        print(
+            f"Saved in {saveSeconds:.3f}s ({os.path.getsize(hierarchyPath) / 1024:.0f} KiB), "
+            f"loaded in {time.time() - startTime:.3f}s"
+        )
+
+    random.seed(args.seed)
+    pairs: list[tuple[int, int]] = [
+        (random.randrange(len(csr)), random.randrange(len(csr)))
+        for _ in range(args.pairs)
+    ]
+    print(
+        f"\n{'':>12} {'dijkstra ms':>12} {'hierarchy ms':>13} {'speedup':>8} "
+        f"{'found':>6} {'shorter':>8}"
+    )
+    for carRange in TeslaModelRange:
+        dijkstraSeconds = hierarchySeconds = 0.0
+        found = shorter = 0
+        for startingId, endingId in pairs:
+            startTime = time.time()
+            # Dijkstra's prints its own timings; keep the table readable
+            with contextlib.redirect_stdout(io.StringIO()):
+                route: Optional[Route] = Dijkstra.getShortestPath(
+                    csr.getCode(startingId),
+                    csr.getCode(endingId),
+                    carRange.value,
+                    graph,
+                )
+            dijkstraSeconds += time.time() - startTime
+
+            startTime = time.time()
+            result = hierarchy.query(startingId, endingId, carRange.value)
+            hierarchySeconds += time.time() - startTime
+
+            if result is not None:
+                found += 1
+                # Dijkstra's keeps one charge per municipality and can miss the shortest route
+                if route is None or result[0] < route.totalDistance - 1e-6:
+                    shorter += 1
+        print(
+            f"{carRange.name:>12} {1000 * dijkstraSeconds / len(pairs):>12.3f} "
+            f"{1000 * hierarchySeconds / len(pairs):>13.3f} "
+            f"{dijkstraSeconds / max(hierarchySeconds, 1e-9):>7.1f}x {found:>6} {shorter:>8}"
+        )
+
+
+# Driver function
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,7 @@
+from array import array
 from dataclasses import dataclass
 from enum import Enum
+import hashlib
 import os
 from pathlib import Path
 from os import path
@@ -8,19 +10,6 @@ from typing import List, Optional
 PROJECT_ROOT = str(path.dirname(Path(__file__).parent))
 TESTING_DIR = str(path.join(PROJECT_ROOT, "testing"))
 
-RESULT_MATRICES = [
-    path.join(PROJECT_ROOT, "testing", "resultChargeMatrix8.txt"),
-    path.join(PROJECT_ROOT, "testing", "resultChargeMatrix100.txt"),
-    path.join(PROJECT_ROOT, "testing", "resultChargeMatrix500.txt"),
-    path.join(PROJECT_ROOT, "testing", "resultChargeMatrix1000.txt"),
-    path.join(PROJECT_ROOT, "testing", "resultChargeMatrix2475.txt"),
-    path.join(PROJECT_ROOT, "testing", "resultMatrix8.txt"),
-    path.join(PROJECT_ROOT, "testing", "resultMatrix100.txt"),
-    path.join(PROJECT_ROOT, "testing", "resultMatrix500.txt"),
-    path.join(PROJECT_ROOT, "testing", "resultMatrix1000.txt"),
-    path.join(PROJECT_ROOT, "testing", "resultMatrix2475.txt"),
-]
-
 MATRIX_ARCHIVES = [
     path.join(PROJECT_ROOT, "archives", f"resultMatrices{x}.zip") for x in range(1, 6)
 ]
@@ -98,21 +87,211 @@ class Municipality:
         )
 
 
+# Compressed-sparse-row (CSR) view of a graph, addressed by integer node ids.
+# Node ids are the Municipality.index values, so row i of any result matrix is node i.
+# The edges of node i are targets[offsets[i]:offsets[i + 1]] (with matching weights).
+class CSRGraph:
+    def __init__(
+        self,
+        codes: list[str],
+        offsets: array,
+        targets: array,
+        weights: array,
+        hasSupercharger: bytearray,
+        lats: array,
+        lons: array,
+        names: Optional[list[str]] = None,
+        states: Optional[list[str]] = None,
+    ):
+        self.codes = codes
+        self.codeToId: dict[str, int] = {code: i for i, code in enumerate(codes)}
+        self.offsets = offsets
+        self.targets = targets
+        self.weights = weights
+        # Supercharger bitmap (one byte per node, 1 if the node has a supercharger)
+        self.hasSupercharger = hasSupercharger
+        self.lats = lats
+        self.lons = lons
+        self.names = names if names is not None else list(codes)
+        self.states = states if states is not None else [""] * len(codes)
+        self._reverse: Optional["CSRGraph"] = None
+        self._fingerprint: Optional[str] = None
+
+    def __len__(self):
+        return len(self.codes)
+
+    @staticmethod
+    def fromGraph(graph: "Graph") -> "CSRGraph":
+        numMuni = len(graph)
+        munis: list[Municipality] = [
+            graph.getMunicipalityByIndex(i) for i in range(numMuni)
+        ]
+        codes = [muni.code for muni in munis]
+        codeToId = {code: i for i, code in enumerate(codes)}
+
+        offsets = array("i", [0])
+        targets = array("i")
+        weights = array("d")
+        for muni in munis:
+            for edge in muni.edges:
+                targets.append(codeToId[edge.toMuniCode])
+                weights.append(edge.distance)
+            offsets.append(len(targets))
+
+        return CSRGraph(
+            codes,
+            offsets,
+            targets,
+            weights,
+            bytearray(1 if muni.hasSupercharger else 0 for muni in munis),
+            array("d", [muni.lat for muni in munis]),
+            array("d", [muni.lon for muni in munis]),
+            [muni.name for muni in munis],
+            [muni.state for muni in munis],
+        )
+
+    def toMunicipalities(self) -> dict[str, Municipality]:
+        # Rebuild the code-keyed Municipality objects (in node id order)
+        codes, offsets, targets, weights = (
+            self.codes,
+            self.offsets,
+            self.targets,
+            self.weights,
+        )
+        return {
+            code: Municipality(
+                i,
+                self.names[i],
+                self.states[i],
+                code,
+                self.lats[i],
+                self.lons[i],
+                bool(self.hasSupercharger[i]),
+                [
+                    {
+                        "fromMuniCode": code,
+                        "toMuniCode": codes[targets[e]],
+                        "distance": weights[e],
+                    }
+                    for e in range(offsets[i], offsets[i + 1])
+                ],
+            )
+            for i, code in enumerate(codes)
+        }
+
+    def getNodeId(self, muniCode: str) -> int:
+        return self.codeToId[muniCode]
+
+    def getCode(self, nodeId: int) -> str:
+        return self.codes[nodeId]
+
+    def getEdges(self, nodeId: int) -> list[tuple[int, float]]:
+        start, end = self.offsets[nodeId], self.offsets[nodeId + 1]
+        return list(zip(self.targets[start:end], self.weights[start:end]))
+
+    @property
+    def numEdges(self) -> int:
+        return len(self.targets)
+
+    @property
+    def fingerprint(self) -> str:
+        # SHA-256 of the routing content (codes, edges, superchargers), computed once. The same graph
+        # gives the same fingerprint whether it was loaded from JSON or from a compiled file.
+        if self._fingerprint is None:
+            digest = hashlib.sha256()
+            digest.update("\0".join(self.codes).encode())
+            for section in (self.offsets, self.targets, self.weights):
+                digest.update(memoryview(section).cast("B"))
+            digest.update(bytes(self.hasSupercharger))
+            self._fingerprint = digest.hexdigest()
+        return self._fingerprint
+
+    def setSuperchargers(self, hasSupercharger: bytearray):
+        # Replaces the supercharger bitmap (shared with the reversed graph); the fingerprint changes with it
+        self.hasSupercharger = hasSupercharger
+        self._fingerprint = None
+        if self._reverse is not None:
+            self._reverse.hasSupercharger = hasSupercharger
+            self._reverse._fingerprint = None
+
+    def reverse(self) -> "CSRGraph":
+        # Same nodes with every edge flipped (the edges of node i are the edges into i), built once
+        if self._reverse is not None:
+            return self._reverse
+        numMuni = len(self)
+        incoming: list[list[tuple[int, float]]] = [[] for _ in range(numMuni)]
+        for i in range(numMuni):
+            for e in range(self.offsets[i], self.offsets[i + 1]):
+                incoming[self.targets[e]].append((i, self.weights[e]))
+
+        offsets = array("i", [0])
+        targets = array("i")
+        weights = array("d")
+        for i in range(numMuni):
+            for source, weight in incoming[i]:
+                targets.append(source)
+                weights.append(weight)
+            offsets.append(len(targets))
+
+        self._reverse = CSRGraph(
+            self.codes,
+            offsets,
+            targets,
+            weights,
+            self.hasSupercharger,
+            self.lats,
+            self.lons,
+            self.names,
+            self.states,
+        )
+        self._reverse._reverse = self
+        return self._reverse
+
+
 # Graph class (for easy access to graph data)
+# Either built from Municipality objects (JSON graphs) or from a CSRGraph (compiled graphs),
+# in which case the Municipality objects are only created if a code-keyed accessor needs them.
 class Graph:
-    def __init__(self, graphData: dict[str, Municipality]):
-        self.graphData = graphData
-        self.indexToMuni = {muni.index: muni for muni in self.allMunicipalities}
+    def __init__(
+        self,
+        graphData: Optional[dict[str, Municipality]] = None,
+        csr: Optional[CSRGraph] = None,
+    ):
+        if graphData is None and csr is None:
+            raise ValueError("Graph needs either municipalities or a CSR graph")
+        self._graphData = graphData
+        self._indexToMuni: Optional[dict[int, Municipality]] = None
+        self._allMunicipalityCodes: Optional[frozenset[str]] = None
+        self._csr: Optional[CSRGraph] = csr
+        # Path of the file the graph was loaded from (if any)
+        self.sourcePath: Optional[str] = None
 
     def __len__(self):
-        return len(self.graphData)
+        return len(self._graphData) if self._graphData is not None else len(self._csr)
 
     def __getitem__(self, key: str) -> Municipality:
         return self.graphData[key]
 
     @property
-    def allMunicipalityCodes(self) -> set[str]:
-        return set(self.graphData.keys())
+    def graphData(self) -> dict[str, Municipality]:
+        if self._graphData is None:
+            self._graphData = self._csr.toMunicipalities()
+        return self._graphData
+
+    @property
+    def indexToMuni(self) -> dict[int, Municipality]:
+        if self._indexToMuni is None:
+            self._indexToMuni = {muni.index: muni for muni in self.allMunicipalities}
+        return self._indexToMuni
+
+    @property
+    def allMunicipalityCodes(self) -> frozenset[str]:
+        # Built once (the municipalities of a graph never change after loading)
+        if self._allMunicipalityCodes is None:
+            self._allMunicipalityCodes = frozenset(
+                self._csr.codes if self._graphData is None else self._graphData
+            )
+        return self._allMunicipalityCodes
 
     @property
     def allMunicipalities(self) -> list[Municipality]:
@@ -124,6 +303,12 @@ class Graph:
     def getMunicipality(self, muniCode: str) -> Municipality:
         return self.graphData[muniCode]
 
+    def getMunicipalityName(self, muniCode: str) -> str:
+        # Read from the CSR string table when the Municipality objects were never built
+        if self._graphData is None:
+            return self._csr.names[self._csr.getNodeId(muniCode)]
+        return self.graphData[muniCode].name
+
     def getMunicipalityByIndex(self, index: int) -> Municipality:
         return self.indexToMuni.get(index, None)
 
@@ -136,6 +321,20 @@ class Graph:
     def getMunicipalityHasSupercharger(self, muniCode: str) -> bool:
         return self.graphData[muniCode].hasSupercharger
 
+    # Array-backed view used by the search algorithms (built once, on first use)
+    @property
+    def csr(self) -> CSRGraph:
+        if self._csr is None:
+            self._csr = CSRGraph.fromGraph(self)
+        return self._csr
+
+    def setSuperchargers(self, hasSupercharger: bytearray):
+        # New supercharger flags (one byte per node id) for the CSR arrays and any Municipality objects
+        self.csr.setSuperchargers(hasSupercharger)
+        if self._graphData is not None:
+            for muni in self._graphData.values():
+                muni.hasSupercharger = bool(hasSupercharger[muni.index])
+
 
 # Dataclasses for Route and RouteStop (for printing shortest path)
 @dataclass
@@ -153,6 +352,11 @@ class SPAlgorithm(str, Enum):
     DIJKSTRA = "Dijkstras"
     A_STAR = "A*"
     FLOYD_WARSHALL = "Floyd Warshall"
+    BIDIRECTIONAL_DIJKSTRA = "Bidirectional Dijkstras"
+    CHARGE_STATE_DIJKSTRA = "Charge State Dijkstras"
+    SUPERCHARGER_OVERLAY = "Supercharger Overlay"
+    CONTRACTION_HIERARCHY = "Contraction Hierarchy"
+    MULTI_RANGE_DIJKSTRA = "Multi Range Dijkstras"
 
 
 class GraphType(str, Enum):
@@ -163,6 +367,26 @@ class GraphType(str, Enum):
     ONE_HUNDRED_NODES = "One hundred nodes in the graph"
 
 
+# JSON source file of each GraphType (compiled graphs sit next to them, see compiledGraph.py)
+GRAPH_FILES: dict[GraphType, str] = {
+    GraphType.ALL_NODES: path.join(
+        PROJECT_ROOT, "graphs", "allMunicipalitiesGraph.json"
+    ),
+    GraphType.EIGHT_NODES: path.join(
+        PROJECT_ROOT, "graphs", "eightMunicipalitiesGraph.json"
+    ),
+    GraphType.FIVE_HUNDRED_NODES: path.join(
+        PROJECT_ROOT, "graphs", "random500Munis.json"
+    ),
+    GraphType.ONE_THOUSAND_NODES: path.join(
+        PROJECT_ROOT, "graphs", "random1000Munis.json"
+    ),
+    GraphType.ONE_HUNDRED_NODES: path.join(
+        PROJECT_ROOT, "graphs", "100MunicipalitiesGraph.json"
+    ),
+}
+
+
 # Dataclass for TestCase (to be used in testSuite.py)
 @dataclass
 class TestCase:
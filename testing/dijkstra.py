@@ -4,63 +4,232 @@
 # Team - Baby Yoda
 
 import heapq
+import os
+from array import array
+from multiprocessing import Pool
+from multiprocessing.shared_memory import SharedMemory
 from typing import Optional
-from definitions import Algorithm, Graph, Route, RouteStop, SPAlgorithm, Municipality
+from definitions import Algorithm, CSRGraph, Graph, Route, RouteStop, SPAlgorithm
+from shortestPathTrees import ShortestPathTree, ShortestPathTreeCache
 import time
 
+# Graphs smaller than this are always solved in the calling process (pool startup costs more)
+PARALLEL_MIN_NODES = 256
+
+# Shared memory views attached by each pool worker (see _initWorker)
+_workerCSR: Optional[CSRGraph] = None
+_workerCarRange: int = 0
+_workerResult: Optional[memoryview] = None
+_workerBlocks: list[SharedMemory] = []
+
 
 class Dijkstra(Algorithm):
     @staticmethod
     def getShortestPath(
-        startingCode: str, endingCode: str, carRange: int, graph: Graph
+        startingCode: str,
+        endingCode: str,
+        carRange: int,
+        graph: Graph,
+        treeCache: Optional[ShortestPathTreeCache] = None,
     ) -> Optional[Route | float]:
         startTime = time.time()
 
-        # Create empty dictionary to keep track of distances to other municipalities
-        distances = {}
-        # Empty dictionary to store the previous municipality, so we can trace the the path back from the starting municipality
-        previousShortestDistMuni = {}
-        prevMostChargedMuni = {}
-        # Empty dictionary to store if the municipality was charged at
-        charged = {}
-        # Dictionary to store max charge at each municipality
-        maxCharge = {}
-        # Boolean to check if at least one path exists
-        atLeastOnePath = False
-
-        # Set all distances to infinity
-        for node in graph.allMunicipalityCodes:
-            distances[node] = float("inf")
-            maxCharge[node] = -1
+        csr: CSRGraph = graph.csr
+        startingId: int = csr.getNodeId(startingCode)
+        endingId: int = csr.getNodeId(endingCode)
+
+        if treeCache is None:
+            # Stop as soon as the ending municipality is settled (its distance and path cannot change after that)
+            distances, maxCharge, previousShortestDistMuni = Dijkstra._search(
+                csr, startingId, carRange, endingId
+            )
+        else:
+            # Reuse (or search and keep) the full shortest path tree of the starting municipality
+            tree: Optional[ShortestPathTree] = treeCache.get(csr, startingId, carRange)
+            if tree is None:
+                tree = treeCache.put(
+                    csr,
+                    startingId,
+                    carRange,
+                    *Dijkstra._search(csr, startingId, carRange),
+                )
+            distances, maxCharge, previousShortestDistMuni = (
+                tree.distances,
+                tree.maxCharge,
+                tree.previous,
+            )
+
+        # The ending municipality is only reached if at least one path exists
+        if distances[endingId] == float("inf"):
+            # If the ending municipality is not found, then return None
+            print(
+                "No route between ",
+                startingCode,
+                " and ",
+                endingCode,
+                " exists with charge constraints.",
+            )
+            return None
+
+        shortestRoute: Route = Dijkstra._buildRoute(
+            csr, startingId, endingId, distances, previousShortestDistMuni
+        )
+
+        # Now store max range at each municipality
+        print("Max charge at destination: ", maxCharge[endingId])
+        print("Total algorithm time: ", time.time() - startTime)
+
+        return shortestRoute
+
+    @staticmethod
+    def getAllShortestPaths(
+        carRange: int,
+        graph: Graph,
+        workers: Optional[int] = None,
+        chunkSize: Optional[int] = None,
+    ) -> list[list[float]]:
+        # Run Dijkstra's on each node in the graph, assembling a matrix of, for each node, the shortest distances for that node.
+        # Sources are split over a pool of worker processes (workers defaults to the number of cores,
+        # chunkSize to about four chunks per worker); workers=1 runs everything in this process.
+        startTime: float = time.time_ns()
+        csr: CSRGraph = graph.csr
+        numMuni = len(csr)
+        workers = workers or os.cpu_count() or 1
+
+        if workers <= 1 or numMuni < PARALLEL_MIN_NODES:
+            # Node ids are the municipality indexes, so each row is already in index order
+            result: list[list[float]] = [
+                Dijkstra._search(csr, i, carRange)[0] for i in range(numMuni)
+            ]
+        else:
+            result = Dijkstra._getAllShortestPathsParallel(
+                carRange, csr, workers, chunkSize
+            )
+
+        print(
+            f"Took {(time.time_ns()- startTime) / 10**9} seconds to find all shortest paths."
+        )
+        return result
+
+    @staticmethod
+    def _getAllShortestPathsParallel(
+        carRange: int, csr: CSRGraph, workers: int, chunkSize: Optional[int]
+    ) -> list[list[float]]:
+        # The CSR arrays are copied once into a shared memory block that every worker maps read-only,
+        # and each worker writes its rows straight into a shared (numMuni x numMuni) float64 matrix,
+        # so only (start, end) source ranges travel through the pool.
+        numMuni = len(csr)
+        chunkSize = chunkSize or max(1, numMuni // (workers * 4))
+        chunks = [
+            (start, min(start + chunkSize, numMuni))
+            for start in range(0, numMuni, chunkSize)
+        ]
+
+        graphBlock = _shareCSR(csr)
+        resultBlock = SharedMemory(create=True, size=8 * numMuni * numMuni)
+        try:
+            with Pool(
+                processes=min(workers, len(chunks)),
+                initializer=_initWorker,
+                initargs=(
+                    graphBlock.name,
+                    resultBlock.name,
+                    numMuni,
+                    csr.numEdges,
+                    carRange,
+                ),
+            ) as pool:
+                for _ in pool.imap_unordered(_solveSources, chunks):
+                    pass
+
+            matrix = resultBlock.buf.cast("d")
+            result: list[list[float]] = [
+                matrix[i * numMuni : (i + 1) * numMuni].tolist() for i in range(numMuni)
+            ]
+            matrix.release()
+            return result
+        finally:
+            for block in (graphBlock, resultBlock):
+                block.close()
+                block.unlink()
+
+    @staticmethod
+    def _buildRoute(
+        csr: CSRGraph,
+        startingId: int,
+        endingId: int,
+        distances: list[float],
+        previousShortestDistMuni: list[int],
+    ) -> Route:
+        # Follows the previous municipalities of a _search back from endingId (which must be reachable)
+        shortestRoute: Route = Route(stops=[], algorithm=SPAlgorithm.DIJKSTRA)
+        currentId = endingId
+        # First minimize the distance to the ending municipality
+        while currentId != startingId:
+            shortestRoute.addStop(
+                RouteStop(
+                    csr.getCode(currentId),
+                    distances[currentId],
+                    bool(csr.hasSupercharger[currentId]),
+                )
+            )
+            currentId = previousShortestDistMuni[currentId]
+        shortestRoute.addStop(RouteStop(csr.getCode(startingId), 0))
+        shortestRoute.reverse()
+
+        currentDistance = 0
+        # Update to have per-edge distances (specific to Dijkstra's)
+        for i in range(len(shortestRoute.stops)):
+            shortestRoute.stops[i].distance = (
+                distances[csr.getNodeId(shortestRoute.stops[i].muniCode)]
+                - currentDistance
+            )
+            currentDistance += shortestRoute.stops[i].distance
+
+        return shortestRoute
+
+    @staticmethod
+    def _search(
+        csr: CSRGraph, startingId: int, carRange: int, endingId: Optional[int] = None
+    ) -> tuple[list[float], list[float], list[int]]:
+        # Charge-aware Dijkstra's from one node over the CSR arrays.
+        # Returns the distance, max charge and previous (shortest distance) node id per node id.
+        # With an endingId the search stops the first time that node is popped; entries popped later
+        # are never shorter, so its distance and previous chain are already final.
+        offsets, targets, weights = csr.offsets, csr.targets, csr.weights
+        hasSupercharger = csr.hasSupercharger
+        numMuni = len(csr)
+
+        # Set all distances to infinity (and no known previous municipality)
+        distances: list[float] = [float("inf")] * numMuni
+        maxCharge: list[float] = [-1] * numMuni
+        previousShortestDistMuni: list[int] = [-1] * numMuni
 
         # Set starting municipality distance to zero and charge to full
-        distances[startingCode] = 0
-        maxCharge[startingCode] = carRange
+        distances[startingId] = 0
+        maxCharge[startingId] = carRange
 
         # Add the starting municipality to the minimum priority queue
-        minPriorityQ: list[tuple[float, str, float]] = [(0, startingCode, carRange)]
+        minPriorityQ: list[tuple[float, int, float]] = [(0, startingId, carRange)]
 
         # Keep looping until min priority queue is empty
         while minPriorityQ:
             # Pop off municipality that has the lowest current distance from the queue
-            currentDist, currentMuni, currentRange = heapq.heappop(minPriorityQ)
+            currentDist, currentId, currentRange = heapq.heappop(minPriorityQ)
+            if currentId == endingId:
+                break
 
             # If the current distance is not better than the distance already found
             # and if the current available charge is <= the max charge at the municipality, continue
             if (
-                currentDist > distances[currentMuni]
-                and currentMuni in maxCharge
-                and maxCharge[currentMuni] > currentRange
+                currentDist > distances[currentId]
+                and maxCharge[currentId] > currentRange
             ):
                 continue
 
-            # If it is the ending municipality, then continue
-            if currentMuni == endingCode:
-                atLeastOnePath = True
-
             # Loop through the neighbor municipalities of the current municipality
-            for edge in graph.getMunicipalityEdges(currentMuni):
-                neighborMuni, addedEdge = edge.toMuniCode, edge.distance
+            for e in range(offsets[currentId], offsets[currentId + 1]):
+                neighborId, addedEdge = targets[e], weights[e]
 
                 # Subtract the distance to the neighbor and update the range
                 updatedRange: float = currentRange - addedEdge
@@ -70,155 +239,87 @@ class Dijkstra(Algorithm):
                     continue
 
                 # If the neighbor municipality has a Supercharger then reset the range back to full
-                if graph.getMunicipalityHasSupercharger(neighborMuni):
-                    charged[neighborMuni] = True
+                if hasSupercharger[neighborId]:
                     updatedRange = carRange
-                else:
-                    charged[neighborMuni] = False
                 distance = currentDist + addedEdge
 
                 # If the distance with the added edge is shorter than the shortest distance we have so far, then update the distance to the new shortest distance
                 if (
-                    distance < distances[neighborMuni]
-                    or updatedRange > maxCharge[neighborMuni]
+                    distance < distances[neighborId]
+                    or updatedRange > maxCharge[neighborId]
                 ):
-                    if updatedRange > maxCharge[neighborMuni]:
-                        maxCharge[neighborMuni] = updatedRange
-                        prevMostChargedMuni[neighborMuni] = currentMuni
+                    if updatedRange > maxCharge[neighborId]:
+                        maxCharge[neighborId] = updatedRange
 
-                    if distance < distances[neighborMuni]:
-                        distances[neighborMuni] = distance
-                        previousShortestDistMuni[neighborMuni] = currentMuni
+                    if distance < distances[neighborId]:
+                        distances[neighborId] = distance
+                        previousShortestDistMuni[neighborId] = currentId
 
                     # Push the updated distance and range for the municipality onto the queue
-                    heapq.heappush(minPriorityQ, (distance, neighborMuni, updatedRange))
-
-        if not atLeastOnePath:
-            # If the ending municipality is not found, then return None
-            print(
-                "No route between ",
-                startingCode,
-                " and ",
-                endingCode,
-                " exists with charge constraints.",
-            )
-            return None
-
-        shortestRoute: Route = Route(stops=[], algorithm=SPAlgorithm.DIJKSTRA)
-        currentMuni = endingCode
-        # First minimize the distance to the ending municipality
-        while currentMuni != startingCode:
-            shortestRoute.addStop(
-                RouteStop(currentMuni, distances[currentMuni], charged[currentMuni])
-            )
-            currentMuni = previousShortestDistMuni[currentMuni]
-        shortestRoute.addStop(RouteStop(startingCode, 0))
-        shortestRoute.reverse()
-
-        # Now store max range at each municipality
-        print("Max charge at destination: ", maxCharge[endingCode])
-        print("Total algorithm time: ", time.time() - startTime)
-
-        currentDistance = 0
-        # Update to have per-edge distances (specific to Dijkstra's)
-        for i in range(len(shortestRoute.stops)):
-            shortestRoute.stops[i].distance = (
-                distances[shortestRoute.stops[i].muniCode] - currentDistance
-            )
-            currentDistance += shortestRoute.stops[i].distance
-
-        return shortestRoute
-
-    @staticmethod
-    def getAllShortestPaths(carRange: int, graph: Graph) -> list[list[float]]:
-        # Run Dijkstra's on each node in the graph, assembling a matrix of, for each node, the shortest distances for that node
-        startTime: float = time.time_ns()
-        result: list[list[float]] = []
-
-        for i in range(len(graph)):
-            # Get the current node to get all distances from
-            curMuni: Municipality = graph.getMunicipalityByIndex(i)
-            startingCode: str = curMuni.code
-
-            # Create empty dictionary to keep track of distances to other municipalities
-            distances = {}
-            # Empty dictionary to store if the municipality was charged at
-            charged = {}
-            # Dictionary to store max charge at each municipality
-            maxCharge = {}
-
-            # Set all distances to infinity
-            for node in graph.allMunicipalityCodes:
-                distances[node] = float("inf")
-                maxCharge[node] = -1
-
-            # Set starting municipality distance to zero and charge to full
-            distances[startingCode] = 0
-            maxCharge[startingCode] = carRange
-
-            # Add the starting municipality to the minimum priority queue
-            minPriorityQ: list[tuple[float, str, float]] = [(0, startingCode, carRange)]
-
-            # Keep looping until min priority queue is empty
-            while minPriorityQ:
-                # Pop off municipality that has the lowest current distance from the queue
-                currentDist, currentMuni, currentRange = heapq.heappop(minPriorityQ)
-
-                # If the current distance is not better than the distance already found
-                # and if the current available charge is <= the max charge at the municipality, continue
-                if (
-                    currentDist > distances[currentMuni]
-                    and currentMuni in maxCharge
-                    and maxCharge[currentMuni] > currentRange
-                ):
-                    continue
-
-                # Loop through the neighbor municipalities of the current municipality
-                for edge in graph.getMunicipalityEdges(currentMuni):
-                    neighborMuni, addedEdge = edge.toMuniCode, edge.distance
-
-                    # Subtract the distance to the neighbor and update the range
-                    updatedRange: float = currentRange - addedEdge
-
-                    # If the added edge does not cause the range to be exceeded, then add the edge
-                    if updatedRange < 0:
-                        continue
-
-                    # If the neighbor municipality has a Supercharger then reset the range back to full
-                    if graph.getMunicipalityHasSupercharger(neighborMuni):
-                        charged[neighborMuni] = True
-                        updatedRange = carRange
-                    else:
-                        charged[neighborMuni] = False
-                    distance = currentDist + addedEdge
-
-                    # If the distance with the added edge is shorter than the shortest distance we have so far, then update the distance to the new shortest distance
-                    if (
-                        distance < distances[neighborMuni]
-                        or updatedRange > maxCharge[neighborMuni]
-                    ):
-                        if updatedRange > maxCharge[neighborMuni]:
-                            maxCharge[neighborMuni] = updatedRange
-
-                        if distance < distances[neighborMuni]:
-                            distances[neighborMuni] = distance
-
-                        # Push the updated distance and range for the municipality onto the queue
-                        heapq.heappush(
-                            minPriorityQ, (distance, neighborMuni, updatedRange)
-                        )
-
-            curMuniResults: list[float] = []
-            for j in range(len(graph)):
-                # Get the node by the index
-                code = graph.getMunicipalityByIndex(j).code
-                curMuniResults.append(distances[code])
-            result.append(curMuniResults)
-
-        print(
-            f"Took {(time.time_ns()- startTime) / 10**9} seconds to find all shortest paths."
+                    heapq.heappush(minPriorityQ, (distance, neighborId, updatedRange))
+
+        return distances, maxCharge, previousShortestDistMuni
+
+
+# Layout of a CSR graph in shared memory: offsets (int32 x N+1), targets (int32 x M),
+# weights (float64 x M), hasSupercharger (uint8 x N), each section 8 byte aligned
+def _sharedSections(numMuni: int, numEdges: int) -> list[tuple[str, str, int, int]]:
+    sections = []
+    cursor = 0
+    for name, fmt, size in (
+        ("offsets", "i", 4 * (numMuni + 1)),
+        ("targets", "i", 4 * numEdges),
+        ("weights", "d", 8 * numEdges),
+        ("hasSupercharger", "B", numMuni),
+    ):
+        sections.append((name, fmt, cursor, cursor + size))
+        cursor = (cursor + size + 7) & ~7
+    return sections
+
+
+def _shareCSR(csr: CSRGraph) -> SharedMemory:
+    sections = _sharedSections(len(csr), csr.numEdges)
+    block = SharedMemory(create=True, size=max(1, sections[-1][3]))
+    for name, fmt, start, end in sections:
+        block.buf[start:end] = array(fmt, getattr(csr, name)).tobytes()
+    return block
+
+
+def _initWorker(
+    graphName: str, resultName: str, numMuni: int, numEdges: int, carRange: int
+):
+    # Attach to the shared graph and result matrix once per worker process
+    global _workerCSR, _workerCarRange, _workerResult, _workerBlocks
+    graphBlock, resultBlock = SharedMemory(name=graphName), SharedMemory(
+        name=resultName
+    )
+    views = {
+        name: graphBlock.buf[start:end].cast(fmt)
+        for name, fmt, start, end in _sharedSections(numMuni, numEdges)
+    }
+    # Only the arrays are needed by _search (codes are just placeholders for len())
+    _workerCSR = CSRGraph(
+        [""] * numMuni,
+        views["offsets"],
+        views["targets"],
+        views["weights"],
+        views["hasSupercharger"],
+        array("d"),
+        array("d"),
+    )
+    _workerCarRange = carRange
+    _workerResult = resultBlock.buf.cast("d")
+    _workerBlocks = [graphBlock, resultBlock]
+
+
+def _solveSources(chunk: tuple[int, int]) -> int:
+    start, end = chunk
+    numMuni = len(_workerCSR)
+    for i in range(start, end):
+        _workerResult[i * numMuni : (i + 1) * numMuni] = array(
+            "d", Dijkstra._search(_workerCSR, i, _workerCarRange)[0]
         )
-        return result
+    return end - start
 
 
 # # Function to print the shortest path from one municipality to another using the information gathered from running Dijkstra's Algorithm
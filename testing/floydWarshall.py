@@ -1,6 +1,24 @@
 import time
+from os import path
 from typing import Optional
-from definitions import Algorithm, Graph, Municipality, Route
+import numpy as np
+from definitions import Algorithm, CSRGraph, Graph, Route, TestCase, TESTING_DIR
+from resultMatrices import (
+    CHARGE_MATRIX,
+    DISTANCE_MATRIX,
+    getMatrixPath,
+    hasBinaryMatrices,
+    readMatrixCell,
+    readMatrixRow,
+    readTextRow,
+    readTextRows,
+    saveMatrix,
+)
+
+# The original triple loop was run twice, so later middle nodes can improve earlier ones
+FLOYD_WARSHALL_PASSES = 2
+# Rows updated at once in tiled mode (keeps each temporary around a megabyte on 2475 nodes)
+FLOYD_WARSHALL_BLOCK_SIZE = 64
 
 
 class FloydWarshall(Algorithm):
@@ -10,107 +28,315 @@ class FloydWarshall(Algorithm):
     ) -> Optional[Route | float]:
         startTime = time.time()
 
-        # # Make adjacency matrix with all infinity values
-        # numMuni: int = len(graph)
-        # adjMatrix: list[list[float]] = [
-        #     [float("inf")] * numMuni for _ in range(numMuni)
-        # ]
-        # remChargeMatrix: list[list[float]] = [[-1] * numMuni for _ in range(numMuni)]
-
-        # # Set 0 for cells on the diagonal
-        # for i in range(numMuni):
-        #     adjMatrix[i][i] = 0
-        #     remChargeMatrix[i][i] = carRange
-
-        # # Fill adjMatrix with known values
-        # for muni in graph.allMunicipalities:
-        #     index = muni.index
-        #     for edge in muni.edges:
-        #         neighborIndex = graph[edge.toMuniCode].index
-        #         adjMatrix[index][neighborIndex] = edge.distance
-        #         remChargeMatrix[index][neighborIndex] = carRange - edge.distance
-
-        # # Start of Floyd Warshall's algorithm
-        # for _ in range(2):
-        #     for i in range(numMuni):
-        #         for j in range(numMuni):
-        #             for k in range(numMuni):
-        #                 chargeLostToI: float = carRange - remChargeMatrix[j][i]
-        #                 chargeLostFromI: float = carRange - remChargeMatrix[i][k]
-        #                 totalChargeLost: float = chargeLostToI + chargeLostFromI
-
-        #                 # If the middle node has a super charger, only cost is from i to k
-        #                 if graph.getMunicipalityByIndex(i).hasSupercharger:
-        #                     totalChargeLost = chargeLostFromI
-
-        #                 if (
-        #                     (adjMatrix[j][i] + adjMatrix[i][k] < adjMatrix[j][k])
-        #                     and carRange >= chargeLostToI
-        #                     and carRange >= totalChargeLost
-        #                 ):
-        #                     adjMatrix[j][k] = adjMatrix[j][i] + adjMatrix[i][k]
-        #                     remChargeMatrix[j][k] = max(remChargeMatrix[j][k], carRange - totalChargeLost)
-
-        # with open("resultMatrix8.txt", "w") as file:
-        #     for row in adjMatrix:
-        #         file.write(" ".join(map(str, row)) + "\n")
-
-        # with open("resultChargeMatrix8.txt", "w") as file:
-        #     for row in remChargeMatrix:
-        #         file.write(" ".join(map(str, row)) + "\n")
-
-        adjRow = []
-        remChargeRow = []
-        filename = f"resultMatrix{len(graph)}.txt"
-        with open(filename, "r") as file:
-            i = 0
-            for line in file:
-                # Only extract the ith row
-                if i == graph[startingCode].index:
-                    adjRow = list(map(float, line.strip().split()))
-                    break
-                i += 1
-
-        filename = f"resultChargeMatrix{len(graph)}.txt"
-        with open(filename, "r") as file:
-            i = 0
-            for line in file:
-                # Only extract the ith row
-                if i == graph[startingCode].index:
-                    remChargeRow = list(map(float, line.strip().split()))
-                    break
-                i += 1
+        csr: CSRGraph = graph.csr
+        startId: int = csr.getNodeId(startingCode)
+        endId: int = csr.getNodeId(endingCode)
 
-        # Finding a route is not possible, as optimizes for charge, not distance
-        startMuni: Municipality = graph[startingCode]
-        endMuni: Municipality = graph[endingCode]
+        numMuni: int = len(csr)
+        if hasBinaryMatrices(numMuni):
+            # Memory mapped .npy matrices, only the one cell is read
+            distance = readMatrixCell(DISTANCE_MATRIX, numMuni, startId, endId)
+            remCharge = readMatrixCell(CHARGE_MATRIX, numMuni, startId, endId)
+        else:
+            # Text matrices, only the one row is read (through the row offset index)
+            textPath = getMatrixPath(DISTANCE_MATRIX, numMuni, binary=False)
+            if not path.exists(textPath):
+                raise FileNotFoundError(
+                    f"No result matrices for {numMuni} municipalities, compute them with FloydWarshall.saveMatrices."
+                )
+            distance = readTextRow(textPath, startId)[endId]
+            remCharge = readTextRow(
+                getMatrixPath(CHARGE_MATRIX, numMuni, binary=False), startId
+            )[endId]
 
-        if adjRow[endMuni.index] == float("inf") or remChargeRow[endMuni.index] < 0:
+        # Finding a route is not possible, as optimizes for charge, not distance
+        if distance == float("inf") or remCharge < 0:
             print(
                 "No route between ",
-                startMuni.code,
+                startingCode,
                 " and ",
-                endMuni.code,
+                endingCode,
                 " exists with charge constraints.",
             )
             return None
 
-        if endMuni.hasSupercharger:
+        if csr.hasSupercharger[endId]:
             print("Max charge at destination: ", carRange)
         else:
             print(
                 "Max charge at destination: ",
-                remChargeRow[endMuni.index],
+                remCharge,
             )
 
         endTime = time.time()
         totalTime = endTime - startTime
         print("Total algorithm time: ", totalTime)
 
-        return float(adjRow[endMuni.index])
+        return float(distance)
+
+    @staticmethod
+    def getShortestPaths(
+        testCases: list[TestCase], carRange: int, graph: Graph
+    ) -> list[Optional[float]]:
+        # Batched lookups: test cases with the same starting municipality share one row read
+        csr: CSRGraph = graph.csr
+        numMuni: int = len(csr)
+        startIds: list[int] = [
+            csr.getNodeId(testCase.startingMunicipalityCode) for testCase in testCases
+        ]
+
+        if hasBinaryMatrices(numMuni):
+            adjRows = {
+                i: readMatrixRow(DISTANCE_MATRIX, numMuni, i) for i in set(startIds)
+            }
+            remChargeRows = {
+                i: readMatrixRow(CHARGE_MATRIX, numMuni, i) for i in set(startIds)
+            }
+        else:
+            adjRows = readTextRows(
+                getMatrixPath(DISTANCE_MATRIX, numMuni, binary=False), startIds
+            )
+            remChargeRows = readTextRows(
+                getMatrixPath(CHARGE_MATRIX, numMuni, binary=False), startIds
+            )
+
+        distances: list[Optional[float]] = []
+        for testCase, startId in zip(testCases, startIds):
+            endId: int = csr.getNodeId(testCase.endingMunicipalityCode)
+            distance = float(adjRows[startId][endId])
+            remCharge = float(remChargeRows[startId][endId])
+            distances.append(
+                None if distance == float("inf") or remCharge < 0 else distance
+            )
+        return distances
 
     @staticmethod
     def getAllShortestPaths(carRange: int, graph: Graph) -> list[list[float]]:
-        raise NotImplementedError(
-            "Floyd Warshall algorithm does not support all shortest paths."
+        startTime: float = time.time_ns()
+        adjMatrix, _ = FloydWarshall.computeMatrices(
+            carRange, graph, FLOYD_WARSHALL_BLOCK_SIZE
+        )
+        print(
+            f"Took {(time.time_ns() - startTime) / 10**9} seconds to find all shortest paths."
+        )
+        return adjMatrix.tolist()
+
+    @staticmethod
+    def computeMatrices(
+        carRange: int,
+        graph: Graph,
+        blockSize: Optional[int] = None,
+        nodes: Optional[np.ndarray] = None,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        # Builds the distance matrix and the remaining charge matrix (resultMatrix{N} and
+        # resultChargeMatrix{N}) with one vectorized update of the whole matrix per pivot.
+        # With blockSize set, each pivot update is done blockSize rows at a time (tiled mode),
+        # which keeps the temporaries small enough to stay in cache on the larger graphs.
+        # With nodes (sorted node ids) set, only the graph induced by those nodes is solved.
+        csr: CSRGraph = graph.csr
+        nodes = np.arange(len(csr)) if nodes is None else np.asarray(nodes)
+        numMuni: int = len(nodes)
+        # Position of each node id in the matrices (-1 if left out)
+        position = np.full(len(csr), -1, dtype=np.int64)
+        position[nodes] = np.arange(numMuni)
+
+        # Make adjacency matrix with all infinity values (and -1 remaining charge)
+        adjMatrix: np.ndarray = np.full((numMuni, numMuni), np.inf)
+        remChargeMatrix: np.ndarray = np.full((numMuni, numMuni), -1.0)
+
+        # Set 0 for cells on the diagonal
+        np.fill_diagonal(adjMatrix, 0)
+        np.fill_diagonal(remChargeMatrix, carRange)
+
+        # Fill adjMatrix with known values
+        offsets = np.asarray(csr.offsets, dtype=np.int64)
+        sources = position[np.repeat(np.arange(len(csr)), np.diff(offsets))]
+        targets = position[np.asarray(csr.targets, dtype=np.int64)]
+        weights = np.asarray(csr.weights, dtype=np.float64)
+        inside = (sources >= 0) & (targets >= 0)
+        sources, targets, weights = sources[inside], targets[inside], weights[inside]
+        adjMatrix[sources, targets] = weights
+        remChargeMatrix[sources, targets] = carRange - weights
+
+        hasSupercharger = np.asarray(csr.hasSupercharger, dtype=bool)[nodes]
+        for _ in range(FLOYD_WARSHALL_PASSES):
+            for i in range(numMuni):
+                FloydWarshall._relaxThrough(
+                    i,
+                    bool(hasSupercharger[i]),
+                    carRange,
+                    adjMatrix,
+                    remChargeMatrix,
+                    blockSize,
+                )
+
+        return adjMatrix, remChargeMatrix
+
+    @staticmethod
+    def _relaxThrough(
+        i: int,
+        iHasSupercharger: bool,
+        carRange: int,
+        adjMatrix: np.ndarray,
+        remChargeMatrix: np.ndarray,
+        blockSize: Optional[int],
+    ):
+        # Relax every pair (j, k) through the middle node i.
+        # Row and column i cannot change while i is the middle node, so updating all pairs
+        # at once gives the same result as the j, k loops it replaces.
+
+        # Only sources that reach i with charge to spare, and destinations i reaches, can improve
+        sources = np.flatnonzero(
+            (adjMatrix[:, i] != np.inf) & (carRange >= carRange - remChargeMatrix[:, i])
+        )
+        destinations = np.flatnonzero(
+            (adjMatrix[i] != np.inf) & (carRange >= carRange - remChargeMatrix[i])
         )
+        if not len(sources) or not len(destinations):
+            return
+
+        # Gathering the destination columns only pays off when few of them are reachable
+        columns = np.arange(len(adjMatrix))
+        if len(destinations) > len(adjMatrix) // 2:
+            destinations = columns
+        distFromI = adjMatrix[i, destinations]
+        chargeLostFromI = carRange - remChargeMatrix[i, destinations]
+        allColumns: bool = destinations is columns
+
+        step = blockSize or len(sources)
+        for start in range(0, len(sources), step):
+            rows = sources[start : start + step]
+            block = rows if allColumns else (rows[:, None], destinations)
+            chargeLostToI = carRange - remChargeMatrix[rows, i]
+
+            newDist = adjMatrix[rows, i][:, None] + distFromI
+            improved = newDist < adjMatrix[block]
+
+            # If the middle node has a super charger, only cost is from i to k
+            if iHasSupercharger:
+                improved &= carRange >= chargeLostFromI
+            else:
+                improved &= carRange >= chargeLostToI[:, None] + chargeLostFromI
+
+            # Only the improved cells are written back
+            improvedRows, improvedCols = np.nonzero(improved)
+            if not len(improvedRows):
+                continue
+            totalChargeLost = (
+                chargeLostFromI[improvedCols]
+                if iHasSupercharger
+                else chargeLostToI[improvedRows] + chargeLostFromI[improvedCols]
+            )
+            cells = (rows[improvedRows], destinations[improvedCols])
+            adjMatrix[cells] = newDist[improvedRows, improvedCols]
+            remChargeMatrix[cells] = np.maximum(
+                remChargeMatrix[cells], carRange - totalChargeLost
+            )
+
+    @staticmethod
+    def repairMatrices(
+        graph: Graph, changedIds: list[int], directory: str = TESTING_DIR
+    ) -> Optional[int]:
+        # Brings the saved .npy matrices up to date after the superchargers at changedIds were added or
+        # removed, recomputing only the rows that can depend on them (see _getDependentRows). Those rows
+        # are solved together on the graph they induce, in the same pivot order, which gives the same
+        # values as recomputing the whole matrix. Returns how many rows were recomputed (None if the
+        # graph has no saved matrices).
+        numMuni: int = len(graph)
+        if not hasBinaryMatrices(numMuni, directory):
+            return None
+        distancePath = getMatrixPath(DISTANCE_MATRIX, numMuni, directory=directory)
+        chargePath = getMatrixPath(CHARGE_MATRIX, numMuni, directory=directory)
+        adjMatrix: np.ndarray = np.load(distancePath)
+        remChargeMatrix: np.ndarray = np.load(chargePath)
+        if adjMatrix.shape != (numMuni, numMuni) or not numMuni:
+            return None
+        # The diagonal of the charge matrix holds the car range the matrices were computed for
+        carRange = float(remChargeMatrix[0, 0])
+
+        rows = _getDependentRows(graph.csr, changedIds, carRange)
+        if not len(rows):
+            return 0
+        subAdjMatrix, subRemChargeMatrix = FloydWarshall.computeMatrices(
+            carRange, graph, FLOYD_WARSHALL_BLOCK_SIZE, rows
+        )
+        # Cells outside the recomputed rows' own columns keep their starting values (no edge, or an
+        # edge longer than the car range, which never takes part in a relaxation)
+        adjMatrix[rows] = np.inf
+        remChargeMatrix[rows] = -1
+        csr: CSRGraph = graph.csr
+        for row in rows:
+            for target, weight in csr.getEdges(int(row)):
+                adjMatrix[row, target] = weight
+                remChargeMatrix[row, target] = carRange - weight
+        adjMatrix[np.ix_(rows, rows)] = subAdjMatrix
+        remChargeMatrix[np.ix_(rows, rows)] = subRemChargeMatrix
+
+        saveMatrix(adjMatrix, distancePath)
+        saveMatrix(remChargeMatrix, chargePath)
+        return len(rows)
+
+    @staticmethod
+    def saveMatrices(
+        carRange: int, graph: Graph, directory: str = TESTING_DIR, binary: bool = True
+    ) -> tuple[str, str]:
+        # Computes and writes resultMatrix{N} and resultChargeMatrix{N}
+        # (as memory mappable .npy files, or as the original text files)
+        adjMatrix, remChargeMatrix = FloydWarshall.computeMatrices(
+            carRange, graph, FLOYD_WARSHALL_BLOCK_SIZE
+        )
+        filenames = (
+            getMatrixPath(DISTANCE_MATRIX, len(graph), binary, directory),
+            getMatrixPath(CHARGE_MATRIX, len(graph), binary, directory),
+        )
+        for filename, matrix in zip(filenames, (adjMatrix, remChargeMatrix)):
+            if binary:
+                saveMatrix(matrix, filename)
+                continue
+            with open(filename, "w") as file:
+                for row in matrix.tolist():
+                    file.write(" ".join(map(_formatMatrixValue, row)) + "\n")
+        return filenames
+
+
+def _getDependentRows(
+    csr: CSRGraph, changedIds: list[int], carRange: float
+) -> np.ndarray:
+    # Rows of the matrices that can depend on whether the changedIds have superchargers.
+    # Only edges no longer than the car range ever take part in a relaxation, so a row can only
+    # change if its node reaches a changed node over such edges (possibly through a middle node
+    # whose own row reached it). Solving those rows exactly also needs every node they reach.
+    numMuni = len(csr)
+    offsets = np.asarray(csr.offsets, dtype=np.int64)
+    sources = np.repeat(np.arange(numMuni), np.diff(offsets))
+    targets = np.asarray(csr.targets, dtype=np.int64)
+    usable = np.asarray(csr.weights, dtype=np.float64) <= carRange
+    sources, targets = sources[usable], targets[usable]
+
+    def closure(
+        starts: np.ndarray, fromIds: np.ndarray, toIds: np.ndarray
+    ) -> np.ndarray:
+        # Every node reachable from starts over the (fromIds[e] -> toIds[e]) edges
+        order = np.argsort(fromIds, kind="stable")
+        fromIds, toIds = fromIds[order], toIds[order]
+        firstEdge = np.searchsorted(fromIds, np.arange(numMuni))
+        lastEdge = np.searchsorted(fromIds, np.arange(numMuni), side="right")
+        reached = np.zeros(numMuni, dtype=bool)
+        reached[starts] = True
+        stack = list(starts)
+        while stack:
+            node = stack.pop()
+            for neighbor in toIds[firstEdge[node] : lastEdge[node]]:
+                if not reached[neighbor]:
+                    reached[neighbor] = True
+                    stack.append(neighbor)
+        return reached
+
+    changed = np.asarray(changedIds, dtype=np.int64)
+    dependent = closure(changed, targets, sources)
+    return np.flatnonzero(closure(np.flatnonzero(dependent), sources, targets))
+
+
+def _formatMatrixValue(value: float) -> str:
+    # Whole numbers are written without a decimal point, like the original result matrices
+    return str(int(value)) if value.is_integer() else str(value)
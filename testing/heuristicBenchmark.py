@@ -0,0 +1,92 @@
+# A* heuristic benchmark
+# Purpose: Compare how many municipalities A* expands with each heuristic in heuristics.py against
+# plain Dijkstra's (A* with h = 0, which stops at the goal like getShortestPath does) on the TEST_CASES pairs.
+# How to Run: python heuristicBenchmark.py [--range 260 ...] [--heuristic haversine landmarks ...] [--landmarks 16]
+
+import argparse
+import time
+from definitions import Graph, Route, TeslaModelRange
+from aStar import AStar
+from heuristics import HEURISTICS, Heuristic, getHeuristic
+from landmarks import (
+    DEFAULT_LANDMARKS,
+    LANDMARK_SELECTIONS,
+    getLandmarkHeuristic,
+)
+from testCases import TEST_CASES
+from testSuite import GraphCache
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Count the municipalities A* expands with each heuristic"
+    )
+    parser.add_argument(
+        "--range",
+        type=int,
+        nargs="+",
+        default=[TeslaModelRange.MODEL_Y.value],
+        help="Car ranges in miles",
+    )
+    parser.add_argument(
+        "--heuristic",
+        nargs="+",
+        choices=[name for name in HEURISTICS if name != "zero"] + ["landmarks"],
+        default=[name for name in HEURISTICS if name != "zero"] + ["landmarks"],
+    )
+    parser.add_argument("--landmarks", type=int, default=DEFAULT_LANDMARKS)
+    parser.add_argument("--selection", choices=LANDMARK_SELECTIONS, default="farthest")
+    args = parser.parse_args()
+
+    def buildHeuristic(name: str, graph: Graph) -> Heuristic:
+        if name == "landmarks":
+            return getLandmarkHeuristic(graph, args.landmarks, args.selection)
+        return getHeuristic(graph.csr, HEURISTICS[name])
+
+    graphs: GraphCache = GraphCache()
+    heuristicNames: list[str] = ["zero"] + args.heuristic
+    totals: dict[str, list[float]] = {name: [0, 0.0] for name in heuristicNames}
+
+    header = f"{'from':>7} {'to':>7} {'range':>5}" + "".join(
+        f" {'dijkstra' if name == 'zero' else name:>22}" for name in heuristicNames
+    )
+    print(header + "   (expanded / miles)")
+    for testCase in TEST_CASES:
+        if not testCase.startingMunicipalityCode or not testCase.endingMunicipalityCode:
+            continue
+        graph: Graph = graphs[testCase.graphType]
+        for carRange in args.range:
+            line = f"{testCase.startingMunicipalityCode:>7} {testCase.endingMunicipalityCode:>7} {carRange:>5}"
+            for name in heuristicNames:
+                heuristic: Heuristic = buildHeuristic(name, graph)
+                # AStar falls back to h = 0 on graphs the heuristic is not admissible on
+                fellBack = not heuristic.isConsistent
+                aStar = AStar(heuristic)
+                startTime = time.time()
+                route: Route | None = aStar._getShortestPath(
+                    testCase.startingMunicipalityCode,
+                    testCase.endingMunicipalityCode,
+                    carRange,
+                    graph,
+                )
+                totals[name][0] += aStar.expanded
+                totals[name][1] += time.time() - startTime
+                miles = f"{route.totalDistance:.1f}" if route else "none"
+                marker = "*" if fellBack else " "
+                line += f" {aStar.expanded:>12}{marker}/{miles:>8}"
+            print(line)
+
+    print()
+    baseline = max(1, totals["zero"][0])
+    for name in heuristicNames:
+        expanded, seconds = totals[name]
+        print(
+            f"{'dijkstra (h = 0)' if name == 'zero' else name:>16}: {int(expanded)} expanded "
+            f"({expanded / baseline:.2f}x dijkstra), {seconds:.3f}s"
+        )
+    print("* not admissible on this graph, ran with h = 0")
+
+
+# Driver function
+if __name__ == "__main__":
+    main()
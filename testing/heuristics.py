@@ -0,0 +1,129 @@
+# A* heuristics
+# Purpose: Pluggable estimates of the remaining distance to a goal for AStar. Each heuristic is built
+# once per graph (coordinates are converted to radians and cosines up front) and turns a goal into
+# a list of estimates for every node, so h(n) during the search is a single list lookup.
+# How to Run: Pass a heuristic class to AStar, e.g. AStar.getShortestPath(a, b, 260, graph, HaversineHeuristic)
+
+import math
+from typing import Callable, Optional
+from weakref import WeakKeyDictionary
+import numpy as np
+from definitions import CSRGraph
+
+# Same constants as initialDataProcessing.getDistanceBetweenMunicipalities (edge weights are in miles)
+EARTH_RADIUS_KM = 6371
+KM_PER_MILE = 1.609
+
+# The edge weights are the haversine distances between their ends (up to rounding), so the estimate
+# is shrunk slightly to stay a lower bound on every edge
+HAVERSINE_ADMISSIBLE_FACTOR = 0.999
+
+
+class Heuristic:
+    def __init__(self, csr: CSRGraph):
+        self.csr = csr
+        self._isConsistent: Optional[bool] = None
+
+    # Estimated distance between two nodes (an estimate is consistent if it is never more than the edge weight)
+    def distance(self, fromId: int, toId: int) -> float:
+        raise NotImplementedError("Subclasses must implement distance.")
+
+    # Estimates from every node to the goal, in node id order
+    def toGoal(self, goalId: int) -> list[float]:
+        raise NotImplementedError("Subclasses must implement toGoal.")
+
+    def forGoal(self, goalId: int) -> Callable[[int], float]:
+        return self.toGoal(goalId).__getitem__
+
+    # True if no edge is shorter than the estimate between its ends (checked once per graph).
+    # A consistent estimate never overestimates the remaining distance to any goal.
+    @property
+    def isConsistent(self) -> bool:
+        if self._isConsistent is None:
+            offsets, targets, weights = (
+                self.csr.offsets,
+                self.csr.targets,
+                self.csr.weights,
+            )
+            self._isConsistent = all(
+                self.distance(u, targets[e]) <= weights[e]
+                for u in range(len(self.csr))
+                for e in range(offsets[u], offsets[u + 1])
+            )
+        return self._isConsistent
+
+
+# h = 0 (A* then expands nodes in the same order as Dijkstra's)
+class ZeroHeuristic(Heuristic):
+    def distance(self, fromId: int, toId: int) -> float:
+        return 0.0
+
+    def toGoal(self, goalId: int) -> list[float]:
+        return [0.0] * len(self.csr)
+
+
+# The original heuristic: straight line distance in degrees of latitude/longitude (not in miles)
+class EuclideanHeuristic(Heuristic):
+    def __init__(self, csr: CSRGraph):
+        super().__init__(csr)
+        self.lats = np.asarray(csr.lats, dtype=np.float64)
+        self.lons = np.asarray(csr.lons, dtype=np.float64)
+
+    def distance(self, fromId: int, toId: int) -> float:
+        lats, lons = self.csr.lats, self.csr.lons
+        return math.sqrt(
+            abs((lats[toId] - lats[fromId]) ** 2 + (lons[toId] - lons[fromId]) ** 2)
+        )
+
+    def toGoal(self, goalId: int) -> list[float]:
+        return np.sqrt(
+            np.abs(
+                (self.lats[goalId] - self.lats) ** 2
+                + (self.lons[goalId] - self.lons) ** 2
+            )
+        ).tolist()
+
+
+# Great circle distance in miles (the same formula the edge weights were computed with)
+class HaversineHeuristic(Heuristic):
+    def __init__(self, csr: CSRGraph):
+        super().__init__(csr)
+        self.lats = np.radians(np.asarray(csr.lats, dtype=np.float64))
+        self.lons = np.radians(np.asarray(csr.lons, dtype=np.float64))
+        self.cosLats = np.cos(self.lats)
+        self.scale = HAVERSINE_ADMISSIBLE_FACTOR * 2 * EARTH_RADIUS_KM / KM_PER_MILE
+
+    def distance(self, fromId: int, toId: int) -> float:
+        a = (
+            math.sin((self.lats[toId] - self.lats[fromId]) / 2) ** 2
+            + self.cosLats[fromId]
+            * self.cosLats[toId]
+            * math.sin((self.lons[toId] - self.lons[fromId]) / 2) ** 2
+        )
+        return self.scale * math.asin(math.sqrt(min(1.0, a)))
+
+    def toGoal(self, goalId: int) -> list[float]:
+        a = (
+            np.sin((self.lats[goalId] - self.lats) / 2) ** 2
+            + self.cosLats[goalId]
+            * self.cosLats
+            * np.sin((self.lons[goalId] - self.lons) / 2) ** 2
+        )
+        return (self.scale * np.arcsin(np.sqrt(np.minimum(1.0, a)))).tolist()
+
+
+HEURISTICS: dict[str, type[Heuristic]] = {
+    "zero": ZeroHeuristic,
+    "euclidean": EuclideanHeuristic,
+    "haversine": HaversineHeuristic,
+}
+
+# Heuristics already built for a graph (dropped together with the graph)
+_heuristics: WeakKeyDictionary = WeakKeyDictionary()
+
+
+def getHeuristic(csr: CSRGraph, heuristicType: type[Heuristic]) -> Heuristic:
+    built: dict = _heuristics.setdefault(csr, {})
+    if heuristicType not in built:
+        built[heuristicType] = heuristicType(csr)
+    return built[heuristicType]
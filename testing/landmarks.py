@@ -0,0 +1,239 @@
+# Landmark (ALT) heuristic for A*
+# Purpose: Pick K landmark municipalities, store the road distances from and to each of them, and bound
+# the distance to a goal with the triangle inequality: d(v, t) >= d(v, L) - d(t, L) and d(L, t) - d(L, v).
+# The distances ignore the car range (a charge constrained route is never shorter), so one table per
+# graph serves every TeslaModelRange. Tables are saved next to the graph file and reused on later runs.
+# How to Run: python landmarks.py [graph.json ...] [--landmarks 16] [--selection farthest|supercharger]
+
+import argparse
+import glob
+from os import path
+from typing import Optional
+from weakref import WeakKeyDictionary
+import numpy as np
+from compiledGraph import hashSourceFile, loadJSONGraph
+from definitions import CSRGraph, Graph, PROJECT_ROOT
+from dijkstra import Dijkstra
+from heuristics import Heuristic
+
+DEFAULT_LANDMARKS = 16
+LANDMARK_SELECTIONS = ("farthest", "supercharger")
+LANDMARK_TABLE_VERSION = 1
+
+# Differences of Dijkstra distances can exceed an edge weight by a rounding error, so the bounds are
+# shrunk very slightly to stay consistent
+ALT_ADMISSIBLE_FACTOR = 0.999999
+
+# Landmark heuristics already loaded for a graph, keyed by (numLandmarks, selection)
+_landmarkHeuristics: WeakKeyDictionary = WeakKeyDictionary()
+
+
+class LandmarkHeuristic(Heuristic):
+    def __init__(
+        self,
+        csr: CSRGraph,
+        numLandmarks: int = DEFAULT_LANDMARKS,
+        selection: str = "farthest",
+        tables: Optional[tuple[np.ndarray, np.ndarray, np.ndarray]] = None,
+    ):
+        super().__init__(csr)
+        # landmarks (K node ids), forward[k][v] = d(landmark k, v), backward[k][v] = d(v, landmark k)
+        self.landmarks, self.forward, self.backward = (
+            tables
+            if tables is not None
+            else computeLandmarkTables(csr, numLandmarks, selection)
+        )
+
+    def _bounds(self, fromIds, toIds) -> np.ndarray:
+        # Largest landmark lower bound per (from, to) pair. Pairs a landmark knows nothing about
+        # (both distances infinite) give 0, and a from node that provably cannot reach to gives inf.
+        with np.errstate(invalid="ignore"):
+            bounds = np.maximum(
+                self.backward[:, fromIds] - self.backward[:, toIds],
+                self.forward[:, toIds] - self.forward[:, fromIds],
+            )
+        bounds = np.nan_to_num(bounds, nan=0.0, posinf=np.inf, neginf=0.0)
+        return np.maximum(bounds.max(axis=0), 0.0) * ALT_ADMISSIBLE_FACTOR
+
+    def distance(self, fromId: int, toId: int) -> float:
+        return float(self._bounds([fromId], [toId])[0])
+
+    def toGoal(self, goalId: int) -> list[float]:
+        numMuni = len(self.csr)
+        return self._bounds(np.arange(numMuni), np.full(numMuni, goalId)).tolist()
+
+    @property
+    def isConsistent(self) -> bool:
+        # Same check as Heuristic.isConsistent, on all edges at once
+        if self._isConsistent is None:
+            offsets = np.asarray(self.csr.offsets)
+            sources = np.repeat(np.arange(len(self.csr)), np.diff(offsets))
+            targets = np.asarray(self.csr.targets)
+            self._isConsistent = bool(
+                np.all(self._bounds(sources, targets) <= np.asarray(self.csr.weights))
+            )
+        return self._isConsistent
+
+
+def _distancesFrom(csr: CSRGraph, nodeId: int) -> np.ndarray:
+    # Plain road distances: Dijkstra's with an unlimited range never runs out of charge
+    return np.array(Dijkstra._search(csr, nodeId, float("inf"))[0], dtype=np.float64)
+
+
+def computeLandmarkTables(
+    csr: CSRGraph, numLandmarks: int = DEFAULT_LANDMARKS, selection: str = "farthest"
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # Farthest point selection: each new landmark is the node farthest (there and back) from the
+    # landmarks chosen so far; nodes none of them can reach come first, so every component gets one.
+    # "supercharger" draws landmarks from the supercharger municipalities first.
+    if selection not in LANDMARK_SELECTIONS:
+        raise ValueError(f"Unknown landmark selection {selection}")
+    numMuni = len(csr)
+    numLandmarks = min(numLandmarks, numMuni)
+    reverseCsr: CSRGraph = csr.reverse()
+
+    candidates = np.ones(numMuni, dtype=bool)
+    if selection == "supercharger" and any(csr.hasSupercharger):
+        candidates = np.frombuffer(bytes(csr.hasSupercharger), dtype=np.uint8) == 1
+
+    landmarks: list[int] = []
+    forward: list[np.ndarray] = []
+    backward: list[np.ndarray] = []
+    # Start from the node farthest from the first candidate
+    seed = int(np.flatnonzero(candidates)[0])
+    closest = _distancesFrom(csr, seed) + _distancesFrom(reverseCsr, seed)
+    while len(landmarks) < numLandmarks:
+        if not candidates.any():
+            candidates = np.ones(numMuni, dtype=bool)
+            candidates[landmarks] = False
+        landmark = int(np.argmax(np.where(candidates, closest, -1.0)))
+        landmarks.append(landmark)
+        candidates[landmark] = False
+        forward.append(_distancesFrom(csr, landmark))
+        backward.append(_distancesFrom(reverseCsr, landmark))
+        closest = np.minimum(
+            closest if len(landmarks) > 1 else np.inf, forward[-1] + backward[-1]
+        )
+
+    return np.array(landmarks, dtype=np.int32), np.array(forward), np.array(backward)
+
+
+def getLandmarkPath(sourcePath: str, numLandmarks: int, selection: str) -> str:
+    return f"{path.splitext(sourcePath)[0]}.landmarks{numLandmarks}-{selection}.npz"
+
+
+def _loadLandmarkTables(landmarkPath: str, sourcePath: str, numMuni: int):
+    # Returns None if the file is missing, from another version or built from a different graph file
+    if not path.exists(landmarkPath):
+        return None
+    sourceSize, sourceDigest = hashSourceFile(sourcePath)
+    with np.load(landmarkPath) as data:
+        if (
+            int(data["version"]) != LANDMARK_TABLE_VERSION
+            or int(data["sourceSize"]) != sourceSize
+            or data["sourceDigest"].tobytes() != sourceDigest
+            or data["forward"].shape[1] != numMuni
+        ):
+            return None
+        return data["landmarks"], data["forward"], data["backward"]
+
+
+def saveLandmarkTables(
+    landmarkPath: str,
+    sourcePath: str,
+    tables: tuple[np.ndarray, np.ndarray, np.ndarray],
+):
+    sourceSize, sourceDigest = hashSourceFile(sourcePath)
+    landmarks, forward, backward = tables
+    np.savez(
+        landmarkPath,
+        version=LANDMARK_TABLE_VERSION,
+        sourceSize=sourceSize,
+        sourceDigest=np.frombuffer(sourceDigest, dtype=np.uint8),
+        landmarks=landmarks,
+        forward=forward,
+        backward=backward,
+    )
+
+
+def restampLandmarkTables(
+    sourcePath: str, previousSource: tuple[int, bytes]
+) -> list[str]:
+    # After superchargers changed in sourcePath: farthest point tables only hold distances, which do
+    # not depend on the superchargers, so the ones built from the previous contents are marked as
+    # built from the current ones instead of being recomputed. Returns the files that were restamped.
+    restamped: list[str] = []
+    sourceSize, sourceDigest = hashSourceFile(sourcePath)
+    for landmarkPath in glob.glob(
+        f"{path.splitext(sourcePath)[0]}.landmarks*-farthest.npz"
+    ):
+        with np.load(landmarkPath) as data:
+            tables = dict(data)
+        if (
+            int(tables["sourceSize"]),
+            tables["sourceDigest"].tobytes(),
+        ) != previousSource:
+            continue
+        tables["sourceSize"] = sourceSize
+        tables["sourceDigest"] = np.frombuffer(sourceDigest, dtype=np.uint8)
+        np.savez(landmarkPath, **tables)
+        restamped.append(landmarkPath)
+    return restamped
+
+
+def dropSuperchargerLandmarks(csr: CSRGraph):
+    # Landmarks drawn from the superchargers have to be chosen again once those change
+    loaded: dict = _landmarkHeuristics.get(csr, {})
+    for key in [key for key in loaded if key[1] == "supercharger"]:
+        del loaded[key]
+
+
+def getLandmarkHeuristic(
+    graph: Graph, numLandmarks: int = DEFAULT_LANDMARKS, selection: str = "farthest"
+) -> LandmarkHeuristic:
+    # Loaded once per graph; the tables are read from (or written to) disk when the graph has a source file
+    csr: CSRGraph = graph.csr
+    loaded: dict = _landmarkHeuristics.setdefault(csr, {})
+    if (numLandmarks, selection) in loaded:
+        return loaded[numLandmarks, selection]
+
+    tables = None
+    if graph.sourcePath is not None:
+        landmarkPath = getLandmarkPath(graph.sourcePath, numLandmarks, selection)
+        tables = _loadLandmarkTables(landmarkPath, graph.sourcePath, len(csr))
+        if tables is None:
+            tables = computeLandmarkTables(csr, numLandmarks, selection)
+            saveLandmarkTables(landmarkPath, graph.sourcePath, tables)
+
+    heuristic = LandmarkHeuristic(csr, numLandmarks, selection, tables)
+    loaded[numLandmarks, selection] = heuristic
+    return heuristic
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Precompute landmark tables for the A* ALT heuristic"
+    )
+    parser.add_argument(
+        "graphs",
+        nargs="*",
+        help="JSON graph files (defaults to every graph in graphs/)",
+    )
+    parser.add_argument("--landmarks", type=int, default=DEFAULT_LANDMARKS)
+    parser.add_argument("--selection", choices=LANDMARK_SELECTIONS, default="farthest")
+    args = parser.parse_args()
+
+    for sourcePath in args.graphs or sorted(
+        glob.glob(path.join(PROJECT_ROOT, "graphs", "*.json"))
+    ):
+        graph: Graph = loadJSONGraph(sourcePath)
+        heuristic = getLandmarkHeuristic(graph, args.landmarks, args.selection)
+        print(
+            f"{getLandmarkPath(sourcePath, args.landmarks, args.selection)}: "
+            f"{len(heuristic.landmarks)} landmarks, consistent: {heuristic.isConsistent}"
+        )
+
+
+# Driver function
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+# Multi range Dijkstra's benchmark
+# Purpose: Time one multi range search for every TeslaModelRange against a separate search per range
+# (the charge state Dijkstra's, which finds the same routes, and the original Dijkstra's), on random
+# municipality pairs, and check that the multi range routes match the per range ones.
+# How to Run: python multiRangeBenchmark.py [--graph ALL_NODES] [--pairs 200]
+
+import argparse
+import contextlib
+import io
+import random
+import time
+from definitions import CSRGraph, Graph, GraphType, TeslaModelRange
+from chargeStateDijkstra import ChargeStateDijkstra
+from dijkstra import Dijkstra
+from multiRangeDijkstra import MultiRangeDijkstra
+from testSuite import getGraph
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare one multi range search with a search per car range"
+    )
+    parser.add_argument(
+        "--graph",
+        choices=[graphType.name for graphType in GraphType],
+        default=GraphType.ALL_NODES.name,
+    )
+    parser.add_argument("--pairs", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    graph: Graph = getGraph(GraphType[args.graph])
+    csr: CSRGraph = graph.csr
+    carRanges: list[int] = [carRange.value for carRange in TeslaModelRange]
+    random.seed(args.seed)
+    pairs: list[tuple[str, str]] = [
+        (random.choice(csr.codes), random.choice(csr.codes)) for _ in range(args.pairs)
+    ]
+
+    seconds: dict[str, float] = {
+        "multi range": 0.0,
+        "charge state": 0.0,
+        "dijkstra": 0.0,
+    }
+    mismatches = 0
+    for startingCode, endingCode in pairs:
+        # The algorithms print their own timings; keep the output readable
+        with contextlib.redirect_stdout(io.StringIO()):
+            startTime = time.time()
+            routes = MultiRangeDijkstra.getShortestPaths(
+                startingCode, endingCode, carRanges, graph
+            )
+            seconds["multi range"] += time.time() - startTime
+
+            startTime = time.time()
+            for carRange in carRanges:
+                route = ChargeStateDijkstra.getShortestPath(
+                    startingCode, endingCode, carRange, graph
+                )
+                expected = route.totalDistance if route else None
+                found = routes[carRange].totalDistance if routes[carRange] else None
+                if (expected is None) != (found is None) or (
+                    expected is not None and abs(expected - found) > 1e-6
+                ):
+                    mismatches += 1
+            seconds["charge state"] += time.time() - startTime
+
+            startTime = time.time()
+            for carRange in carRanges:
+                Dijkstra.getShortestPath(startingCode, endingCode, carRange, graph)
+            seconds["dijkstra"] += time.time() - startTime
+
+    print(
+        f"{args.graph}: {len(pairs)} pairs, ranges {', '.join(map(str, carRanges))} miles"
+    )
+    for name, total in seconds.items():
+        label = "one search" if name == "multi range" else "one search per range"
+        print(
+            f"{name:>13} ({label:>20}): {1000 * total / len(pairs):8.3f} ms per pair "
+            f"({total / seconds['multi range']:.2f}x multi range)"
+        )
+    print(f"Routes differing from the charge state Dijkstra's: {mismatches}")
+
+
+# Driver function
+if __name__ == "__main__":
+    main()
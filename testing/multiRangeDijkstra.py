@@ -0,0 +1,169 @@
+# Multi range Dijkstra's
+# Purpose: Find the shortest routes for several car ranges (e.g. every TeslaModelRange) in one search.
+# A route works for a range when none of its legs between charges is longer than the range, so each label
+# keeps the miles driven since the last charge and its range class: the smallest of the ranges that can
+# still drive it. A label is dropped if the municipality already settled a label in the same or a smaller
+# class with no more miles since its last charge (that one is at least as short, at least as charged and
+# works for at least the same ranges). The first label settled at a municipality in class k or below is the
+# shortest route for range k, the same route the charge state Dijkstra's finds for that range alone.
+# How to Run: python multiRangeBenchmark.py (compares one search with a search per range)
+
+import heapq
+import time
+from math import inf
+from typing import Optional
+from definitions import Algorithm, CSRGraph, Graph, Route, RouteStop, SPAlgorithm
+
+
+class MultiRangeDijkstra(Algorithm):
+    @staticmethod
+    def getShortestPath(
+        startingCode: str, endingCode: str, carRange: int, graph: Graph
+    ) -> Optional[Route | float]:
+        return MultiRangeDijkstra.getShortestPaths(
+            startingCode, endingCode, [carRange], graph
+        )[carRange]
+
+    @staticmethod
+    def getShortestPaths(
+        startingCode: str, endingCode: str, carRanges: list[int], graph: Graph
+    ) -> dict[int, Optional[Route]]:
+        # Shortest route (None if there is none) for each car range, from a single search
+        startTime = time.time()
+        csr: CSRGraph = graph.csr
+        search = _MultiRangeSearch(csr, carRanges)
+        labels = search.run(csr.getNodeId(startingCode), csr.getNodeId(endingCode))
+        routes: dict[int, Optional[Route]] = {}
+        for carRange, label in zip(search.carRanges, labels):
+            if label < 0:
+                print(
+                    "No route between ",
+                    startingCode,
+                    " and ",
+                    endingCode,
+                    f" exists with charge constraints (range {carRange}).",
+                )
+                routes[carRange] = None
+            else:
+                routes[carRange] = search.buildRoute(label)
+        print(f"Labels settled: {search.settledLabels}")
+        print("Total algorithm time: ", time.time() - startTime)
+        return routes
+
+    @staticmethod
+    def getAllShortestPaths(carRange: int, graph: Graph) -> list[list[float]]:
+        return MultiRangeDijkstra.getAllShortestPathsForRanges([carRange], graph)[
+            carRange
+        ]
+
+    @staticmethod
+    def getAllShortestPathsForRanges(
+        carRanges: list[int], graph: Graph
+    ) -> dict[int, list[list[float]]]:
+        # One search per source covers every range
+        startTime: float = time.time_ns()
+        csr: CSRGraph = graph.csr
+        result: dict[int, list[list[float]]] = {}
+        for start in range(len(csr)):
+            search = _MultiRangeSearch(csr, carRanges)
+            search.run(start)
+            for carRange, distances in zip(search.carRanges, search.distances):
+                result.setdefault(carRange, []).append(distances)
+        print(
+            f"Took {(time.time_ns()- startTime) / 10**9} seconds to find all shortest paths."
+        )
+        return result
+
+
+# One search from a start municipality. Labels are parallel lists indexed by label id.
+class _MultiRangeSearch:
+    def __init__(self, csr: CSRGraph, carRanges: list[int]):
+        self.csr = csr
+        # Range classes in increasing range
+        self.carRanges: list[int] = sorted(set(carRanges))
+        numMuni, numClasses = len(csr), len(self.carRanges)
+        self.node: list[int] = []
+        self.distance: list[float] = []
+        self.segment: list[float] = []
+        self.parent: list[int] = []
+        # distances[k][v] = shortest route to v for range k (distance of its first settled label in class <= k)
+        self.distances: list[list[float]] = [[inf] * numMuni for _ in range(numClasses)]
+        self.settledLabels = 0
+
+    def run(self, startingId: int, endingId: int = -1) -> list[int]:
+        # Returns, per range class, the label of the shortest route to endingId (-1 if there is none)
+        csr, carRanges = self.csr, self.carRanges
+        offsets, targets, weights = csr.offsets, csr.targets, csr.weights
+        hasSupercharger = csr.hasSupercharger
+        numClasses = len(carRanges)
+        node, distances, segments = self.node, self.distance, self.segment
+        # bestSegment[v * numClasses + k] = fewest miles since the last charge of a label settled at v
+        # in class k or below
+        bestSegment: list[float] = [inf] * (len(csr) * numClasses)
+        endLabels: list[int] = [-1] * numClasses
+
+        node.append(startingId)
+        distances.append(0)
+        segments.append(0)
+        self.parent.append(-1)
+        heap: list[tuple[float, int, float, int]] = [(0, 0, 0, 0)]
+
+        while heap:
+            distance, rangeClass, segment, label = heapq.heappop(heap)
+            current = node[label]
+            base = current * numClasses
+            if bestSegment[base + rangeClass] <= segment:
+                continue
+            for k in range(rangeClass, numClasses):
+                if segment < bestSegment[base + k]:
+                    bestSegment[base + k] = segment
+                if self.distances[k][current] == inf:
+                    self.distances[k][current] = distance
+                    if current == endingId:
+                        endLabels[k] = label
+            self.settledLabels += 1
+            if current == endingId and rangeClass == 0:
+                # Every range has its route
+                break
+
+            for e in range(offsets[current], offsets[current + 1]):
+                neighbor, weight = targets[e], weights[e]
+                newSegment = segment + weight
+                newClass = rangeClass
+                while newClass < numClasses and newSegment > carRanges[newClass]:
+                    newClass += 1
+                if newClass == numClasses:
+                    continue
+                if hasSupercharger[neighbor]:
+                    newSegment = 0
+                if bestSegment[neighbor * numClasses + newClass] <= newSegment:
+                    continue
+                node.append(neighbor)
+                distances.append(distance + weight)
+                segments.append(newSegment)
+                self.parent.append(label)
+                heapq.heappush(
+                    heap, (distance + weight, newClass, newSegment, len(node) - 1)
+                )
+
+        return endLabels
+
+    def buildRoute(self, label: int) -> Route:
+        labels: list[int] = []
+        while label >= 0:
+            labels.append(label)
+            label = self.parent[label]
+        labels.reverse()
+
+        # Per-edge distances, like Dijkstra's routes
+        route: Route = Route(stops=[], algorithm=SPAlgorithm.MULTI_RANGE_DIJKSTRA)
+        route.addStop(RouteStop(self.csr.getCode(self.node[labels[0]]), 0))
+        for previous, label in zip(labels, labels[1:]):
+            route.addStop(
+                RouteStop(
+                    self.csr.getCode(self.node[label]),
+                    self.distance[label] - self.distance[previous],
+                    bool(self.csr.hasSupercharger[self.node[label]]),
+                )
+            )
+        return route
@@ -0,0 +1,167 @@
+# Binary Floyd Warshall result matrices
+# Purpose: Store resultMatrix{N} and resultChargeMatrix{N} as float32 .npy files (a small header
+# followed by the raw row-major values) and open them with np.memmap, so a row or a single cell
+# is read in O(1) instead of scanning and parsing the whitespace separated text files.
+# The text matrices can still be read: a sidecar .idx file of row byte offsets (built once and
+# cached next to the matrix) turns a row lookup into a single seek and readline.
+# How to Run: python resultMatrices.py (converts the text matrices in archives/ to .npy files)
+
+import io
+import os
+import time
+from array import array
+from os import path
+from typing import Optional
+from zipfile import ZipFile
+import numpy as np
+from definitions import MATRIX_ARCHIVES, TESTING_DIR
+
+DISTANCE_MATRIX = "resultMatrix"
+CHARGE_MATRIX = "resultChargeMatrix"
+MATRIX_DTYPE = np.float32
+
+# Open memory maps, keyed by file path (and modification time, so rewritten files are reopened)
+_openMatrices: dict[str, tuple[float, np.memmap]] = {}
+# Loaded row offset indexes, keyed by text matrix path (with the size and mtime they were built for)
+_rowIndexes: dict[str, tuple[array, array]] = {}
+
+
+def getMatrixPath(
+    name: str, numMuni: int, binary: bool = True, directory: str = TESTING_DIR
+) -> str:
+    return path.join(directory, f"{name}{numMuni}{'.npy' if binary else '.txt'}")
+
+
+def hasBinaryMatrices(numMuni: int, directory: str = TESTING_DIR) -> bool:
+    return all(
+        path.exists(getMatrixPath(name, numMuni, directory=directory))
+        for name in (DISTANCE_MATRIX, CHARGE_MATRIX)
+    )
+
+
+def saveMatrix(matrix: np.ndarray, matrixPath: str):
+    np.save(matrixPath, np.asarray(matrix, dtype=MATRIX_DTYPE))
+
+
+def openMatrix(name: str, numMuni: int, directory: str = TESTING_DIR) -> np.memmap:
+    matrixPath = getMatrixPath(name, numMuni, directory=directory)
+    modified = path.getmtime(matrixPath)
+    if matrixPath in _openMatrices and _openMatrices[matrixPath][0] == modified:
+        return _openMatrices[matrixPath][1]
+
+    matrix = np.load(matrixPath, mmap_mode="r")
+    if matrix.shape != (numMuni, numMuni):
+        raise ValueError(
+            f"{matrixPath} has shape {matrix.shape}, expected ({numMuni}, {numMuni})"
+        )
+    _openMatrices[matrixPath] = (modified, matrix)
+    return matrix
+
+
+def readMatrixRow(
+    name: str, numMuni: int, row: int, directory: str = TESTING_DIR
+) -> np.ndarray:
+    return openMatrix(name, numMuni, directory)[row]
+
+
+def readMatrixCell(
+    name: str, numMuni: int, row: int, col: int, directory: str = TESTING_DIR
+) -> float:
+    return float(openMatrix(name, numMuni, directory)[row, col])
+
+
+def getRowIndexPath(textPath: str) -> str:
+    return textPath + ".idx"
+
+
+def buildRowIndex(textPath: str) -> array:
+    # Index layout (int64): text file size, text file mtime (ns), then the offset of every row
+    stat = os.stat(textPath)
+    offsets = array("q", [stat.st_size, stat.st_mtime_ns])
+    with open(textPath, "rb") as file:
+        offset = 0
+        for line in file:
+            if line.strip():
+                offsets.append(offset)
+            offset += len(line)
+    with open(getRowIndexPath(textPath), "wb") as file:
+        offsets.tofile(file)
+    return offsets[2:]
+
+
+def loadRowIndex(textPath: str) -> array:
+    # Rebuilds the index if it is missing or the text matrix changed since it was built
+    stat = os.stat(textPath)
+    fileVersion = array("q", [stat.st_size, stat.st_mtime_ns])
+    if textPath in _rowIndexes and _rowIndexes[textPath][0] == fileVersion:
+        return _rowIndexes[textPath][1]
+
+    indexPath = getRowIndexPath(textPath)
+    offsets = array("q")
+    if path.exists(indexPath):
+        with open(indexPath, "rb") as file:
+            offsets.frombytes(file.read())
+    rowOffsets = offsets[2:] if offsets[:2] == fileVersion else buildRowIndex(textPath)
+    _rowIndexes[textPath] = (fileVersion, rowOffsets)
+    return rowOffsets
+
+
+def readTextRow(textPath: str, row: int) -> list[float]:
+    return readTextRows(textPath, [row])[row]
+
+
+def readTextRows(textPath: str, rows: list[int]) -> dict[int, list[float]]:
+    # Every distinct row is read once (one seek + readline each), in file order
+    offsets = loadRowIndex(textPath)
+    result: dict[int, list[float]] = {}
+    with open(textPath, "rb") as file:
+        for row in sorted(set(rows)):
+            file.seek(offsets[row])
+            result[row] = list(map(float, file.readline().split()))
+    return result
+
+
+def convertTextMatrix(file: io.TextIOBase, matrixPath: str) -> np.ndarray:
+    # Parse one whitespace separated text matrix (inf and -1 included) and save it as .npy
+    matrix: np.ndarray = np.loadtxt(file, dtype=MATRIX_DTYPE, ndmin=2)
+    saveMatrix(matrix, matrixPath)
+    return matrix
+
+
+def convertArchives(
+    archives: Optional[list[str]] = None,
+    directory: str = TESTING_DIR,
+    overwrite: bool = False,
+) -> list[str]:
+    # Read every text matrix straight out of the zip archives (nothing is extracted to disk).
+    # Archives that are not in the repository (e.g. the 2475 matrices) are skipped.
+    converted: list[str] = []
+    for archive in archives or MATRIX_ARCHIVES:
+        if not path.exists(archive):
+            continue
+        with ZipFile(archive, "r") as zipFile:
+            for member in zipFile.namelist():
+                if not member.endswith(".txt"):
+                    continue
+                matrixPath = path.join(
+                    directory, path.splitext(path.basename(member))[0] + ".npy"
+                )
+                if path.exists(matrixPath) and not overwrite:
+                    continue
+                with zipFile.open(member) as file:
+                    convertTextMatrix(io.TextIOWrapper(file), matrixPath)
+                converted.append(matrixPath)
+    return converted
+
+
+def main():
+    print("Converting result matrices to .npy files...")
+    startTime = time.time()
+    for matrixPath in convertArchives(overwrite=True):
+        print(f"  {matrixPath}")
+    print(f"Done converting result matrices in {time.time() - startTime:.2f}s.")
+
+
+# Driver function
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+# Route cache
+# Purpose: Keep the routes already found so that repeated (origin, destination, range) queries skip the
+# search. Entries are keyed by the graph's content fingerprint (so a rebuilt graph never sees routes of the
+# old one), the algorithm, both municipality codes and the car range. The cache holds at most maxEntries
+# routes (least recently used go first), entries can expire after ttlSeconds, and the whole cache can be
+# saved to and loaded from disk. Cached routes are shared between lookups and must not be modified.
+# How to Run: set ROUTE_CACHE_MAX_ENTRIES in testSuite.py (the cache is saved to ROUTE_CACHE_PATH)
+
+import os
+import pickle
+import tempfile
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Optional
+from definitions import Algorithm, Graph, Route
+
+ROUTE_CACHE_VERSION = 1
+
+# (graph fingerprint, algorithm, starting code, ending code, car range)
+RouteKey = tuple[str, str, str, str, int]
+
+
+class RouteCache:
+    def __init__(
+        self,
+        maxEntries: int = 1024,
+        ttlSeconds: Optional[float] = None,
+        clock: Callable[[], float] = time.time,
+    ):
+        if maxEntries <= 0:
+            raise ValueError("maxEntries must be positive")
+        self.maxEntries = maxEntries
+        self.ttlSeconds = ttlSeconds
+        # Wall clock time by default, so expiry times still mean something after a restart
+        self.clock = clock
+        # key -> (time stored, route or None when no route exists)
+        self.entries: OrderedDict[RouteKey, tuple[float, Any]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    @staticmethod
+    def makeKey(
+        graph: Graph, algorithm: str, startingCode: str, endingCode: str, carRange: int
+    ) -> RouteKey:
+        return (graph.csr.fingerprint, algorithm, startingCode, endingCode, carRange)
+
+    def _isExpired(self, storedAt: float) -> bool:
+        return self.ttlSeconds is not None and self.clock() - storedAt > self.ttlSeconds
+
+    def get(self, key: RouteKey) -> tuple[bool, Any]:
+        # Returns (found, route); a found route can be None (no route exists)
+        entry = self.entries.get(key)
+        if entry is not None and self._isExpired(entry[0]):
+            del self.entries[key]
+            self.expirations += 1
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return False, None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return True, entry[1]
+
+    def put(self, key: RouteKey, route: Any):
+        self.entries[key] = (self.clock(), route)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxEntries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def getOrCompute(self, key: RouteKey, compute: Callable[[], Any]) -> Any:
+        found, route = self.get(key)
+        if not found:
+            route = compute()
+            self.put(key, route)
+        return route
+
+    def getShortestPath(
+        self,
+        algorithm: type[Algorithm],
+        startingCode: str,
+        endingCode: str,
+        carRange: int,
+        graph: Graph,
+    ) -> Optional[Route | float]:
+        # Same as algorithm.getShortestPath, answered from the cache when possible
+        return self.getOrCompute(
+            self.makeKey(graph, algorithm.__name__, startingCode, endingCode, carRange),
+            lambda: algorithm.getShortestPath(
+                startingCode, endingCode, carRange, graph
+            ),
+        )
+
+    def clear(self):
+        self.entries.clear()
+
+    def save(self, cachePath: str):
+        # Written to a temporary file first, so an interrupted save never leaves a broken cache
+        directory = os.path.dirname(os.path.abspath(cachePath))
+        with tempfile.NamedTemporaryFile(
+            "wb", dir=directory, suffix=".tmp", delete=False
+        ) as file:
+            pickle.dump(
+                {"version": ROUTE_CACHE_VERSION, "entries": list(self.entries.items())},
+                file,
+                protocol=pickle.HIGHEST_PROTOCOL,
+            )
+        os.replace(file.name, cachePath)
+
+    def load(self, cachePath: str) -> int:
+        # Adds the saved entries that have not expired (oldest first, so the LRU order is kept).
+        # Returns how many were loaded; a missing, unreadable or outdated file loads nothing.
+        try:
+            with open(cachePath, "rb") as file:
+                saved = pickle.load(file)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+            return 0
+        if not isinstance(saved, dict) or saved.get("version") != ROUTE_CACHE_VERSION:
+            return 0
+        loaded = 0
+        for key, (storedAt, route) in saved["entries"]:
+            if not self._isExpired(storedAt):
+                self.entries[key] = (storedAt, route)
+                self.entries.move_to_end(key)
+                loaded += 1
+        while len(self.entries) > self.maxEntries:
+            self.entries.popitem(last=False)
+        return loaded
+
+    def printStats(self):
+        lookups = self.hits + self.misses
+        print(
+            f"Route cache: {len(self)}/{self.maxEntries} entries, {self.hits} hit(s), {self.misses} miss(es)"
+            f" ({self.hits / max(1, lookups):.0%} hit rate), {self.evictions} eviction(s), {self.expirations} expired"
+        )
@@ -0,0 +1,165 @@
+# Routing service load test
+# Purpose: Send many concurrent /route requests to a running routingService.py (or start one) and report
+# throughput, latency percentiles and how many requests were coalesced or refused. The pairs are drawn from
+# a small pool so that identical requests overlap, like repeated city pairs do in real traffic.
+# How to Run: python routingLoadTest.py [--requests 1000] [--concurrency 64] [--pairs 50] [--start-server]
+
+import argparse
+import asyncio
+import json
+import random
+import subprocess
+import sys
+import time
+from os import path
+from urllib.parse import urlencode
+from definitions import GraphType, TeslaModelRange
+from routingService import DEFAULT_PORT
+from testSuite import getGraph
+
+
+async def request(
+    reader: asyncio.StreamReader, writer: asyncio.StreamWriter, target: str
+) -> tuple[int, dict]:
+    writer.write(f"GET {target} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode())
+    await writer.drain()
+    head = (await reader.readuntil(b"\r\n\r\n")).decode("latin-1").split("\r\n")
+    status = int(head[0].split(" ")[1])
+    length = next(
+        int(line.split(":", 1)[1])
+        for line in head[1:]
+        if line.lower().startswith("content-length:")
+    )
+    return status, json.loads(await reader.readexactly(length))
+
+
+async def waitForServer(host: str, port: int, timeout: float):
+    deadline = time.time() + timeout
+    while True:
+        try:
+            _, writer = await asyncio.open_connection(host, port)
+            writer.close()
+            return
+        except OSError:
+            if time.time() > deadline:
+                raise
+            await asyncio.sleep(0.2)
+
+
+async def loadTest(args) -> None:
+    csr = getGraph(GraphType[args.graph]).csr
+    random.seed(args.seed)
+    pairs = [
+        (random.choice(csr.codes), random.choice(csr.codes)) for _ in range(args.pairs)
+    ]
+    targets = []
+    for _ in range(args.requests):
+        startingCode, endingCode = random.choice(pairs)
+        query = {
+            "from": startingCode,
+            "to": endingCode,
+            "range": random.choice(list(TeslaModelRange)).name,
+            "graph": args.graph,
+            "algorithm": args.algorithm,
+        }
+        targets.append(f"/route?{urlencode(query)}")
+
+    await waitForServer(args.host, args.port, 60)
+    latencies: list[float] = []
+    statuses: dict[int, int] = {}
+    coalesced = 0
+    queue: asyncio.Queue = asyncio.Queue()
+    for target in targets:
+        queue.put_nowait(target)
+
+    async def client():
+        nonlocal coalesced
+        reader, writer = await asyncio.open_connection(args.host, args.port)
+        try:
+            while not queue.empty():
+                target = queue.get_nowait()
+                startTime = time.perf_counter()
+                status, response = await request(reader, writer, target)
+                latencies.append(time.perf_counter() - startTime)
+                statuses[status] = statuses.get(status, 0) + 1
+                coalesced += bool(response.get("coalesced"))
+        finally:
+            writer.close()
+
+    startTime = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(args.concurrency)))
+    seconds = time.perf_counter() - startTime
+
+    latencies.sort()
+    percentile = (
+        lambda p: 1000 * latencies[min(len(latencies) - 1, int(p * len(latencies)))]
+    )
+    print(
+        f"{len(latencies)} requests in {seconds:.2f}s ({len(latencies) / seconds:.0f} requests/s), "
+        f"{args.concurrency} connections"
+    )
+    print(
+        f"Latency ms: p50 {percentile(0.5):.1f}, p95 {percentile(0.95):.1f}, "
+        f"p99 {percentile(0.99):.1f}, max {1000 * latencies[-1]:.1f}"
+    )
+    print(f"Status codes: {dict(sorted(statuses.items()))}, coalesced: {coalesced}")
+
+    reader, writer = await asyncio.open_connection(args.host, args.port)
+    _, stats = await request(reader, writer, "/stats")
+    writer.close()
+    print(f"Service stats: {stats}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the routing service")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument(
+        "--pairs", type=int, default=50, help="Distinct municipality pairs"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--graph",
+        choices=[graphType.name for graphType in GraphType],
+        default=GraphType.ALL_NODES.name,
+    )
+    parser.add_argument("--algorithm", default="DIJKSTRA")
+    parser.add_argument(
+        "--start-server",
+        action="store_true",
+        help="Start routingService.py for the test (and stop it afterwards)",
+    )
+    parser.add_argument("--workers", type=int, default=None, help="With --start-server")
+    parser.add_argument(
+        "--max-pending", type=int, default=None, help="With --start-server"
+    )
+    args = parser.parse_args()
+
+    server = None
+    if args.start_server:
+        command = [
+            sys.executable,
+            path.join(path.dirname(path.abspath(__file__)), "routingService.py"),
+            "--port",
+            str(args.port),
+            "--preload",
+            args.graph,
+        ]
+        if args.workers:
+            command += ["--workers", str(args.workers)]
+        if args.max_pending:
+            command += ["--max-pending", str(args.max_pending)]
+        server = subprocess.Popen(command)
+    try:
+        asyncio.run(loadTest(args))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+
+# Driver function
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,436 @@
+# Routing service
+# Purpose: Serve routes over HTTP from a long running process instead of loading a graph and searching
+# synchronously for every request. Built on asyncio streams only (no web framework), so it runs anywhere
+# the rest of the project does:
+#   - Each pool worker process loads a graph once (testSuite.getGraph) and keeps it, with a shortest path
+#     tree cache for batches
+#   - Searches run on a process pool, so the event loop keeps accepting requests
+#   - Identical route requests that arrive while one is being searched share its result
+#   - Once MAX_PENDING searches are queued, new ones are refused with 503 (and Retry-After) instead of
+#     piling up
+# Endpoints:
+#   GET  /route?from=<code>&to=<code>&range=<miles or MODEL_Y...>[&graph=ALL_NODES][&algorithm=DIJKSTRA]
+#   POST /batch  {"graph": "ALL_NODES", "queries": [{"from": ..., "to": ..., "range": ...}, ...]}
+#   GET  /stats
+# How to Run: python routingService.py [--port 8080] [--workers 4] (load test with routingLoadTest.py)
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import signal
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Optional
+from urllib.parse import parse_qs, urlsplit
+from definitions import Graph, GraphType, Route, SPAlgorithm, TestCase, TeslaModelRange
+from aStar import AStar
+from bidirectionalDijkstra import BidirectionalDijkstra
+from chargeStateDijkstra import ChargeStateDijkstra
+from contractionHierarchy import ContractionHierarchyRouting
+from dijkstra import Dijkstra
+from multiRangeDijkstra import MultiRangeDijkstra
+from shortestPathTrees import ShortestPathTreeCache
+from superchargerOverlay import SuperchargerOverlayRouting
+from testSuite import GraphCache, getShortestPaths
+
+DEFAULT_PORT = 8080
+
+# Searches queued on the pool (not counting requests sharing one) before new ones get 503
+MAX_PENDING = 256
+
+# Largest batch accepted by /batch
+MAX_BATCH_QUERIES = 10_000
+
+# Largest request body read (about 100 bytes per batch query); larger ones get 413 without being read
+MAX_BODY_BYTES = 4 * 1024**2
+
+# Memory budget of each worker's shortest path tree cache (used by /batch)
+WORKER_TREE_CACHE_BYTES = 64 * 1024**2
+
+# Algorithms that answer a single route with the standard getShortestPath signature
+ROUTE_ALGORITHMS = {
+    SPAlgorithm.DIJKSTRA: Dijkstra,
+    SPAlgorithm.A_STAR: AStar,
+    SPAlgorithm.BIDIRECTIONAL_DIJKSTRA: BidirectionalDijkstra,
+    SPAlgorithm.CHARGE_STATE_DIJKSTRA: ChargeStateDijkstra,
+    SPAlgorithm.SUPERCHARGER_OVERLAY: SuperchargerOverlayRouting,
+    SPAlgorithm.CONTRACTION_HIERARCHY: ContractionHierarchyRouting,
+    SPAlgorithm.MULTI_RANGE_DIJKSTRA: MultiRangeDijkstra,
+}
+
+HTTP_REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    500: "Internal Server Error",
+    503: "Service Unavailable",
+}
+
+# State of each pool worker process (see _initWorker)
+_workerGraphs: Optional[GraphCache] = None
+_workerTrees: Optional[ShortestPathTreeCache] = None
+
+
+class RequestError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+# Raised in a pool worker for a municipality code the graph does not have (answered with 404)
+class UnknownMunicipalityError(Exception):
+    pass
+
+
+def _initWorker(preload: list[str]):
+    global _workerGraphs, _workerTrees
+    # Keep every graph this worker loads (the service never wants to load one twice)
+    _workerGraphs = GraphCache(maxBytes=2**62)
+    _workerTrees = ShortestPathTreeCache(WORKER_TREE_CACHE_BYTES)
+    for graphName in preload:
+        _workerGraphs[GraphType[graphName]]  # Loads and keeps it
+
+
+def _routeToJSON(route: Optional[Route | float], graph: Graph) -> dict[str, Any]:
+    if isinstance(route, float):
+        return {"distance": route, "stops": None}
+    if not route:
+        return {"distance": None, "stops": []}
+    csr = graph.csr
+    return {
+        "distance": route.totalDistance,
+        "stops": [
+            {
+                "code": stop.muniCode,
+                "name": csr.names[csr.getNodeId(stop.muniCode)],
+                "distance": stop.distance,
+                "charged": stop.charged,
+            }
+            for stop in route.stops
+        ],
+    }
+
+
+def _checkCodes(graph: Graph, *codes: str):
+    for code in codes:
+        if code not in graph.csr.codeToId:
+            raise UnknownMunicipalityError(code)
+
+
+def _solveRoute(
+    graphName: str,
+    algorithmName: str,
+    startingCode: str,
+    endingCode: str,
+    carRange: int,
+) -> dict[str, Any]:
+    # Runs in a pool worker. The algorithms print as they go; the service only returns JSON.
+    graph: Graph = _workerGraphs[GraphType[graphName]]
+    _checkCodes(graph, startingCode, endingCode)
+    startTime = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        route = ROUTE_ALGORITHMS[SPAlgorithm[algorithmName]].getShortestPath(
+            startingCode, endingCode, carRange, graph
+        )
+    result = _routeToJSON(route, graph)
+    result["seconds"] = time.perf_counter() - startTime
+    return result
+
+
+def _solveBatch(graphName: str, queries: list[tuple[str, str, int]]) -> list[dict]:
+    # Runs in a pool worker: one Dijkstra's search per origin and range (see testSuite.getShortestPaths)
+    graphType = GraphType[graphName]
+    graph: Graph = _workerGraphs[graphType]
+    _checkCodes(graph, *(code for query in queries for code in query[:2]))
+    results = getShortestPaths(
+        [
+            (TestCase(startingCode, endingCode, graphType), carRange)
+            for startingCode, endingCode, carRange in queries
+        ],
+        _workerGraphs,
+        _workerTrees,
+    )
+    return [
+        {**_routeToJSON(result.route, graph), "seconds": result.seconds}
+        for result in results
+    ]
+
+
+def parseRange(value: Optional[str]) -> int | TeslaModelRange:
+    # Miles, or the name of a TeslaModelRange
+    if value is None:
+        raise RequestError(400, "Missing range")
+    if value.upper() in TeslaModelRange.__members__:
+        return TeslaModelRange[value.upper()]
+    try:
+        miles = int(value)
+    except ValueError:
+        raise RequestError(400, f"Invalid range {value}")
+    if miles <= 0:
+        raise RequestError(400, "The range must be positive")
+    if miles in TeslaModelRange._value2member_map_:
+        return TeslaModelRange(miles)
+    return miles
+
+
+def parseGraph(value: Optional[str]) -> str:
+    name = (value or GraphType.ALL_NODES.name).upper()
+    if name not in GraphType.__members__:
+        raise RequestError(400, f"Unknown graph {value}")
+    return name
+
+
+class RoutingService:
+    def __init__(self, workers: int, maxPending: int = MAX_PENDING, preload=()):
+        self.pool = ProcessPoolExecutor(
+            max_workers=workers, initializer=_initWorker, initargs=(list(preload),)
+        )
+        self.workers = workers
+        self.maxPending = maxPending
+        # Route searches in flight, by request key (requests with the same key wait on the same future)
+        self.inFlight: dict[tuple, asyncio.Future] = {}
+        self.pending = 0
+        self.stats: dict[str, int] = {
+            "requests": 0,
+            "searches": 0,
+            "coalesced": 0,
+            "rejected": 0,
+            "errors": 0,
+        }
+
+    async def _submit(self, function, *args) -> Any:
+        if self.pending >= self.maxPending:
+            self.stats["rejected"] += 1
+            raise RequestError(503, "Too many searches queued, retry later")
+        self.pending += 1
+        self.stats["searches"] += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                self.pool, function, *args
+            )
+        except UnknownMunicipalityError as e:
+            raise RequestError(404, f"Unknown municipality code {e}")
+        finally:
+            self.pending -= 1
+
+    async def route(self, query: dict[str, list[str]]) -> dict[str, Any]:
+        def param(name: str) -> Optional[str]:
+            return query.get(name, [None])[0]
+
+        startingCode, endingCode = param("from"), param("to")
+        if not startingCode or not endingCode:
+            raise RequestError(400, "Both from and to are required")
+        carRange = parseRange(param("range"))
+        miles = carRange.value if isinstance(carRange, TeslaModelRange) else carRange
+        graphName = parseGraph(param("graph"))
+        algorithmName = (param("algorithm") or SPAlgorithm.DIJKSTRA.name).upper()
+        if algorithmName not in SPAlgorithm.__members__ or (
+            SPAlgorithm[algorithmName] not in ROUTE_ALGORITHMS
+        ):
+            raise RequestError(400, f"Unsupported algorithm {param('algorithm')}")
+
+        key = (graphName, algorithmName, startingCode, endingCode, miles)
+        future = self.inFlight.get(key)
+        coalesced = future is not None
+        if coalesced:
+            self.stats["coalesced"] += 1
+        else:
+            future = asyncio.ensure_future(
+                self._submit(
+                    _solveRoute,
+                    graphName,
+                    algorithmName,
+                    startingCode,
+                    endingCode,
+                    miles,
+                )
+            )
+            self.inFlight[key] = future
+            future.add_done_callback(lambda _: self.inFlight.pop(key, None))
+        # shield: a client hanging up must not cancel the search the others are waiting on
+        result = dict(await asyncio.shield(future))
+        result.update(
+            {
+                "from": startingCode,
+                "to": endingCode,
+                "range": miles,
+                "graph": graphName,
+                "algorithm": algorithmName,
+                "coalesced": coalesced,
+            }
+        )
+        return result
+
+    async def batch(self, body: bytes) -> dict[str, Any]:
+        try:
+            request = json.loads(body)
+            graphName = parseGraph(request.get("graph"))
+            queries = [
+                (query["from"], query["to"], parseRange(str(query["range"])))
+                for query in request["queries"]
+            ]
+        except (ValueError, KeyError, TypeError, AttributeError):
+            raise RequestError(
+                400, 'Expected {"queries": [{"from": ..., "to": ..., "range": ...}]}'
+            )
+        if len(queries) > MAX_BATCH_QUERIES:
+            raise RequestError(413, f"At most {MAX_BATCH_QUERIES} queries per batch")
+        # getShortestPaths groups by TeslaModelRange
+        if any(not isinstance(carRange, TeslaModelRange) for _, _, carRange in queries):
+            raise RequestError(
+                400, "Batch ranges must be TeslaModelRange names or values"
+            )
+        results = await self._submit(_solveBatch, graphName, queries)
+        return {"graph": graphName, "results": results}
+
+    async def handle(
+        self, method: str, target: str, body: bytes
+    ) -> tuple[int, dict[str, Any]]:
+        self.stats["requests"] += 1
+        url = urlsplit(target)
+        try:
+            if url.path == "/route":
+                if method != "GET":
+                    raise RequestError(405, "Use GET for /route")
+                return 200, await self.route(parse_qs(url.query))
+            if url.path == "/batch":
+                if method != "POST":
+                    raise RequestError(405, "Use POST for /batch")
+                return 200, await self.batch(body)
+            if url.path == "/stats":
+                return 200, {
+                    **self.stats,
+                    "pending": self.pending,
+                    "inFlight": len(self.inFlight),
+                    "workers": self.workers,
+                }
+            raise RequestError(404, f"No endpoint {url.path}")
+        except RequestError as e:
+            if e.status >= 500 and e.status != 503:
+                self.stats["errors"] += 1
+            return e.status, {"error": str(e)}
+        except Exception as e:
+            self.stats["errors"] += 1
+            return 500, {"error": f"{type(e).__name__}: {e}"}
+
+    async def serveConnection(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ):
+        # HTTP/1.1 with keep-alive, one request at a time per connection
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+                    break
+                lines = head.decode("latin-1").split("\r\n")
+                try:
+                    method, target, _ = lines[0].split(" ", 2)
+                except ValueError:
+                    break
+                headers = {
+                    name.strip().lower(): value.strip()
+                    for name, _, value in (
+                        line.partition(":") for line in lines[1:] if line
+                    )
+                }
+                # A bad or too large body is answered without being read, so the connection is closed after
+                contentLength = headers.get("content-length", "0")
+                if not (contentLength.isascii() and contentLength.isdigit()):
+                    self.stats["requests"] += 1
+                    await self._respond(
+                        writer, 400, {"error": "Bad Content-Length"}, False
+                    )
+                    break
+                if int(contentLength) > MAX_BODY_BYTES:
+                    self.stats["requests"] += 1
+                    await self._respond(
+                        writer,
+                        413,
+                        {"error": f"Request bodies are at most {MAX_BODY_BYTES} bytes"},
+                        False,
+                    )
+                    break
+                body = await reader.readexactly(int(contentLength))
+
+                status, response = await self.handle(method, target, body)
+                keepAlive = headers.get("connection", "").lower() != "close"
+                await self._respond(writer, status, response, keepAlive)
+                if not keepAlive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(
+        self,
+        writer: asyncio.StreamWriter,
+        status: int,
+        response: dict[str, Any],
+        keepAlive: bool,
+    ):
+        payload = json.dumps(response).encode()
+        writer.write(
+            (
+                f"HTTP/1.1 {status} {HTTP_REASONS.get(status, '')}\r\n"
+                "Content-Type: application/json\r\n"
+                f"Content-Length: {len(payload)}\r\n"
+                + ("Retry-After: 1\r\n" if status == 503 else "")
+                + f"Connection: {'keep-alive' if keepAlive else 'close'}\r\n\r\n"
+            ).encode()
+            + payload
+        )
+        await writer.drain()
+
+    def close(self):
+        self.pool.shutdown(cancel_futures=True)
+
+
+async def serve(
+    host: str, port: int, workers: int, maxPending: int, preload: list[str]
+):
+    service = RoutingService(workers, maxPending, preload)
+    server = await asyncio.start_server(service.serveConnection, host, port)
+    print(
+        f"Routing service on http://{host}:{port} ({workers} worker(s), "
+        f"up to {maxPending} queued searches)"
+    )
+    # Stop on Ctrl+C or SIGTERM, shutting the pool down so no worker processes are left behind
+    stop = asyncio.Event()
+    for stopSignal in (signal.SIGINT, signal.SIGTERM):
+        asyncio.get_running_loop().add_signal_handler(stopSignal, stop.set)
+    try:
+        async with server:
+            await stop.wait()
+    finally:
+        service.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve routes over HTTP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--max-pending", type=int, default=MAX_PENDING)
+    parser.add_argument(
+        "--preload",
+        nargs="*",
+        choices=[graphType.name for graphType in GraphType],
+        default=[GraphType.ALL_NODES.name],
+        help="Graphs every worker loads on startup (others load on first use)",
+    )
+    args = parser.parse_args()
+    asyncio.run(
+        serve(args.host, args.port, args.workers, args.max_pending, args.preload)
+    )
+
+
+# Driver function
+if __name__ == "__main__":
+    main()
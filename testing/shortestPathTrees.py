@@ -0,0 +1,116 @@
+# Shortest path tree cache
+# Purpose: A Dijkstra's search from one municipality finds the distance and previous municipality of every
+# municipality it reaches, so it answers every query from that origin with the same car range. The cache
+# keeps these trees as compact arrays, keyed by (graph fingerprint, origin, car range), and drops the least
+# recently used ones once their combined size passes the memory budget.
+# How to Run: set SHORTEST_PATH_TREE_CACHE_BYTES in testSuite.py, or pass a ShortestPathTreeCache to
+# Dijkstra.getShortestPath
+
+from array import array
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable
+from definitions import CSRGraph
+
+# (graph fingerprint, starting node id, car range)
+TreeKey = tuple[str, int, float]
+
+
+@dataclass
+class ShortestPathTree:
+    distances: array  # float64 per node (inf if unreachable)
+    maxCharge: array  # float64 per node
+    previous: array  # int32 per node (-1 for the root and unreachable nodes)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(
+            len(section) * section.itemsize
+            for section in (self.distances, self.maxCharge, self.previous)
+        )
+
+
+class ShortestPathTreeCache:
+    def __init__(self, maxBytes: int = 64 * 1024**2):
+        self.maxBytes = maxBytes
+        self.trees: OrderedDict[TreeKey, ShortestPathTree] = OrderedDict()
+        self.totalBytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.trees)
+
+    def get(
+        self, csr: CSRGraph, startingId: int, carRange: float
+    ) -> ShortestPathTree | None:
+        key: TreeKey = (csr.fingerprint, startingId, carRange)
+        tree = self.trees.get(key)
+        if tree is None:
+            self.misses += 1
+            return None
+        self.trees.move_to_end(key)
+        self.hits += 1
+        return tree
+
+    def put(
+        self,
+        csr: CSRGraph,
+        startingId: int,
+        carRange: float,
+        distances: list[float],
+        maxCharge: list[float],
+        previous: list[int],
+    ) -> ShortestPathTree:
+        # Stores the result of a full (not stopped early) search and returns it as a tree
+        tree = ShortestPathTree(
+            array("d", distances), array("d", maxCharge), array("i", previous)
+        )
+        if tree.nbytes > self.maxBytes:
+            # Would evict everything and still not fit
+            return tree
+        key: TreeKey = (csr.fingerprint, startingId, carRange)
+        if key in self.trees:
+            self.totalBytes -= self.trees.pop(key).nbytes
+        self.trees[key] = tree
+        self.totalBytes += tree.nbytes
+        while self.totalBytes > self.maxBytes:
+            _, evicted = self.trees.popitem(last=False)
+            self.totalBytes -= evicted.nbytes
+            self.evictions += 1
+        return tree
+
+    def rekey(
+        self,
+        oldFingerprint: str,
+        csr: CSRGraph,
+        isStillValid: Callable[[ShortestPathTree], bool],
+    ) -> list[tuple[int, float]]:
+        # After a graph changed (giving csr a new fingerprint), moves the trees of its old fingerprint
+        # that are still valid over to the new one, keeping their place in the LRU order. The others
+        # are dropped; returns their (starting node id, car range) so the caller can search them again.
+        dropped: list[tuple[int, float]] = []
+        trees: OrderedDict[TreeKey, ShortestPathTree] = OrderedDict()
+        for key, tree in self.trees.items():
+            fingerprint, startingId, carRange = key
+            if fingerprint != oldFingerprint:
+                trees[key] = tree
+            elif isStillValid(tree):
+                trees[csr.fingerprint, startingId, carRange] = tree
+            else:
+                dropped.append((startingId, carRange))
+                self.totalBytes -= tree.nbytes
+        self.trees = trees
+        return dropped
+
+    def clear(self):
+        self.trees.clear()
+        self.totalBytes = 0
+
+    def printStats(self):
+        lookups = self.hits + self.misses
+        print(
+            f"Shortest path tree cache: {len(self)} tree(s) ({self.totalBytes / 1024**2:.2f}/{self.maxBytes / 1024**2:.0f} MB), "
+            f"{self.hits} hit(s), {self.misses} miss(es) ({self.hits / max(1, lookups):.0%} hit rate), {self.evictions} eviction(s)"
+        )
@@ -0,0 +1,204 @@
+# Subgraph extraction
+# Purpose: Make smaller graphs (like random500Munis.json or 16onlyMexicoCity.json) out of a loaded graph.
+# Municipalities are selected by state, bounding box, k-hop neighborhood and/or a seeded random sample,
+# then the edges between them are copied over in one pass of the CSR arrays (a node id -> new id table
+# stands in for the membership checks), straight into a JSON graph and/or a compiled graph.
+# How to Run: python subgraphs.py --graph ALL_NODES --sample 500 --seed 456 --output ../graphs/random500Munis.json
+
+import argparse
+import hashlib
+import json
+import random
+import time
+from array import array
+from collections import deque
+from os import path
+from typing import Iterable, Optional
+from compiledGraph import (
+    COMPILED_GRAPH_EXTENSION,
+    getCompiledPath,
+    writeCompiledGraph,
+)
+from definitions import CSRGraph, Graph, GraphType
+from testSuite import getGraph
+
+
+def selectByState(csr: CSRGraph, states: Iterable[str]) -> list[int]:
+    states = set(states)
+    return [i for i in range(len(csr)) if csr.states[i] in states]
+
+
+def selectByBoundingBox(
+    csr: CSRGraph, south: float, west: float, north: float, east: float
+) -> list[int]:
+    return [
+        i
+        for i in range(len(csr))
+        if south <= csr.lats[i] <= north and west <= csr.lons[i] <= east
+    ]
+
+
+def selectNeighborhood(
+    csr: CSRGraph, centerCodes: Iterable[str], hops: int
+) -> list[int]:
+    # Every municipality at most hops edges away from one of the centers (breadth first search)
+    hopCount = array("i", [-1]) * len(csr)
+    queue: deque[int] = deque()
+    for code in centerCodes:
+        i = csr.getNodeId(code)
+        if hopCount[i] < 0:
+            hopCount[i] = 0
+            queue.append(i)
+    while queue:
+        i = queue.popleft()
+        if hopCount[i] == hops:
+            continue
+        for e in range(csr.offsets[i], csr.offsets[i + 1]):
+            target = csr.targets[e]
+            if hopCount[target] < 0:
+                hopCount[target] = hopCount[i] + 1
+                queue.append(target)
+    return [i for i in range(len(csr)) if hopCount[i] >= 0]
+
+
+def selectRandomSample(nodeIds: list[int], size: int, seed: int) -> list[int]:
+    # The same nodes, seed and size always give the same sample (kept in node id order)
+    if size > len(nodeIds):
+        raise ValueError(f"Cannot sample {size} of {len(nodeIds)} municipalities")
+    return sorted(random.Random(seed).sample(nodeIds, size))
+
+
+def extractSubgraph(csr: CSRGraph, nodeIds: Iterable[int]) -> CSRGraph:
+    # The municipalities nodeIds (in node id order) and the edges between them
+    nodeIds = sorted(set(nodeIds))
+    newIds = array("i", [-1]) * len(csr)
+    for newId, i in enumerate(nodeIds):
+        newIds[i] = newId
+
+    offsets = array("i", [0])
+    targets = array("i")
+    weights = array("d")
+    for i in nodeIds:
+        for e in range(csr.offsets[i], csr.offsets[i + 1]):
+            newTarget = newIds[csr.targets[e]]
+            if newTarget >= 0:
+                targets.append(newTarget)
+                weights.append(csr.weights[e])
+        offsets.append(len(targets))
+
+    return CSRGraph(
+        [csr.codes[i] for i in nodeIds],
+        offsets,
+        targets,
+        weights,
+        bytearray(csr.hasSupercharger[i] for i in nodeIds),
+        array("d", [csr.lats[i] for i in nodeIds]),
+        array("d", [csr.lons[i] for i in nodeIds]),
+        [csr.names[i] for i in nodeIds],
+        [csr.states[i] for i in nodeIds],
+    )
+
+
+def toJSONGraph(csr: CSRGraph) -> str:
+    # Same layout as the files in graphs/ (the Municipality fields, indented by 4)
+    codes = csr.codes
+    municipalities = {
+        code: {
+            "name": csr.names[i],
+            "state": csr.states[i],
+            "code": code,
+            "lat": csr.lats[i],
+            "lon": csr.lons[i],
+            "hasSupercharger": bool(csr.hasSupercharger[i]),
+            "edges": [
+                {
+                    "fromMuniCode": code,
+                    "toMuniCode": codes[csr.targets[e]],
+                    "distance": csr.weights[e],
+                }
+                for e in range(csr.offsets[i], csr.offsets[i + 1])
+            ],
+        }
+        for i, code in enumerate(codes)
+    }
+    return json.dumps(municipalities, indent=4)
+
+
+def saveSubgraph(csr: CSRGraph, outputPath: str, compiled: bool = False) -> Graph:
+    # Writes a .json graph (and, if compiled, its compiled graph next to it) or just a compiled .bin graph
+    if path.splitext(outputPath)[1] == COMPILED_GRAPH_EXTENSION:
+        writeCompiledGraph(csr, outputPath)
+    else:
+        data = toJSONGraph(csr).encode("utf-8")
+        with open(outputPath, "wb") as file:
+            file.write(data)
+        if compiled:
+            # Stamped with the JSON just written, so getGraph loads the compiled graph instead
+            writeCompiledGraph(
+                csr,
+                getCompiledPath(outputPath),
+                (len(data), hashlib.sha256(data).digest()),
+            )
+    graph = Graph(csr=csr)
+    graph.sourcePath = outputPath
+    return graph
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Extract a smaller graph from one of the graphs. The selections narrow each other "
+        "(states, then bounding box, then neighborhood), and the sample is taken from what is left"
+    )
+    parser.add_argument(
+        "--graph",
+        default=GraphType.ALL_NODES.name,
+        choices=[graphType.name for graphType in GraphType],
+        help="Graph to extract from",
+    )
+    parser.add_argument("--states", nargs="*", help="State names")
+    parser.add_argument(
+        "--bbox",
+        nargs=4,
+        type=float,
+        metavar=("SOUTH", "WEST", "NORTH", "EAST"),
+        help="Latitude and longitude bounds",
+    )
+    parser.add_argument("--around", nargs="*", help="Municipality codes")
+    parser.add_argument(
+        "--hops", type=int, default=1, help="Edges away from --around (default 1)"
+    )
+    parser.add_argument("--sample", type=int, help="Number of municipalities")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the sample")
+    parser.add_argument("--output", required=True, help="A .json or .bin file")
+    parser.add_argument(
+        "--compile",
+        action="store_true",
+        help="Also write the compiled graph of a .json output",
+    )
+    args = parser.parse_args()
+
+    csr: CSRGraph = getGraph(GraphType[args.graph]).csr
+    startTime = time.time()
+    selected: Optional[set[int]] = None
+    for nodeIds in (
+        args.states is not None and selectByState(csr, args.states),
+        args.bbox is not None and selectByBoundingBox(csr, *args.bbox),
+        args.around is not None and selectNeighborhood(csr, args.around, args.hops),
+    ):
+        if nodeIds is not False:
+            selected = set(nodeIds) if selected is None else selected & set(nodeIds)
+    nodeIds = sorted(selected) if selected is not None else list(range(len(csr)))
+    if args.sample is not None:
+        nodeIds = selectRandomSample(nodeIds, args.sample, args.seed)
+
+    subgraph = extractSubgraph(csr, nodeIds)
+    saveSubgraph(subgraph, args.output, args.compile)
+    print(
+        f"Saved {len(subgraph)} municipalities and {subgraph.numEdges} edges to {args.output} "
+        f"in {time.time() - startTime:.3f}s"
+    )
+
+
+# Driver function
+if __name__ == "__main__":
+    main()
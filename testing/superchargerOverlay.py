@@ -0,0 +1,207 @@
+# Supercharger overlay
+# Purpose: Every route longer than the car range has to stop at supercharger municipalities, and a car
+# always leaves one fully charged. The overlay has one node per supercharger and an edge between two of
+# them when one can reach the other on a single charge (weight = shortest such distance). A query runs a
+# single charge search from the origin to the reachable superchargers, Dijkstra's on the small overlay,
+# and reads the last leg to the destination from the supercharger's precomputed single charge tree.
+# Overlays are built once per graph and car range.
+# How to Run: set SPAlgorithm.SUPERCHARGER_OVERLAY in testSuite.py's ALGORITHMS_TO_TEST
+
+import heapq
+import time
+from math import inf
+from typing import Optional
+from weakref import WeakKeyDictionary
+import numpy as np
+from definitions import Algorithm, CSRGraph, Graph, Route, RouteStop, SPAlgorithm
+
+# Overlays already built for a graph, keyed by car range
+_overlays: WeakKeyDictionary = WeakKeyDictionary()
+
+
+class SuperchargerOverlay:
+    def __init__(self, csr: CSRGraph, carRange: int):
+        startTime = time.time()
+        self.csr = csr
+        self.carRange = carRange
+        self.chargers: list[int] = []
+        # hopDistances[c][v] = shortest distance from supercharger c to v on one charge (inf if out of
+        # range) and hopParents[c] is the matching shortest path tree
+        self.hopDistances = np.full((0, len(csr)), inf)
+        self.hopParents = np.full((0, len(csr)), -1, dtype=np.int32)
+        self.updateChargers()
+        self.buildSeconds = time.time() - startTime
+
+    def updateChargers(self) -> int:
+        # Picks up superchargers added to or removed from the graph since the overlay was built.
+        # A single charge search never recharges, so it does not depend on where the superchargers are:
+        # kept superchargers keep their trees and only the new ones are searched. Returns how many were.
+        csr: CSRGraph = self.csr
+        chargers: list[int] = [
+            muniId for muniId in range(len(csr)) if csr.hasSupercharger[muniId]
+        ]
+        kept: dict[int, int] = {
+            chargerId: c for c, chargerId in enumerate(self.chargers)
+        }
+        hopDistances = np.full((len(chargers), len(csr)), inf)
+        hopParents = np.full((len(chargers), len(csr)), -1, dtype=np.int32)
+        searched = 0
+        for c, chargerId in enumerate(chargers):
+            if chargerId in kept:
+                hopDistances[c] = self.hopDistances[kept[chargerId]]
+                hopParents[c] = self.hopParents[kept[chargerId]]
+                continue
+            distances, parents = singleChargeSearch(csr, chargerId, self.carRange)
+            hopDistances[c] = distances
+            hopParents[c] = parents
+            searched += 1
+        self.chargers, self.hopDistances, self.hopParents = (
+            chargers,
+            hopDistances,
+            hopParents,
+        )
+        # Overlay edges between superchargers (inf = not reachable on one charge)
+        self.edges: np.ndarray = self.hopDistances[:, self.chargers]
+        return searched
+
+    def __len__(self):
+        return len(self.chargers)
+
+    def search(self, entry: np.ndarray) -> tuple[np.ndarray, list[int]]:
+        # Dijkstra's over the overlay, starting at each supercharger c with distance entry[c].
+        # Returns the distance to each supercharger and the previous supercharger (-1 = entered directly).
+        distances = entry.astype(np.float64, copy=True)
+        previous: list[int] = [-1] * len(self)
+        settled = [False] * len(self)
+        heap = [(distances[c], c) for c in range(len(self)) if distances[c] < inf]
+        heapq.heapify(heap)
+        while heap:
+            distance, c = heapq.heappop(heap)
+            if settled[c]:
+                continue
+            settled[c] = True
+            for nextC in np.flatnonzero(self.edges[c] < inf):
+                newDistance = distance + self.edges[c][nextC]
+                if newDistance < distances[nextC]:
+                    distances[nextC] = newDistance
+                    previous[nextC] = c
+                    heapq.heappush(heap, (newDistance, nextC))
+        return distances, previous
+
+
+def singleChargeSearch(
+    csr: CSRGraph, startingId: int, carRange: float
+) -> tuple[list[float], list[int]]:
+    # Dijkstra's that never recharges: distances (inf beyond carRange) and previous node ids.
+    # Without recharging the charge left is carRange minus the distance, so the shortest distance is exact.
+    offsets, targets, weights = csr.offsets, csr.targets, csr.weights
+    distances: list[float] = [inf] * len(csr)
+    previous: list[int] = [-1] * len(csr)
+    distances[startingId] = 0
+    heap: list[tuple[float, int]] = [(0, startingId)]
+    while heap:
+        distance, current = heapq.heappop(heap)
+        if distance > distances[current]:
+            continue
+        for e in range(offsets[current], offsets[current + 1]):
+            neighbor = targets[e]
+            newDistance = distance + weights[e]
+            if newDistance <= carRange and newDistance < distances[neighbor]:
+                distances[neighbor] = newDistance
+                previous[neighbor] = current
+                heapq.heappush(heap, (newDistance, neighbor))
+    return distances, previous
+
+
+def getSuperchargerOverlay(graph: Graph, carRange: int) -> SuperchargerOverlay:
+    overlays: dict = _overlays.setdefault(graph.csr, {})
+    if carRange not in overlays:
+        overlays[carRange] = SuperchargerOverlay(graph.csr, carRange)
+    return overlays[carRange]
+
+
+def updateSuperchargerOverlays(csr: CSRGraph) -> int:
+    # Brings every overlay already built for this graph up to date with its superchargers.
+    # Returns how many single charge searches that took.
+    return sum(overlay.updateChargers() for overlay in _overlays.get(csr, {}).values())
+
+
+class SuperchargerOverlayRouting(Algorithm):
+    @staticmethod
+    def getShortestPath(
+        startingCode: str, endingCode: str, carRange: int, graph: Graph
+    ) -> Optional[Route | float]:
+        startTime = time.time()
+        overlay: SuperchargerOverlay = getSuperchargerOverlay(graph, carRange)
+        csr: CSRGraph = graph.csr
+        startingId: int = csr.getNodeId(startingCode)
+        endingId: int = csr.getNodeId(endingCode)
+
+        # Origin to the superchargers (and maybe the destination) on the starting charge
+        originDistances, originParents = singleChargeSearch(csr, startingId, carRange)
+        chargerDistances, previousCharger = overlay.search(
+            np.array([originDistances[chargerId] for chargerId in overlay.chargers])
+        )
+        # Last leg from whichever supercharger gets closest to the destination
+        viaCharger = chargerDistances + overlay.hopDistances[:, endingId]
+        lastCharger = int(np.argmin(viaCharger)) if len(overlay) else -1
+        if lastCharger >= 0 and viaCharger[lastCharger] >= originDistances[endingId]:
+            lastCharger = -1  # Reached directly (or not at all)
+
+        if lastCharger < 0 and originDistances[endingId] == inf:
+            print(
+                "No route between ",
+                startingCode,
+                " and ",
+                endingCode,
+                " exists with charge constraints.",
+            )
+            return None
+
+        # Stitch the legs back together from the destination
+        path: list[int] = [endingId]
+        c = lastCharger
+        while c >= 0:
+            parents = overlay.hopParents[c]
+            while path[-1] != overlay.chargers[c]:
+                path.append(int(parents[path[-1]]))
+            c = previousCharger[c]
+        while path[-1] != startingId:
+            path.append(originParents[path[-1]])
+        path.reverse()
+
+        route: Route = Route(stops=[], algorithm=SPAlgorithm.SUPERCHARGER_OVERLAY)
+        route.addStop(RouteStop(startingCode, 0))
+        for previous, muniId in zip(path, path[1:]):
+            route.addStop(
+                RouteStop(
+                    csr.getCode(muniId),
+                    min(w for t, w in csr.getEdges(previous) if t == muniId),
+                    bool(csr.hasSupercharger[muniId]),
+                )
+            )
+        print(f"Superchargers on the overlay: {len(overlay)}")
+        print("Total algorithm time: ", time.time() - startTime)
+        return route
+
+    @staticmethod
+    def getAllShortestPaths(carRange: int, graph: Graph) -> list[list[float]]:
+        # Per source: its single charge distances, or the best way through the overlay to a supercharger
+        # followed by that supercharger's single charge distances
+        startTime: float = time.time_ns()
+        overlay: SuperchargerOverlay = getSuperchargerOverlay(graph, carRange)
+        csr: CSRGraph = graph.csr
+        result: list[list[float]] = []
+        for start in range(len(csr)):
+            originDistances = np.array(singleChargeSearch(csr, start, carRange)[0])
+            if len(overlay):
+                chargerDistances, _ = overlay.search(originDistances[overlay.chargers])
+                originDistances = np.minimum(
+                    originDistances,
+                    (chargerDistances[:, None] + overlay.hopDistances).min(axis=0),
+                )
+            result.append(originDistances.tolist())
+        print(
+            f"Took {(time.time_ns()- startTime) / 10**9} seconds to find all shortest paths."
+        )
+        return result
@@ -0,0 +1,181 @@
+# Supercharger updates
+# Purpose: Add or remove superchargers without rebuilding the graph or everything computed from it. Only the
+# supercharger flags change (the edges never depend on them), so:
+#   - the graph file gets the new flags and its compiled graph is patched in place
+#   - supercharger overlays only search from the new superchargers, and farthest point landmark tables are kept
+#   - cached shortest path trees that never reached a changed municipality are kept, the others searched again
+#   - only the rows of the saved result matrices that can depend on a changed municipality are recomputed
+# Contraction hierarchies (whose core is the superchargers) are rebuilt the next time they are used.
+# How to Run: python superchargerUpdates.py --add 09002 --remove 01001 [--graphs ALL_NODES ...]
+
+import argparse
+import json
+import os
+import time
+from dataclasses import dataclass, field
+from math import inf
+from os import path
+from typing import Iterable, Optional
+from compiledGraph import getCompiledPath, hashSourceFile, patchSuperchargers
+from contractionHierarchy import dropContractionHierarchy
+from definitions import CSRGraph, Graph, GraphType, TESTING_DIR
+from dijkstra import Dijkstra
+from floydWarshall import FloydWarshall
+from landmarks import dropSuperchargerLandmarks, restampLandmarkTables
+from shortestPathTrees import ShortestPathTreeCache
+from superchargerOverlay import updateSuperchargerOverlays
+from testSuite import getGraph
+
+
+@dataclass
+class SuperchargerUpdate:
+    graph: Graph
+    changedIds: list[int]
+    oldFingerprint: str
+    compiledGraphPatched: bool = False
+    restampedLandmarks: list[str] = field(default_factory=list)
+    overlaySearches: int = 0
+    treesKept: int = 0
+    treesSearched: int = 0
+    matrixRows: Optional[int] = None  # None if the graph has no saved result matrices
+    seconds: float = 0
+
+    def __str__(self):
+        name = (
+            path.basename(self.graph.sourcePath)
+            if self.graph.sourcePath is not None
+            else "graph"
+        )
+        if not self.changedIds:
+            return f"{name}: nothing to change"
+        matrices = (
+            "no saved result matrices"
+            if self.matrixRows is None
+            else f"{self.matrixRows}/{len(self.graph)} result matrix rows recomputed"
+        )
+        return (
+            f"{name}: {len(self.changedIds)} municipality(s) changed in {self.seconds:.3f}s, "
+            f"compiled graph {'patched' if self.compiledGraphPatched else 'not patched'}, "
+            f"{len(self.restampedLandmarks)} landmark table(s) kept, {self.overlaySearches} overlay search(es), "
+            f"{self.treesKept} tree(s) kept, {self.treesSearched} searched again, {matrices}"
+        )
+
+
+def updateSuperchargers(
+    graph: Graph,
+    added: Iterable[str] = (),
+    removed: Iterable[str] = (),
+    treeCache: Optional[ShortestPathTreeCache] = None,
+    matrixDirectory: str = TESTING_DIR,
+) -> SuperchargerUpdate:
+    # Adds superchargers at the added municipality codes and removes them from the removed ones
+    # (codes that already are as asked are left alone), then repairs what was computed from the graph
+    startTime = time.time()
+    csr: CSRGraph = graph.csr
+    added, removed = set(added), set(removed)
+    if added & removed:
+        raise ValueError(
+            f"Both added and removed: {', '.join(sorted(added & removed))}"
+        )
+    unknown = (added | removed) - graph.allMunicipalityCodes
+    if unknown:
+        raise ValueError(f"Not in the graph: {', '.join(sorted(unknown))}")
+
+    hasSupercharger = bytearray(csr.hasSupercharger)
+    for codes, flag in ((added, 1), (removed, 0)):
+        for code in codes:
+            hasSupercharger[csr.getNodeId(code)] = flag
+    changedIds: list[int] = [
+        i for i in range(len(csr)) if hasSupercharger[i] != csr.hasSupercharger[i]
+    ]
+    update = SuperchargerUpdate(graph, changedIds, csr.fingerprint)
+    if not changedIds:
+        return update
+
+    graph.setSuperchargers(hasSupercharger)
+    if graph.sourcePath is not None:
+        update.compiledGraphPatched, update.restampedLandmarks = _updateGraphFiles(
+            graph.sourcePath, csr
+        )
+
+    update.overlaySearches = updateSuperchargerOverlays(csr)
+    dropContractionHierarchy(csr)
+    dropSuperchargerLandmarks(csr)
+
+    if treeCache is not None:
+        # A tree only depends on the superchargers at the municipalities its search reached
+        dropped = treeCache.rekey(
+            update.oldFingerprint,
+            csr,
+            lambda tree: all(tree.distances[i] == inf for i in changedIds),
+        )
+        update.treesKept = sum(
+            1 for key in treeCache.trees if key[0] == csr.fingerprint
+        )
+        for startingId, carRange in dropped:
+            treeCache.put(
+                csr, startingId, carRange, *Dijkstra._search(csr, startingId, carRange)
+            )
+        update.treesSearched = len(dropped)
+
+    update.matrixRows = FloydWarshall.repairMatrices(graph, changedIds, matrixDirectory)
+    update.seconds = time.time() - startTime
+    return update
+
+
+def _updateGraphFiles(sourcePath: str, csr: CSRGraph) -> tuple[bool, list[str]]:
+    # Writes the new flags to the JSON graph (same layout as the graph files), then patches its compiled
+    # graph and keeps the landmark tables that were built from the previous contents
+    previousSource = hashSourceFile(sourcePath)
+    with open(sourcePath) as file:
+        municipalities: dict[str, dict] = json.load(file)
+    for code, municipality in municipalities.items():
+        municipality["hasSupercharger"] = bool(csr.hasSupercharger[csr.getNodeId(code)])
+    with open(sourcePath + ".tmp", "w") as file:
+        json.dump(municipalities, file, indent=4)
+    os.replace(sourcePath + ".tmp", sourcePath)
+
+    compiledPath = getCompiledPath(sourcePath)
+    patched = path.exists(compiledPath) and patchSuperchargers(
+        compiledPath, bytes(csr.hasSupercharger), previousSource, sourcePath
+    )
+    return patched, restampLandmarkTables(sourcePath, previousSource)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Add or remove superchargers and update everything computed from the graphs"
+    )
+    parser.add_argument("--add", nargs="*", default=[], help="Municipality codes")
+    parser.add_argument("--remove", nargs="*", default=[], help="Municipality codes")
+    parser.add_argument(
+        "--graphs",
+        nargs="*",
+        choices=[graphType.name for graphType in GraphType],
+        help="Graphs to update (defaults to every graph holding one of the municipalities)",
+    )
+    args = parser.parse_args()
+
+    codes = set(args.add) | set(args.remove)
+    found: set[str] = set()
+    for graphType in (
+        [GraphType[name] for name in args.graphs] if args.graphs else GraphType
+    ):
+        graph: Graph = getGraph(graphType)
+        inGraph = codes & graph.allMunicipalityCodes
+        found |= inGraph
+        if inGraph or args.graphs:
+            print(
+                updateSuperchargers(
+                    graph,
+                    [code for code in args.add if code in inGraph],
+                    [code for code in args.remove if code in inGraph],
+                )
+            )
+    if codes - found:
+        print(f"Not in any of the graphs: {', '.join(sorted(codes - found))}")
+
+
+# Driver function
+if __name__ == "__main__":
+    main()
@@ -5,27 +5,41 @@
 # How to Run: Simply build TestCase objects in the TEST_CASES constant, then run the file.
 # It will output shortest paths or distances for each of the TestCases, as well as automatically load graphs.
 
-import json
+import time
+import tracemalloc
+from collections import OrderedDict
+from dataclasses import dataclass
 from os import path
-from pathlib import Path
 from typing import Optional
 from definitions import (
+    CSRGraph,
     Graph,
     GraphType,
     Route,
     SPAlgorithm,
     TestCase,
-    Municipality,
     TeslaModelRange,
-    RESULT_MATRICES,
+    GRAPH_FILES,
     PROJECT_ROOT,
-    TESTING_DIR,
-    MATRIX_ARCHIVES,
 )
-from zipfile import ZipFile
-from aStar import AStar
+from aStar import AStar, DEFAULT_HEURISTIC
+from bidirectionalDijkstra import BidirectionalDijkstra
+from chargeStateDijkstra import ChargeStateDijkstra
+from superchargerOverlay import SuperchargerOverlayRouting
+from contractionHierarchy import ContractionHierarchyRouting
+from compiledGraph import (
+    StaleGraphError,
+    getCompiledPath,
+    loadCompiledGraph,
+    loadJSONGraph,
+)
 from dijkstra import Dijkstra
+from multiRangeDijkstra import MultiRangeDijkstra
 from floydWarshall import FloydWarshall
+from landmarks import getLandmarkHeuristic
+from resultMatrices import convertArchives
+from routeCache import RouteCache
+from shortestPathTrees import ShortestPathTree, ShortestPathTreeCache
 from testCases import TEST_CASES
 
 # from createMap import createMap
@@ -35,6 +49,11 @@ ALGORITHMS_TO_TEST: list[SPAlgorithm] = [
     SPAlgorithm.DIJKSTRA,
     SPAlgorithm.A_STAR,
     SPAlgorithm.FLOYD_WARSHALL,
+    # SPAlgorithm.BIDIRECTIONAL_DIJKSTRA,
+    # SPAlgorithm.CHARGE_STATE_DIJKSTRA,
+    # SPAlgorithm.SUPERCHARGER_OVERLAY,
+    # SPAlgorithm.CONTRACTION_HIERARCHY,
+    # SPAlgorithm.MULTI_RANGE_DIJKSTRA,
 ]
 
 CARS_TO_TEST: list[TeslaModelRange] = [
@@ -45,65 +64,146 @@ CARS_TO_TEST: list[TeslaModelRange] = [
     # TeslaModelRange.MODEL_S,
 ]
 
+# Worker processes (and sources per task) for Dijkstra's all shortest paths (None = one per core)
+ALL_PAIRS_WORKERS: Optional[int] = None
+ALL_PAIRS_CHUNK_SIZE: Optional[int] = None
+
+# Landmarks for the A* ALT heuristic (0 = the default h = 0). Tables are saved next to the graph files.
+# Only single routes use them, all shortest paths are always the h = 0 distances.
+A_STAR_LANDMARKS: int = 0
+
+# Range bucket size (miles) of the charge state Dijkstra's (None = exact charges)
+CHARGE_BUCKET_SIZE: Optional[float] = None
+
+# Graphs stay cached until their combined size passes this budget (least recently used go first)
+GRAPH_CACHE_MAX_BYTES: int = 32 * 1024**2
+
+# Routes already found are kept in a cache of this many entries (0 = no cache), optionally expiring
+# after ROUTE_CACHE_TTL_SECONDS. The cache is loaded from and saved to ROUTE_CACHE_PATH on each run.
+ROUTE_CACHE_MAX_ENTRIES: int = 0
+ROUTE_CACHE_TTL_SECONDS: Optional[float] = None
+ROUTE_CACHE_PATH: str = path.join(PROJECT_ROOT, "testing", "routeCache.pkl")
+
+# Memory budget of Dijkstra's shortest path tree cache (0 = no cache)
+SHORTEST_PATH_TREE_CACHE_BYTES: int = 0
+
 
 # Function to load in initial graph (already given distances, codes, etc.)
+# Uses the compiled binary graph when one is present and up to date (see compiledGraph.py)
 def getGraph(graphType: GraphType) -> Graph:
-    parent_dir = str(path.dirname(Path(__file__).parent))
-    match graphType:
-        case GraphType.ALL_NODES:
-            with open(
-                path.join(parent_dir, "graphs/allMunicipalitiesGraph.json")
-            ) as file:
-                obj: dict[str, dict] = json.load(file)
-                return Graph(
-                    {
-                        code: Municipality(index, **value)
-                        for index, (code, value) in enumerate(obj.items())
-                    }
-                )
-        case GraphType.EIGHT_NODES:
-            with open(
-                path.join(parent_dir, "graphs/eightMunicipalitiesGraph.json")
-            ) as file:
-                obj: dict[str, dict] = json.load(file)
-                return Graph(
-                    {
-                        code: Municipality(index, **value)
-                        for index, (code, value) in enumerate(obj.items())
-                    }
-                )
-        case GraphType.FIVE_HUNDRED_NODES:
-            with open(path.join(parent_dir, "graphs/random500Munis.json")) as file:
-                obj: dict[str, dict] = json.load(file)
-                return Graph(
-                    {
-                        code: Municipality(index, **value)
-                        for index, (code, value) in enumerate(obj.items())
-                    }
-                )
-        case GraphType.ONE_THOUSAND_NODES:
-            with open(path.join(parent_dir, "graphs/random1000Munis.json")) as file:
-                obj: dict[str, dict] = json.load(file)
-                return Graph(
-                    {
-                        code: Municipality(index, **value)
-                        for index, (code, value) in enumerate(obj.items())
-                    }
-                )
-        case GraphType.ONE_HUNDRED_NODES:
-            with open(
-                path.join(parent_dir, "graphs/100MunicipalitiesGraph.json")
-            ) as file:
-                obj: dict[str, dict] = json.load(file)
-                return Graph(
-                    {
-                        code: Municipality(index, **value)
-                        for index, (code, value) in enumerate(obj.items())
-                    }
-                )
-        case _:
-            print("The provided graph type in TestCase does not exist, please retry.")
-            raise ValueError("Invalid GraphType in TestCase")
+    if graphType not in GRAPH_FILES:
+        print("The provided graph type in TestCase does not exist, please retry.")
+        raise ValueError("Invalid GraphType in TestCase")
+
+    sourcePath: str = GRAPH_FILES[graphType]
+    compiledPath: str = getCompiledPath(sourcePath)
+    if path.exists(compiledPath):
+        try:
+            return loadCompiledGraph(compiledPath, sourcePath)
+        except StaleGraphError as e:
+            print(f"{e}, loading the JSON graph instead.")
+    return loadJSONGraph(sourcePath)
+
+
+# Load time and memory of one graph load (heap memory as measured by tracemalloc,
+# plus the memory mapped arrays of compiled graphs, which tracemalloc cannot see)
+@dataclass
+class GraphLoadStats:
+    graphType: GraphType
+    loadSeconds: float
+    peakBytes: int
+    retainedBytes: int
+    mappedBytes: int = 0
+
+    @property
+    def totalBytes(self) -> int:
+        return self.retainedBytes + self.mappedBytes
+
+    def __str__(self):
+        return (
+            f"{self.graphType.name}: loaded in {self.loadSeconds:.3f}s, "
+            f"peak {self.peakBytes / 1024**2:.2f} MB, retained {self.retainedBytes / 1024**2:.2f} MB, "
+            f"mapped {self.mappedBytes / 1024**2:.2f} MB"
+        )
+
+
+# Lazily loads each graph the first time it is asked for, then keeps it cached.
+# Least recently used graphs are evicted once the cached graphs exceed maxBytes.
+class GraphCache:
+    def __init__(self, maxBytes: int = GRAPH_CACHE_MAX_BYTES):
+        self.maxBytes = maxBytes
+        self.graphs: OrderedDict[GraphType, Graph] = OrderedDict()
+        self.sizes: dict[GraphType, int] = {}
+        self.loadStats: list[GraphLoadStats] = []
+        self.evictions: int = 0
+
+    def __getitem__(self, graphType: GraphType) -> Graph:
+        if graphType in self.graphs:
+            self.graphs.move_to_end(graphType)
+            return self.graphs[graphType]
+
+        graph, stats = self._load(graphType)
+        self.loadStats.append(stats)
+        self.graphs[graphType] = graph
+        self.sizes[graphType] = stats.totalBytes
+        self._evict()
+        return graph
+
+    def __contains__(self, graphType: GraphType) -> bool:
+        return graphType in self.graphs
+
+    @property
+    def totalBytes(self) -> int:
+        return sum(self.sizes.values())
+
+    def _load(self, graphType: GraphType) -> tuple[Graph, GraphLoadStats]:
+        # Only trace allocations while loading (tracing slows everything else down)
+        alreadyTracing = tracemalloc.is_tracing()
+        if not alreadyTracing:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        startTime = time.perf_counter()
+
+        graph = getGraph(graphType)
+        # The search algorithms need the CSR arrays, so they count towards the load
+        csr: CSRGraph = graph.csr
+
+        loadSeconds = time.perf_counter() - startTime
+        current, peak = tracemalloc.get_traced_memory()
+        if not alreadyTracing:
+            tracemalloc.stop()
+
+        mappedBytes: int = sum(
+            array.nbytes
+            for array in (
+                csr.offsets,
+                csr.targets,
+                csr.weights,
+                csr.hasSupercharger,
+                csr.lats,
+                csr.lons,
+            )
+            if isinstance(array, memoryview)
+        )
+        return graph, GraphLoadStats(
+            graphType, loadSeconds, peak - before, max(current - before, 0), mappedBytes
+        )
+
+    def _evict(self):
+        # Never evict the most recently used graph, even if it alone is over budget
+        while self.totalBytes > self.maxBytes and len(self.graphs) > 1:
+            graphType, _ = self.graphs.popitem(last=False)
+            del self.sizes[graphType]
+            self.evictions += 1
+
+    def printLoadStats(self):
+        print("Graph load statistics:")
+        for stats in self.loadStats:
+            print(f"  {stats}")
+        print(
+            f"  {len(self.graphs)} graph(s) cached ({self.totalBytes / 1024**2:.2f} MB), {self.evictions} eviction(s)"
+        )
 
 
 def noRouteErrHandler(
@@ -122,7 +222,11 @@ def noRouteErrHandler(
 
 # Function to get the shortest path from a given test case
 def getShortestPath(
-    testCase: TestCase, algorithm: SPAlgorithm, carRange: TeslaModelRange, graph: Graph
+    testCase: TestCase,
+    algorithm: SPAlgorithm,
+    carRange: TeslaModelRange,
+    graph: Graph,
+    treeCache: Optional[ShortestPathTreeCache] = None,
 ) -> Optional[Route | float]:
     # Call the function from the respective file
     match algorithm:
@@ -133,6 +237,7 @@ def getShortestPath(
                     testCase.endingMunicipalityCode,
                     carRange.value,
                     graph,
+                    treeCache,
                 ),
                 SPAlgorithm.DIJKSTRA,
             )
@@ -144,10 +249,66 @@ def getShortestPath(
                         testCase.endingMunicipalityCode,
                         carRange.value,
                         graph,
+                        (
+                            getLandmarkHeuristic(graph, A_STAR_LANDMARKS)
+                            if A_STAR_LANDMARKS
+                            else DEFAULT_HEURISTIC
+                        ),
                     )
                 ),
                 SPAlgorithm.A_STAR,
             )
+        case SPAlgorithm.BIDIRECTIONAL_DIJKSTRA:
+            return noRouteErrHandler(
+                BidirectionalDijkstra.getShortestPath(
+                    testCase.startingMunicipalityCode,
+                    testCase.endingMunicipalityCode,
+                    carRange.value,
+                    graph,
+                ),
+                SPAlgorithm.BIDIRECTIONAL_DIJKSTRA,
+            )
+        case SPAlgorithm.CHARGE_STATE_DIJKSTRA:
+            return noRouteErrHandler(
+                ChargeStateDijkstra.getShortestPath(
+                    testCase.startingMunicipalityCode,
+                    testCase.endingMunicipalityCode,
+                    carRange.value,
+                    graph,
+                    CHARGE_BUCKET_SIZE,
+                ),
+                SPAlgorithm.CHARGE_STATE_DIJKSTRA,
+            )
+        case SPAlgorithm.SUPERCHARGER_OVERLAY:
+            return noRouteErrHandler(
+                SuperchargerOverlayRouting.getShortestPath(
+                    testCase.startingMunicipalityCode,
+                    testCase.endingMunicipalityCode,
+                    carRange.value,
+                    graph,
+                ),
+                SPAlgorithm.SUPERCHARGER_OVERLAY,
+            )
+        case SPAlgorithm.CONTRACTION_HIERARCHY:
+            return noRouteErrHandler(
+                ContractionHierarchyRouting.getShortestPath(
+                    testCase.startingMunicipalityCode,
+                    testCase.endingMunicipalityCode,
+                    carRange.value,
+                    graph,
+                ),
+                SPAlgorithm.CONTRACTION_HIERARCHY,
+            )
+        case SPAlgorithm.MULTI_RANGE_DIJKSTRA:
+            return noRouteErrHandler(
+                MultiRangeDijkstra.getShortestPath(
+                    testCase.startingMunicipalityCode,
+                    testCase.endingMunicipalityCode,
+                    carRange.value,
+                    graph,
+                ),
+                SPAlgorithm.MULTI_RANGE_DIJKSTRA,
+            )
         case SPAlgorithm.FLOYD_WARSHALL:
             return noRouteErrHandler(
                 FloydWarshall.getShortestPath(
@@ -163,47 +324,204 @@ def getShortestPath(
             raise ValueError("Invalid algorithm type")
 
 
+# Result of one query in a getShortestPaths batch
+@dataclass
+class BatchResult:
+    testCase: TestCase
+    carRange: TeslaModelRange
+    route: Optional[Route]
+    # This query's share of its group's search plus reading off its route
+    seconds: float
+    # Queries that shared the search (same graph, starting municipality and car range)
+    groupSize: int
+
+
+# Function to answer many (test case, car range) queries with Dijkstra's, one search per
+# graph, starting municipality and car range; every destination in the group is read off that search.
+# Results come back in input order. With a treeCache, groups reuse (and keep) full shortest path trees.
+def getShortestPaths(
+    queries: list[tuple[TestCase, TeslaModelRange]],
+    graphs: Optional[GraphCache] = None,
+    treeCache: Optional[ShortestPathTreeCache] = None,
+) -> list[BatchResult]:
+    graphs = graphs if graphs is not None else GraphCache()
+    groups: dict[tuple[GraphType, str, TeslaModelRange], list[int]] = {}
+    for i, (testCase, carRange) in enumerate(queries):
+        groups.setdefault(
+            (testCase.graphType, testCase.startingMunicipalityCode, carRange), []
+        ).append(i)
+
+    results: list[Optional[BatchResult]] = [None] * len(queries)
+    for (graphType, startingCode, carRange), indexes in groups.items():
+        graph: Graph = graphs[graphType]
+        csr: CSRGraph = graph.csr
+        startingId: int = csr.getNodeId(startingCode)
+        endingIds: list[int] = [
+            csr.getNodeId(queries[i][0].endingMunicipalityCode) for i in indexes
+        ]
+
+        startTime = time.time()
+        tree: Optional[ShortestPathTree] = (
+            treeCache.get(csr, startingId, carRange.value) if treeCache else None
+        )
+        if tree is not None:
+            distances, previousShortestDistMuni = tree.distances, tree.previous
+        elif treeCache is not None:
+            tree = treeCache.put(
+                csr,
+                startingId,
+                carRange.value,
+                *Dijkstra._search(csr, startingId, carRange.value),
+            )
+            distances, previousShortestDistMuni = tree.distances, tree.previous
+        else:
+            # A group with a single destination can stop at it, like Dijkstra.getShortestPath
+            distances, _, previousShortestDistMuni = Dijkstra._search(
+                csr,
+                startingId,
+                carRange.value,
+                endingIds[0] if len(set(endingIds)) == 1 else None,
+            )
+        searchShare = (time.time() - startTime) / len(indexes)
+
+        for i, endingId in zip(indexes, endingIds):
+            startTime = time.time()
+            route: Optional[Route] = (
+                Dijkstra._buildRoute(
+                    csr, startingId, endingId, distances, previousShortestDistMuni
+                )
+                if distances[endingId] != float("inf")
+                else None
+            )
+            results[i] = BatchResult(
+                queries[i][0],
+                carRange,
+                route,
+                searchShare + time.time() - startTime,
+                len(indexes),
+            )
+    return results
+
+
 # Function to get all shortest paths from a given test case
 def getAllShortestPaths(
     algorithm: SPAlgorithm, carRange: TeslaModelRange, graph: Graph
 ) -> list[list[float]]:
     match algorithm:
         case SPAlgorithm.DIJKSTRA:
-            return Dijkstra.getAllShortestPaths(carRange.value, graph)
+            return Dijkstra.getAllShortestPaths(
+                carRange.value, graph, ALL_PAIRS_WORKERS, ALL_PAIRS_CHUNK_SIZE
+            )
         case SPAlgorithm.A_STAR:
             return AStar.getAllShortestPaths(carRange.value, graph)
+        case SPAlgorithm.BIDIRECTIONAL_DIJKSTRA:
+            return BidirectionalDijkstra.getAllShortestPaths(carRange.value, graph)
+        case SPAlgorithm.CHARGE_STATE_DIJKSTRA:
+            return ChargeStateDijkstra.getAllShortestPaths(
+                carRange.value, graph, CHARGE_BUCKET_SIZE
+            )
+        case SPAlgorithm.SUPERCHARGER_OVERLAY:
+            return SuperchargerOverlayRouting.getAllShortestPaths(carRange.value, graph)
+        case SPAlgorithm.CONTRACTION_HIERARCHY:
+            return ContractionHierarchyRouting.getAllShortestPaths(
+                carRange.value, graph
+            )
+        case SPAlgorithm.MULTI_RANGE_DIJKSTRA:
+            return MultiRangeDijkstra.getAllShortestPaths(carRange.value, graph)
         case SPAlgorithm.FLOYD_WARSHALL:
-            print("Floyd-Warshall already returns all shortest paths, no need to run.")
-            return []
-            # return FloydWarshall.getAllShortestPaths(carRange.value, graph)
+            return FloydWarshall.getAllShortestPaths(carRange.value, graph)
         case _:
             print("Bad algorithm type in test case, please retry.")
             raise ValueError("Invalid algorithm type")
 
 
+# Cache key name of an algorithm, including the settings that change its routes
+def getAlgorithmCacheName(algorithm: SPAlgorithm) -> str:
+    match algorithm:
+        case SPAlgorithm.A_STAR:
+            return f"{algorithm.name}:landmarks={A_STAR_LANDMARKS}:default={DEFAULT_HEURISTIC.__name__}"
+        case SPAlgorithm.CHARGE_STATE_DIJKSTRA:
+            return f"{algorithm.name}:bucket={CHARGE_BUCKET_SIZE}"
+        case _:
+            return algorithm.name
+
+
+# Same as getShortestPath, answered from the route cache when it already has the route
+def getCachedShortestPath(
+    routeCache: Optional[RouteCache],
+    testCase: TestCase,
+    algorithm: SPAlgorithm,
+    carRange: TeslaModelRange,
+    graph: Graph,
+    treeCache: Optional[ShortestPathTreeCache] = None,
+) -> Optional[Route | float]:
+    if routeCache is None:
+        return getShortestPath(testCase, algorithm, carRange, graph, treeCache)
+    key = RouteCache.makeKey(
+        graph,
+        getAlgorithmCacheName(algorithm),
+        testCase.startingMunicipalityCode,
+        testCase.endingMunicipalityCode,
+        carRange.value,
+    )
+    found, route = routeCache.get(key)
+    if found:
+        print("Route found in the route cache.")
+        return noRouteErrHandler(route, algorithm)
+    route = getShortestPath(testCase, algorithm, carRange, graph, treeCache)
+    routeCache.put(key, route)
+    return route
+
+
+# Results for every car in CARS_TO_TEST from one multi range search (routes, or all shortest paths)
+def getMultiRangeResults(testCase: TestCase, graph: Graph) -> dict[int, Route | list]:
+    carRanges: list[int] = [carRange.value for carRange in CARS_TO_TEST]
+    if not testCase.startingMunicipalityCode and not testCase.endingMunicipalityCode:
+        return MultiRangeDijkstra.getAllShortestPathsForRanges(carRanges, graph)
+    return MultiRangeDijkstra.getShortestPaths(
+        testCase.startingMunicipalityCode,
+        testCase.endingMunicipalityCode,
+        carRanges,
+        graph,
+    )
+
+
 # Main function to run different TestCase objects
 def main():
-    if any(map(lambda x: not path.exists(x), RESULT_MATRICES)):
-        print("Extracting result matrices...")
-        for z in MATRIX_ARCHIVES:
-            with ZipFile(z, "r") as m:
-                m.extractall(TESTING_DIR)
-        print("Done extracting result matrices.")
+    # Floyd Warshall reads memory mapped .npy matrices, converted once straight from the archives
+    convertedMatrices: list[str] = convertArchives()
+    if convertedMatrices:
+        print(f"Converted {len(convertedMatrices)} result matrices to .npy files.")
 
     if not TEST_CASES:
         return
 
-    # Load in all graphs
-    print("Loading all graphs...")
-    graphs: dict[GraphType:Graph] = {}
-    for graphType in GraphType:
-        graphs[graphType] = getGraph(graphType)
-    print("Done loading graphs.")
+    # Graphs are loaded the first time a test case needs them
+    graphs: GraphCache = GraphCache()
+
+    routeCache: Optional[RouteCache] = None
+    if ROUTE_CACHE_MAX_ENTRIES > 0:
+        routeCache = RouteCache(ROUTE_CACHE_MAX_ENTRIES, ROUTE_CACHE_TTL_SECONDS)
+        print(f"Loaded {routeCache.load(ROUTE_CACHE_PATH)} cached route(s).")
+
+    # Dijkstra's keeps the shortest path tree of each origin, so later cases from it only read a path
+    treeCache: Optional[ShortestPathTreeCache] = (
+        ShortestPathTreeCache(SHORTEST_PATH_TREE_CACHE_BYTES)
+        if SHORTEST_PATH_TREE_CACHE_BYTES > 0
+        else None
+    )
 
     # Run all test cases on each algorithm and car range
     print("Beginning running test cases...\n")
     for i, testCase in enumerate(TEST_CASES):
+        graph: Graph = graphs[testCase.graphType]
         for j, algorithm in enumerate(ALGORITHMS_TO_TEST):
+            # The multi range search covers every car at once
+            multiRangeResults: Optional[dict] = (
+                getMultiRangeResults(testCase, graph)
+                if algorithm == SPAlgorithm.MULTI_RANGE_DIJKSTRA
+                else None
+            )
             for carRange in CARS_TO_TEST:
                 if (
                     not testCase.startingMunicipalityCode
@@ -213,12 +531,14 @@ def main():
                     print(
                         f"\033[93mRunning all shortest paths using {algorithm.value} on {testCase.graphType.value} with max range {carRange.value}...\033[00m"
                     )
-                    allShortestPaths: list[list[float]] = getAllShortestPaths(
-                        algorithm, carRange, graphs[testCase.graphType]
+                    allShortestPaths: list[list[float]] = (
+                        multiRangeResults[carRange.value]
+                        if multiRangeResults is not None
+                        else getAllShortestPaths(algorithm, carRange, graph)
                     )
                     # Write to file
                     with open(
-                        f"allShortestPaths_{algorithm.name}_{len(graphs[testCase.graphType])}.txt",
+                        f"allShortestPaths_{algorithm.name}_{len(graph)}.txt",
                         "w",
                     ) as file:
                         for row in allShortestPaths:
@@ -228,13 +548,17 @@ def main():
                         f"\033[93mRunning test case {i+1} from {testCase.startingMunicipalityCode} to {testCase.endingMunicipalityCode} using {algorithm.value} on {testCase.graphType.value} with max range {carRange.value}...\033[00m"
                     )
                     print(
-                        f"From: {graphs[testCase.graphType][testCase.startingMunicipalityCode].name}"
+                        f"From: {graph.getMunicipalityName(testCase.startingMunicipalityCode)}"
                     )
                     print(
-                        f"To: {graphs[testCase.graphType][testCase.endingMunicipalityCode].name}"
+                        f"To: {graph.getMunicipalityName(testCase.endingMunicipalityCode)}"
                     )
-                    route: Optional[Route | float] = getShortestPath(
-                        testCase, algorithm, carRange, graphs[testCase.graphType]
+                    route: Optional[Route | float] = (
+                        noRouteErrHandler(multiRangeResults[carRange.value], algorithm)
+                        if multiRangeResults is not None
+                        else getCachedShortestPath(
+                            routeCache, testCase, algorithm, carRange, graph, treeCache
+                        )
                     )
                     if isinstance(route, Route) and route:
                         # Print out and save a map of the route (only once per test case)
@@ -244,7 +568,7 @@ def main():
                         if j == 0:
                             print("Creating map...")
                             createMap(
-                                graphs[testCase.graphType],
+                                graph,
                                 route,
                                 f"{testCase.startingMunicipalityCode}to{testCase.endingMunicipalityCode}",
                             )
@@ -256,6 +580,12 @@ def main():
                             f"\033[92mShortest path(s): {route:.2f} total miles\033[00m\n"
                         )
     print("All test cases have been run.")
+    graphs.printLoadStats()
+    if treeCache is not None:
+        treeCache.printStats()
+    if routeCache is not None:
+        routeCache.printStats()
+        routeCache.save(ROUTE_CACHE_PATH)
 
 
 # Driver function